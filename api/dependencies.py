@@ -0,0 +1,286 @@
+import asyncio
+import os
+import threading
+import time
+
+import httpx
+from fastapi import HTTPException, Request
+
+from api.dish_index import DishNameIndex
+from api.intent_classifier import LocalIntentClassifier
+from api.nutrition_table import NutritionTable
+from api.langchain_utils import get_conversational_rag_chain
+from api.prompt_builder import get_token_counter
+from api.scan_prefetch import ScanPrefetcher
+from utils.concurrency import run_blocking
+from utils.embed_cache import save_query_cache
+from utils.observability import get_logger
+from config.llm import load_chat_llm
+from config.rerank import load_batched_reranker
+from utils.answer_cache import SemanticAnswerCache
+# config.vector_store (llama_index.core, ~1s import) chỉ được import trong thread warm-up
+
+logger = get_logger("resources")
+
+# =========================================================
+# 👇 TÀI NGUYÊN DÙNG CHUNG TOÀN APP (APP-SCOPED RESOURCES)
+# =========================================================
+# Khởi tạo 1 lần trong startup của main.py, handler lấy qua Depends(get_resources).
+# Tránh tạo ChatGroq + HTTP client + TLS handshake mới cho mỗi request.
+
+def _build_http_clients():
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+        max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", "10")),
+        keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60")),
+    )
+    timeout = httpx.Timeout(float(os.getenv("LLM_TIMEOUT", "60")), connect=10.0)
+    return (
+        httpx.Client(limits=limits, timeout=timeout),
+        httpx.AsyncClient(limits=limits, timeout=timeout),
+    )
+
+
+class ComponentStatus:
+    """Trạng thái nạp 1 thành phần lúc khởi động (hiển thị ở /ready)."""
+    __slots__ = ("state", "required", "started", "duration_ms", "error")
+
+    def __init__(self, required: bool):
+        self.state = "pending"      # pending / loading / ready / failed
+        self.required = required
+        self.started = None
+        self.duration_ms = None
+        self.error = None
+
+    def start(self):
+        self.state, self.started = "loading", time.perf_counter()
+
+    def finish(self, error: Exception = None):
+        self.duration_ms = (time.perf_counter() - self.started) * 1000
+        self.state = "failed" if error is not None else "ready"
+        self.error = str(error) if error is not None else None
+
+    def as_dict(self) -> dict:
+        return {"state": self.state, "required": self.required, "error": self.error,
+                "duration_ms": round(self.duration_ms, 1) if self.duration_ms is not None else None}
+
+
+class AppResources:
+    """Chứa chat model, HTTP pool, index và reranker cho vòng đời của app."""
+
+    def __init__(self):
+        # Khởi tạo nhẹ: model / index nạp sau (start_warm_up chạy nền, hoặc load_models cho script)
+        self.http_client, self.http_async_client = _build_http_clients()
+        self.llm = None
+        self.classifier_llm = None
+        # /ready: llm + index bắt buộc; reranker lỗi thì chạy không rerank; embed_model / index_storage là
+        # 2 bước chạy song song của index
+        self.components = {
+            name: ComponentStatus(required=name in ("llm", "index"))
+            for name in ("llm", "embed_model", "index_storage", "index", "reranker")
+        }
+        self._created = time.perf_counter()
+        self._warm_up_ms = None
+        self._index_task = None
+
+        self.index = None
+        self.index_version = None
+        self.embed_model = None
+        self.reranker = None
+        # Cache câu trả lời theo ngữ nghĩa (bị xóa khi index_version đổi)
+        self.answer_cache = SemanticAnswerCache(
+            max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "2000")),
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+            ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600))),
+        )
+        # Chỉ có luật regex cho tới khi index nạp xong (thêm tên món + centroid embedding)
+        self.intent_classifier = LocalIntentClassifier()
+        # Tra tên món trực tiếp (bỏ qua embedding + vector search khi câu hỏi nêu đúng tên món)
+        self.dish_index = None
+        # Bảng calories / protein / fat dạng cột -> trả lời câu hỏi số không cần LLM
+        self.nutrition_table = None
+        # BM25 (config/sparse_index.py) gộp với dense search bằng RRF
+        self.sparse_index = None
+        # Context chuẩn bị sẵn sau mỗi lần /scan (api/scan_prefetch.py)
+        self.scan_prefetcher = ScanPrefetcher(
+            max_entries=int(os.getenv("SESSION_MAX_ENTRIES", "10000")),
+            ttl_seconds=float(os.getenv("SCAN_TTL", "600")),
+        )
+        self._index_lock = threading.Lock()
+        # Chain RAG dựng 1 lần cho mỗi cấu hình (llm, index, reranker, classifier)
+        self._rag_chain = None
+        self._rag_chain_key = None
+
+    def load_llms(self):
+        """Chat model trả lời + model phân loại ý định (có thể cấu hình khác nhau)."""
+        llm = load_chat_llm(http_client=self.http_client, http_async_client=self.http_async_client)
+        classifier_model = os.getenv("CLASSIFIER_MODEL")
+        self.classifier_llm = llm if not classifier_model else load_chat_llm(
+            model=classifier_model,
+            http_client=self.http_client,
+            http_async_client=self.http_async_client,
+        )
+        # Tokenizer đếm token prompt (api/prompt_builder.py) nạp ở đây, không để request đầu tiên chịu
+        get_token_counter()
+        self.llm = llm
+
+    def _load_reranker(self):
+        self.reranker = load_batched_reranker()
+
+    def _run_component(self, name, func, *args):
+        """Chạy 1 bước nạp + ghi trạng thái / thời gian. Lỗi -> None (app vẫn chạy, /ready báo failed)."""
+        status = self.components[name]
+        status.start()
+        try:
+            result = func(*args)
+        except Exception as e:
+            status.finish(e)
+            logger.warning("không nạp được thành phần", extra={"component": name, "error": str(e)})
+            return None
+        status.finish()
+        logger.info("component ready", extra={"component": name, "duration_ms": round(status.duration_ms, 1)})
+        return result
+
+    def load_models(self):
+        """Nạp tuần tự LLM + reranker + index (script / benchmark). Server dùng start_warm_up()."""
+        self._run_component("llm", self.load_llms)
+        self._run_component("reranker", self._load_reranker)
+        try:
+            self.get_index()
+        except Exception as e:
+            logger.warning("không thể nạp trước index", extra={"error": str(e)})
+
+    # =========================================================
+    # 👇 WARM-UP SONG SONG (STARTUP KHÔNG CHẶN /ping)
+    # =========================================================
+    def start_warm_up(self) -> asyncio.Future:
+        """
+        Tạo ngay các task nạp (mỗi thành phần 1 thread) rồi trả về:
+            llm client | reranker | embedding model + đọc index từ đĩa -> ghép index + bảng tra
+        Gọi trong startup (có event loop); request đến sớm chờ đúng task index thay vì nạp lần 2.
+        """
+        self._index_task = asyncio.ensure_future(self._warm_up_index())
+        return asyncio.ensure_future(self._warm_up(self._index_task))
+
+    async def _warm_up(self, index_task):
+        await asyncio.gather(
+            asyncio.to_thread(self._run_component, "llm", self.load_llms),
+            asyncio.to_thread(self._run_component, "reranker", self._load_reranker),
+            index_task,
+        )
+        self._warm_up_ms = (time.perf_counter() - self._created) * 1000
+        logger.info("warm-up done", extra={"warm_up_ms": round(self._warm_up_ms, 1),
+                                           **{name: s.state for name, s in self.components.items()}})
+
+    async def _warm_up_index(self):
+        from config.vector_store import load_embed_model, load_index_storage
+
+        embed_model, storage = await asyncio.gather(
+            asyncio.to_thread(self._run_component, "embed_model", load_embed_model),
+            asyncio.to_thread(self._run_component, "index_storage", load_index_storage),
+        )
+        if embed_model is None or storage is None:
+            self.components["index"].start()
+            self.components["index"].finish(RuntimeError("thiếu embedding model / dữ liệu index"))
+            return
+        await asyncio.to_thread(self._run_component, "index", self._attach_loaded_index, storage, embed_model)
+
+    def _attach_loaded_index(self, storage, embed_model):
+        from llama_index.core import Settings
+        from config.vector_store import assemble_index, get_index_version
+
+        with self._index_lock:
+            if self.index is None:
+                Settings.embed_model = embed_model
+                self.attach_index(assemble_index(storage, embed_model), get_index_version(), embed_model)
+
+    def readiness(self) -> dict:
+        """ready = thành phần bắt buộc đã nạp xong và không còn thành phần nào đang nạp."""
+        states = self.components.values()
+        ready = (all(s.state == "ready" for s in states if s.required)
+                 and not any(s.state in ("pending", "loading") for s in states))
+        elapsed = self._warm_up_ms if self._warm_up_ms is not None else (time.perf_counter() - self._created) * 1000
+        return {"ready": ready, "elapsed_ms": round(elapsed, 1),
+                "components": {name: s.as_dict() for name, s in self.components.items()}}
+
+    async def aget_index(self):
+        """Cho request: warm-up đang nạp index -> chờ nó; chưa warm-up / lỗi -> nạp lại trong thread pool."""
+        task = self._index_task
+        if self.index is None and task is not None and not task.done():
+            await asyncio.shield(task)
+        if self.index is None:
+            return await run_blocking(self.get_index)
+        return self.index
+
+    def get_index(self):
+        """Trả về index đã nạp; nếu startup nạp lỗi thì thử lại (chỉ 1 thread được nạp)."""
+        if self.index is None:
+            with self._index_lock:
+                if self.index is None:
+                    from llama_index.core import Settings
+                    from config.vector_store import get_index_version, get_vector_store
+
+                    status = self.components["index"]
+                    status.start()
+                    try:
+                        index = get_vector_store()
+                        self.attach_index(index, get_index_version(), Settings.embed_model)
+                    except Exception as e:
+                        status.finish(e)
+                        raise
+                    status.finish()
+        return self.index
+
+    def attach_index(self, index, index_version, embed_model):
+        """Dựng các cấu trúc phụ thuộc index (classifier, dish index, bảng dinh dưỡng) rồi mới công bố index."""
+        from config.vector_store import get_index_nodes, get_node_metadata
+
+        self.index_version = index_version
+        self.embed_model = embed_model
+        metadata = get_node_metadata(index)
+        dish_names = [m.get("dish_name") for m in metadata]
+        self.intent_classifier = LocalIntentClassifier(dish_names=dish_names, embed_model=embed_model)
+        nodes = get_index_nodes(index)
+        if os.getenv("DISH_INDEX", "1") != "0":
+            self.dish_index = DishNameIndex(
+                nodes,
+                fuzzy_threshold=float(os.getenv("DISH_FUZZY_THRESHOLD", "0.8")),
+            )
+            logger.info("dish-name index ready", extra=self.dish_index.stats())
+        if os.getenv("NUTRITION_TABLE", "1") != "0":
+            self.nutrition_table = NutritionTable(metadata, dish_index=self.dish_index)
+            logger.info("nutrition table ready", extra={"dishes": len(self.nutrition_table)})
+        if os.getenv("HYBRID_SEARCH", "1") != "0":
+            from config.sparse_index import load_sparse_index
+
+            self.sparse_index = load_sparse_index(nodes)
+            logger.info("BM25 index ready", extra=self.sparse_index.stats())
+        self.index = index
+
+    def get_rag_chain(self, index):
+        """Chain + retriever dùng chung giữa các request; dựng lại khi index / reranker / classifier / chỉ mục phụ đổi."""
+        key = (id(self.llm), id(index), id(self.reranker), id(self.intent_classifier), id(self.dish_index),
+               id(self.sparse_index))
+        if self._rag_chain is None or self._rag_chain_key != key:
+            self._rag_chain = get_conversational_rag_chain(
+                self.llm, index, reranker=self.reranker, classifier=self.intent_classifier,
+                dish_index=self.dish_index, sparse_index=self.sparse_index,
+            )
+            self._rag_chain_key = key
+        return self._rag_chain
+
+    async def aclose(self):
+        self.scan_prefetcher.close()
+        self.http_client.close()
+        await self.http_async_client.aclose()
+        # Lưu cache query embedding để lần khởi động sau dùng lại
+        save_query_cache()
+
+
+def get_resources(request: Request) -> AppResources:
+    resources = getattr(request.app.state, "resources", None)
+    # LLM client chưa sẵn sàng (warm-up chạy nền) -> 503 để client / load balancer thử lại
+    if resources is None or resources.llm is None:
+        raise HTTPException(status_code=503, detail="Server đang khởi động, vui lòng thử lại.",
+                            headers={"Retry-After": "2"})
+    return resources
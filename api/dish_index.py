@@ -0,0 +1,221 @@
+import json
+import os
+import re
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from utils.utils import fold_accents
+
+# ==============================================================================
+# CHỈ MỤC TÊN MÓN (TRA TRỰC TIẾP, KHÔNG EMBEDDING)
+# ==============================================================================
+# Câu hỏi NEW_TOPIC thường nêu thẳng tên món ("Cơm hến bao nhiêu calo?") -> tra dict theo
+# tên đã bỏ dấu (micro giây) thay vì nhúng câu hỏi + similarity search. Thứ tự:
+#   1. exact / alias : n-gram âm tiết của câu hỏi == tên món (hoặc tên gọi khác)
+#   2. fuzzy         : trigram ký tự (gõ sai / thiếu chữ), kiểm tra lại trên cửa sổ liền kề
+# Không khớp -> retriever quay về dense search như cũ.
+# Tên lớp CV sau scan thường là tên chung ("Chả cá", "Sườn non") -> lookup_partial: tên món
+# trong FoodDB chứa nguyên cụm đó ("Chả cá Lã Vọng"), ưu tiên tên bắt đầu bằng cụm rồi tên ngắn nhất.
+
+# Tên gọi khác -> tên món chuẩn (chỉ dùng khi tên chuẩn có trong FoodDB).
+# Bổ sung bằng file JSON {"tên gọi khác": "Tên món chuẩn"} qua DISH_ALIASES_PATH.
+DISH_ALIASES = {
+    "hủ tíu": "Hủ tiếu",
+    "hủ tíu nam vang": "Hủ tiếu Nam Vang",
+    "bánh mỳ": "Bánh mì",
+    "cơm sườn": "Cơm tấm sườn",
+    "gỏi cuốn": "Gỏi cuốn tôm thịt",
+}
+
+DISH_ALIASES_PATH = os.getenv("DISH_ALIASES_PATH", "data_raw/dish_aliases.json")
+
+_WORD = re.compile(r"\w+")
+_PARENTHESES = re.compile(r"\s*\(.*?\)")
+
+
+class DishMatch(NamedTuple):
+    node: Any          # TextNode trong index
+    dish_name: str
+    score: float       # 1.0 cho exact / alias, hệ số Dice trigram cho fuzzy, tỷ lệ âm tiết cho partial
+    method: str        # "exact" / "alias" / "fuzzy" / "partial"
+
+
+def _tokens(text: str) -> List[str]:
+    return _WORD.findall(fold_accents(text))
+
+
+def _trigrams(text: str) -> set:
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _one_edit(a: str, b: str) -> bool:
+    """
+    a, b khác nhau đúng 1 phép sửa: thêm / xóa 1 ký tự, đảo 2 ký tự kề nhau, hoặc thay 1 ký tự
+    (chỉ với âm tiết >= 4 ký tự: "hun" / "hen" là 2 từ khác nhau chứ không phải gõ sai).
+    """
+    if abs(len(a) - len(b)) > 1 or min(len(a), len(b)) < 2:
+        return False
+    if len(a) == len(b):
+        diff = [i for i in range(len(a)) if a[i] != b[i]]
+        return (len(diff) == 1 and len(a) >= 4) or (len(diff) == 2 and diff[1] == diff[0] + 1
+                                  and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]])
+    short, long_ = (a, b) if len(a) < len(b) else (b, a)
+    return any(long_[:i] + long_[i + 1:] == short for i in range(len(long_)))
+
+
+def _syllable_score(window: List[str], name: List[str]) -> float:
+    """Theo từng âm tiết: khớp = 1, gõ sai 1 ký tự (âm tiết >= 3 ký tự) = 0.9, khác = 0."""
+    score = 0.0
+    for w, n in zip(window, name):
+        if w == n:
+            score += 1.0
+        elif len(n) >= 3 and _one_edit(w, n):
+            score += 0.9
+        else:
+            return 0.0 if len(name) <= 2 else score / len(name) * 0.5
+    return score / len(name)
+
+
+def load_aliases(path: str = DISH_ALIASES_PATH) -> Dict[str, str]:
+    aliases = dict(DISH_ALIASES)
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            aliases.update(json.load(f))
+    return aliases
+
+
+class DishNameIndex:
+    def __init__(self, nodes, aliases: Optional[Dict[str, str]] = None, fuzzy_threshold: float = 0.8):
+        self.fuzzy_threshold = fuzzy_threshold
+        self.nodes = []
+        self.names = []          # tên đã bỏ dấu, theo id
+        self._exact = {}         # tên bỏ dấu -> (id, method)
+        self._postings = {}      # trigram -> [id, ...]
+        self._syllable_postings = {}  # âm tiết -> [id, ...]
+        self._gram_counts = []
+        self._syllables = []
+
+        for node in nodes:
+            dish_name = str((node.metadata or {}).get("dish_name") or "").strip()
+            folded = " ".join(_tokens(dish_name))
+            if not folded or folded in self._exact:
+                continue
+            dish_id = len(self.nodes)
+            self.nodes.append(node)
+            self.names.append(folded)
+            self._exact[folded] = (dish_id, "exact")
+            grams = _trigrams(folded)
+            self._gram_counts.append(len(grams))
+            self._syllables.append(len(folded.split()))
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(dish_id)
+            for syllable in set(folded.split()):
+                self._syllable_postings.setdefault(syllable, []).append(dish_id)
+
+        # Tên rút gọn (bỏ phần trong ngoặc) + bảng tên gọi khác
+        dish_names = [node.metadata["dish_name"] for node in self.nodes]
+        candidates = {_PARENTHESES.sub("", dish): dish for dish in dish_names}
+        candidates.update(aliases if aliases is not None else load_aliases())
+        for alias, canonical in candidates.items():
+            alias_folded, canonical_folded = " ".join(_tokens(alias)), " ".join(_tokens(canonical))
+            if alias_folded and canonical_folded in self._exact and alias_folded not in self._exact:
+                self._exact[alias_folded] = (self._exact[canonical_folded][0], "alias")
+
+        self._max_ngram = max((len(name.split()) for name in self._exact), default=0)
+        # Postings dạng mảng -> đếm trùng trigram bằng 1 lần np.bincount thay vì vòng lặp Python
+        self._postings = {gram: np.asarray(ids, dtype=np.int32) for gram, ids in self._postings.items()}
+        self._syllable_postings = {syl: np.asarray(ids, dtype=np.int32) for syl, ids in self._syllable_postings.items()}
+        # Lọc ứng viên lỏng hơn ngưỡng cuối (1 lỗi gõ làm mất 3-4 trigram), rồi kiểm tra lại từng cửa sổ
+        self._min_overlap = np.asarray(self._gram_counts, dtype=np.float32) * (fuzzy_threshold - 0.2)
+        self._syllable_counts = np.asarray([len(set(name.split())) for name in self.names], dtype=np.int64)
+        self._fuzzy_ok = np.asarray(self._syllables) >= 2  # Tên 1 âm tiết chỉ khớp exact
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _match(self, dish_id: int, score: float, method: str) -> DishMatch:
+        node = self.nodes[dish_id]
+        return DishMatch(node, node.metadata["dish_name"], score, method)
+
+    def _exact_matches(self, tokens: List[str], limit: int) -> List[DishMatch]:
+        """N-gram dài nhất trước, các đoạn khớp không chồng lên nhau."""
+        matches, used, seen = [], [False] * len(tokens), set()
+        for n in range(min(self._max_ngram, len(tokens)), 0, -1):
+            for start in range(len(tokens) - n + 1):
+                if any(used[start:start + n]):
+                    continue
+                hit = self._exact.get(" ".join(tokens[start:start + n]))
+                if hit is None or hit[0] in seen:
+                    continue
+                used[start:start + n] = [True] * n
+                seen.add(hit[0])
+                matches.append(self._match(hit[0], 1.0, hit[1]))
+                if len(matches) >= limit:
+                    return matches
+        return matches
+
+    def _fuzzy_match(self, tokens: List[str]) -> Optional[DishMatch]:
+        # 1 lượt qua inverted index: tỷ lệ trigram của tên món xuất hiện trong câu hỏi
+        # Ứng viên: đủ nhiều trigram chung HOẶC chỉ lệch tối đa 1 âm tiết (gõ sai trong 1 âm tiết ngắn)
+        n_dishes = len(self.nodes)
+        grams = [self._postings[g] for g in _trigrams(" ".join(tokens)) if g in self._postings]
+        syllables = [self._syllable_postings[t] for t in set(tokens) if t in self._syllable_postings]
+        if not grams:
+            return None
+        gram_counts = np.bincount(np.concatenate(grams), minlength=n_dishes)
+        candidates = gram_counts >= self._min_overlap
+        if syllables:
+            syllable_counts = np.bincount(np.concatenate(syllables), minlength=n_dishes)
+            candidates |= syllable_counts >= self._syllable_counts - 1
+        best = None
+        for dish_id in np.flatnonzero(candidates & self._fuzzy_ok).tolist():
+            # Kiểm tra trên cửa sổ âm tiết liền kề (tránh khớp rải rác khắp câu):
+            # Dice trigram (thiếu / thừa chữ) hoặc so từng âm tiết (gõ sai 1 ký tự).
+            # Chỉ cho thiếu 1 âm tiết với tên >= 4 âm tiết ("kho tộ" không phải "Cá kho tộ")
+            name = self.names[dish_id]
+            name_grams, name_tokens = _trigrams(name), name.split()
+            size = len(name_tokens)
+            for n in ((size - 1, size, size + 1) if size >= 4 else (size, size + 1)):
+                for start in range(max(0, len(tokens) - n + 1)):
+                    window_tokens = tokens[start:start + n]
+                    window = _trigrams(" ".join(window_tokens))
+                    score = 2 * len(window & name_grams) / (len(window) + len(name_grams))
+                    if n == size:
+                        score = max(score, _syllable_score(window_tokens, name_tokens))
+                    if score >= self.fuzzy_threshold and (best is None or score > best[1]):
+                        best = (dish_id, score)
+        return self._match(best[0], best[1], "fuzzy") if best else None
+
+    def lookup(self, query: str, limit: int = 3) -> List[DishMatch]:
+        """Các món được nêu tên trong câu hỏi (rỗng nếu không khớp)."""
+        tokens = _tokens(query)
+        if not tokens or not self.nodes:
+            return []
+        matches = self._exact_matches(tokens, limit)
+        if matches:
+            return matches
+        fuzzy = self._fuzzy_match(tokens)
+        return [fuzzy] if fuzzy else []
+
+    def lookup_partial(self, name: str, limit: int = 1) -> List[DishMatch]:
+        """Món có tên chứa liền mạch các âm tiết của `name` (dùng sau khi lookup() không khớp)."""
+        tokens = _tokens(name)
+        if not tokens or any(t not in self._syllable_postings for t in tokens):
+            return []
+        candidates = self._syllable_postings[tokens[0]]
+        for token in set(tokens[1:]):
+            candidates = np.intersect1d(candidates, self._syllable_postings[token], assume_unique=True)
+        ranked = []
+        for dish_id in candidates.tolist():
+            name_tokens = self.names[dish_id].split()
+            starts = [i for i in range(len(name_tokens) - len(tokens) + 1)
+                      if name_tokens[i:i + len(tokens)] == tokens]
+            if starts:
+                ranked.append((starts[0] > 0, len(name_tokens), dish_id))
+        ranked.sort()
+        return [self._match(dish_id, len(tokens) / size, "partial") for _, size, dish_id in ranked[:limit]]
+
+    def stats(self) -> dict:
+        return {"dishes": len(self.nodes), "keys": len(self._exact), "trigrams": len(self._postings)}
@@ -1,45 +1,37 @@
 import re
 import os
-from fastapi import APIRouter, HTTPException
+import asyncio
+import json
+import time
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict
-from dotenv import load_dotenv
+from typing import List, NamedTuple, Optional
 
 # --- IMPORTS ---
-from langchain_groq import ChatGroq
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
-from config.vector_store import get_vector_store
-from config.rerank import load_reranker 
-from api.langchain_utils import get_conversational_rag_chain
-from utils.utils import remove_think_tags
-from utils.session_manager import update_scan_result, get_scanned_context 
+from api.dependencies import AppResources, get_resources
+from api.nutrition_table import parse_nutrition_conditions
+from api.prompt_builder import log_direct_prompt
+from api.scan_prefetch import ScanContext, build_scan_messages
+from utils.utils import ThinkTagFilter, remove_think_tags
+from utils.concurrency import run_blocking
+from utils.observability import FALLBACKS, get_logger, langchain_config, set_route, span
+from utils.session_manager import (
+    update_scan_result, get_scanned_context, set_chat_focus, get_chat_focus,
+    get_chat_history, append_chat_history,
+)
 
 router = APIRouter()
+logger = get_logger("api")
 
 # =========================================================
-# 👇 QUẢN LÝ TRẠNG THÁI (STATE MANAGEMENT) TẠI CHỖ
+# 👇 QUẢN LÝ TRẠNG THÁI: lịch sử chat / Scan / tiêu điểm nằm trong SESSION_STORE
+# (utils/session_manager.py) - giới hạn số session + TTL, không còn dict toàn cục.
 # =========================================================
-ROOT_INDEX = None
-CHAT_HISTORIES: Dict[str, List] = {}
-
-# Di chuyển biến SESSION_FOCUS về đây để đảm bảo tính nhất quán
-# "SCAN": Đang tập trung vào món vừa chụp
-# "RAG": Đang chat về món trong database/chủ đề mới
-SESSION_FOCUS: Dict[str, str] = {} 
-
-def get_root_index():
-    global ROOT_INDEX
-    if ROOT_INDEX is None:
-        ROOT_INDEX = get_vector_store()
-    return ROOT_INDEX
-
-def get_chat_history(session_id: str):
-    if session_id not in CHAT_HISTORIES:
-        CHAT_HISTORIES[session_id] = []
-    return CHAT_HISTORIES[session_id]
 
 CV_TO_VIETNAMESE = {
     "Suon": "Sườn non", "Cha Ca": "Chả cá", "Tofu": "Đậu hũ", "Unknown": ""
@@ -61,7 +53,7 @@ class ChatMessageResponse(BaseModel):
 # =========================================================
 # 👇 ROUTER & HELPER
 # =========================================================
-def classify_query(llm, query: str) -> str:
+async def classify_query(llm, query: str) -> str:
     template = """
     Phân loại câu hỏi:
     1. "FOLLOWUP": Hỏi tiếp về món đang nói ("món này", "nó", "vừa ăn", "có béo không", "ngon không").
@@ -74,12 +66,31 @@ def classify_query(llm, query: str) -> str:
     prompt = PromptTemplate.from_template(template)
     chain = prompt | llm | StrOutputParser()
     try:
-        res = chain.invoke({"question": query})
+        with span("classify_llm"):
+            res = await chain.ainvoke({"question": query}, config=langchain_config("classify_query"))
         clean = remove_think_tags(str(res)).strip().upper()
         if "CHIT" in clean: return "CHITCHAT"
         if "NEW" in clean: return "NEW_TOPIC"
         return "FOLLOWUP"
-    except: return "FOLLOWUP"
+    except Exception:
+        # LLM lỗi / timeout -> coi là FOLLOWUP như cũ, nhưng để lại dấu vết trong log + /metrics
+        FALLBACKS.labels("classify_llm").inc()
+        logger.warning("classify_query lỗi -> FOLLOWUP", exc_info=True)
+        return "FOLLOWUP"
+
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.75"))
+
+async def detect_intent(resources: AppResources, query: str) -> str:
+    """Luật cục bộ -> centroid embedding -> chỉ gọi LLM khi cả hai đều không chắc chắn."""
+    classifier = resources.intent_classifier
+    result = classifier.classify_rules(query)
+    if result.confidence < INTENT_CONFIDENCE_THRESHOLD and classifier.embed_model is not None:
+        result = await run_blocking(classifier.classify_centroid, query, result)
+    if result.confidence >= INTENT_CONFIDENCE_THRESHOLD:
+        logger.info("intent cục bộ", extra={"intent": result.intent, "intent_source": result.source,
+                                              "confidence": round(result.confidence, 2)})
+        return result.intent
+    return await classify_query(resources.classifier_llm, query)
 
 def extract_image_link(text):
     pattern = r"!\[.*?\]\((http.*?)\)"
@@ -89,125 +100,343 @@ def extract_image_link(text):
 
 # --- API SCAN ---
 @router.post("/scan")
-async def receive_scan_data(data: ScanData):
+async def receive_scan_data(data: ScanData, request: Request):
     mapped = []
     for item in data.detected_classes:
         vn = CV_TO_VIETNAMESE.get(item, item)
         if vn: mapped.append(vn)
     if mapped:
-        update_scan_result(data.session_id, mapped)
-        
-        # 👇 KHI SCAN: BẮT BUỘC CHUYỂN TIÊU ĐIỂM VỀ SCAN
-        SESSION_FOCUS[data.session_id] = "SCAN"
-        print(f"📸 [Session: {data.session_id}] Focus set to: SCAN")
-        
+        # 👇 KHI SCAN: BẮT BUỘC CHUYỂN TIÊU ĐIỂM VỀ SCAN (update_scan_result set luôn focus)
+        await update_scan_result(data.session_id, mapped)
+        logger.info("scan: focus -> SCAN", extra={"session_id": data.session_id, "mapped_names": mapped})
+        # Chuẩn bị nền context FoodDB cho câu hỏi tiếp theo (scan mới -> hủy lần chuẩn bị cũ)
+        resources = getattr(request.app.state, "resources", None)
+        if resources is not None:
+            resources.scan_prefetcher.start(data.session_id, mapped, resources)
+
         return {"message": "Đã đồng bộ context.", "mapped_names": mapped}
     return {"message": "Không nhận diện được."}
 
+@router.get("/scan/{session_id}")
+async def get_scan_context(session_id: str, request: Request):
+    """Món vừa scan khớp FoodDB + ảnh (ready=False khi còn đang chuẩn bị)."""
+    resources = getattr(request.app.state, "resources", None)
+    state = resources.scan_prefetcher.peek(session_id) if resources is not None else None
+    return state or {"foods": None, "ready": False}
+
 # --- API ASK ---
+# Prompt cố định của luồng C (CHITCHAT), dùng chung cho /ask và /ask/stream
+# (prompt luồng A - SCAN nằm trong api/scan_prefetch.py cùng context chuẩn bị sẵn)
+
+# 👇👇👇 PROMPT CỰC GẮT ĐỂ CẤM HỎI THỜI TIẾT 👇👇👇
+CHITCHAT_SYSTEM_PROMPT = (
+    "Bạn là Lucfin, trợ lý chuyên về DINH DƯỠNG và ẨM THỰC. "
+    "QUY TẮC TỪ CHỐI (REFUSAL POLICY):"
+    "1. Nếu người dùng hỏi về: Thời tiết, Giá vàng, Chứng khoán, Chính trị, Lịch sử, Code, Tin tức..."
+    "   -> HÃY TỪ CHỐI LỊCH SỰ. Nói: 'Xin lỗi, tôi là trợ lý dinh dưỡng, tôi không có thông tin về vấn đề này.'"
+    "   -> TUYỆT ĐỐI KHÔNG bịa ra thời tiết hay thông tin sai lệch."
+    "2. Nếu hỏi 'Bạn là ai', 'Ai tạo ra bạn':"
+    "   -> Trả lời: 'Tôi là Lucfin, sản phẩm của đội ngũ NutriAI.'"
+)
+
+# Các từ khóa cho thấy Bot đang từ chối trả lời món hư cấu
+REFUSAL_KEYWORDS = ["món ăn hư cấu", "không phải là món ăn thực tế", "không có thực", "xin lỗi"]
+
+class AskPlan(NamedTuple):
+    intent: str
+    route: str                 # "SCAN" / "RAG" / "CHITCHAT" / "TABLE"
+    chat_history: List
+    scanned_food: Optional[str]
+    cache_scope: Optional[str]
+    cache_key: Optional[List[float]]
+    cached: Optional[dict]
+    table_answer: Optional[dict] = None
+    scan_context: Optional[ScanContext] = None
+
+async def plan_request(req: NutritionRequest, resources: AppResources) -> AskPlan:
+    # 2 lần đọc session độc lập -> chạy song song (backend SQLite / Redis chạy trong thread)
+    chat_history, scanned_food = await asyncio.gather(
+        get_chat_history(req.session_id), get_scanned_context(req.session_id)
+    )
+
+    # 0. Câu hỏi số (calo / đạm / béo của món có tên, lọc / top-N) -> trả lời thẳng từ bảng dinh dưỡng.
+    # Các mẫu này luôn là câu hỏi độc lập nên bỏ qua cả bước phân loại ý định.
+    if resources.nutrition_table is not None:
+        with span("table"):
+            table_answer = resources.nutrition_table.answer(req.question)
+        if table_answer is not None:
+            await set_chat_focus(req.session_id, "RAG")
+            logger.info("trả lời từ bảng dinh dưỡng (không gọi LLM)",
+                        extra={"session_id": req.session_id, "question": req.question})
+            return AskPlan("NEW_TOPIC", "TABLE", chat_history, scanned_food, None, None, None, table_answer)
+    
+    # 1. Phân loại ý định
+    with span("intent"):
+        intent = await detect_intent(resources, req.question)
+    
+    # 2. QUẢN LÝ TIÊU ĐIỂM (LOGIC CHẶT CHẼ HƠN)
+    if intent == "NEW_TOPIC":
+        # Nếu hỏi món mới -> Quên ngay món Scan -> Chuyển sang RAG
+        await set_chat_focus(req.session_id, "RAG")
+
+    # Lấy focus hiện tại (Mặc định là RAG nếu chưa có)
+    current_focus = await get_chat_focus(req.session_id)
+    
+
+    # Chọn luồng xử lý (A: SCAN / B: RAG / C: CHITCHAT)
+    # Luồng A chỉ chạy khi: Intent là Followup VÀ Focus đang là SCAN VÀ Có dữ liệu Scan
+    if intent == "FOLLOWUP" and current_focus == "SCAN" and scanned_food:
+        route = "SCAN"
+    elif intent == "NEW_TOPIC" or (intent == "FOLLOWUP" and current_focus == "RAG"):
+        route = "RAG"
+    else:
+        route = "CHITCHAT"
+    logger.info("ask", extra={"session_id": req.session_id, "question": req.question, "intent": intent,
+                              "focus": current_focus, "route": route})
+
+    # Luồng A: dùng context chuẩn bị sẵn lúc /scan. Câu hỏi số về món vừa chụp -> trả lời thẳng từ bảng
+    if route == "SCAN":
+        with span("scan_prefetch"):
+            scan_context = await resources.scan_prefetcher.get(req.session_id, scanned_food)
+        if scan_context is not None and resources.nutrition_table is not None:
+            table_answer = resources.nutrition_table.answer_for(req.question, scan_context.dishes)
+            if table_answer is not None:
+                logger.info("trả lời món vừa scan từ bảng dinh dưỡng (không gọi LLM)",
+                            extra={"session_id": req.session_id, "dishes": scan_context.sources})
+                table_answer = {**table_answer, "image": "USE_LOCAL_IMAGE"}
+                return AskPlan(intent, "TABLE", chat_history, scanned_food, None, None, None, table_answer)
+        return AskPlan(intent, route, chat_history, scanned_food, None, None, None, scan_context=scan_context)
+
+    # 3. SEMANTIC CACHE: chỉ cho câu hỏi độc lập (món mới / xã giao thuần), KHÔNG cho follow-up
+    # vì câu trả lời phụ thuộc lịch sử chat hoặc context Scan của từng session
+    cache_scope = route if (route, intent) in (("RAG", "NEW_TOPIC"), ("CHITCHAT", "CHITCHAT")) else None
+    cache_key, cached = None, None
+    if cache_scope and resources.embed_model is not None:
+        with span("cache_lookup"):
+            cache_key = await run_blocking(resources.embed_model.get_query_embedding, req.question)
+            cached = resources.answer_cache.lookup(cache_key, cache_scope, resources.index_version)
+        if cached is not None:
+            logger.info("semantic cache hit -> bỏ qua LLM", extra={"cache_scope": cache_scope})
+
+    return AskPlan(intent, route, chat_history, scanned_food, cache_scope, cache_key, cached)
+
+def build_direct_messages(plan: AskPlan, question: str):
+    """Messages cho luồng A (SCAN) / C (CHITCHAT) - không qua RAG."""
+    if plan.route == "SCAN":
+        messages = build_scan_messages(plan.scanned_food, question, plan.scan_context)
+    else:
+        messages = [SystemMessage(content=CHITCHAT_SYSTEM_PROMPT), HumanMessage(content=question)]
+    log_direct_prompt(plan.route, messages)
+    return messages
+
+def scan_sources(plan: AskPlan) -> List[str]:
+    """Nguồn của luồng A: món FoodDB đã khớp lúc chuẩn bị, không có thì kiến thức chung."""
+    if plan.scan_context is not None and plan.scan_context.dishes:
+        return plan.scan_context.sources
+    return ["Kiến thức tổng quát Lucfin"]
+
+def get_rag_chain(resources: AppResources, index):
+    return resources.get_rag_chain(index)
+
+def rag_filters(question: str):
+    """
+    Điều kiện số trong câu hỏi đi RAG ("món nào dưới 300 calo tốt cho người tiểu đường?") -> MetadataFilters,
+    lọc ngay trong vector store thay vì để LLM tự loại món không thỏa. Không có điều kiện -> None.
+    """
+    conditions = parse_nutrition_conditions(question)
+    if not conditions:
+        return None
+    # llama_index đã được nạp cùng index (warm-up) -> import ở đây không tốn thêm
+    from config.vector_store import nutrition_filters
+
+    return nutrition_filters(conditions)
+
+def finalize_rag_answer(raw_answer: str, source_docs):
+    """Kiểm tra từ chối + lấy ảnh/nguồn cho luồng B. Trả về (answer, image_url, sources)."""
+    # --- 👇👇👇 LOGIC MỚI: KIỂM TRA TỪ CHỐI (REFUSAL CHECK) 👇👇👇 ---
+    is_refused = any(keyword in raw_answer.lower() for keyword in REFUSAL_KEYWORDS)
+    
+    if is_refused:
+        logger.info("câu trả lời từ chối -> ẩn ảnh và nguồn")
+        return raw_answer, None, []
+
+    # Chỉ lấy ảnh nếu KHÔNG bị từ chối
+    image_url, sources = None, []
+    if source_docs:
+        meta = source_docs[0].metadata
+        image_url = meta.get("image_link") or meta.get("image")
+        sources = [d.metadata.get("dish_name", "Tài liệu") for d in source_docs]
+    
+    # Check ảnh trong text (nếu có)
+    final_answer, extracted_img = extract_image_link(raw_answer)
+    if not image_url and extracted_img: image_url = extracted_img
+    return final_answer, image_url, sources
+
+async def finish_request(req: NutritionRequest, resources: AppResources, plan: AskPlan,
+                         final_answer: str, image_url, sources) -> ChatMessageResponse:
+    # 4. Update History
+    await append_chat_history(req.session_id, req.question, final_answer)
+
+    response = ChatMessageResponse(answer=final_answer, image=image_url, sourceDocuments=list(set(sources)))
+    if plan.cache_key is not None:
+        resources.answer_cache.store(plan.cache_key, plan.cache_scope, resources.index_version, response.model_dump())
+    return response
+
+def server_timing(route: str, timings: dict) -> str:
+    """Header Server-Timing (W3C): DevTools / evaluation/benchmark_load.py đọc được luồng + thời gian từng bước."""
+    return ", ".join([f'route;desc="{route}"'] + [f"{name.removesuffix('_ms')};dur={ms:.1f}"
+                                                   for name, ms in timings.items()])
+
 @router.post("/ask", response_model=ChatMessageResponse)
-async def ask_nutrition(req: NutritionRequest):
+async def ask_nutrition(req: NutritionRequest, http_response: Response,
+                        resources: AppResources = Depends(get_resources)):
     try:
-        load_dotenv()
-        api_key = os.getenv("MY_API_KEY")
-        load_reranker()
-        llm = ChatGroq(model="qwen/qwen3-32b", api_key=api_key, temperature=0)
-        
-        chat_history = get_chat_history(req.session_id)
-        scanned_food = get_scanned_context(req.session_id)
-        
-        # 1. Phân loại ý định
-        intent = classify_query(llm, req.question)
-        
-        # 2. QUẢN LÝ TIÊU ĐIỂM (LOGIC CHẶT CHẼ HƠN)
-        if intent == "NEW_TOPIC":
-            # Nếu hỏi món mới -> Quên ngay món Scan -> Chuyển sang RAG
-            SESSION_FOCUS[req.session_id] = "RAG"
-            print(f"🔄 Intent là NEW_TOPIC -> Chuyển Focus sang: RAG")
-        
-        # Lấy focus hiện tại (Mặc định là RAG nếu chưa có)
-        current_focus = SESSION_FOCUS.get(req.session_id, "RAG")
-        
-        print(f"🗣️ User: {req.question} | Intent: {intent} | Focus: {current_focus}")
+        started = time.perf_counter()
+        llm = resources.llm
+        plan = await plan_request(req, resources)
+        timings = {"plan_ms": (time.perf_counter() - started) * 1000}
+        set_route("CACHE" if plan.cached is not None else plan.route)
+        if plan.cached is not None:
+            await append_chat_history(req.session_id, req.question, plan.cached["answer"])
+            http_response.headers["Server-Timing"] = server_timing("CACHE", timings)
+            return ChatMessageResponse(**plan.cached)
 
         final_answer, image_url, sources = "", None, []
 
+        # ==============================================================================
+        # 📊 LUỒNG D: BẢNG DINH DƯỠNG (câu hỏi số, không gọi LLM)
+        # ==============================================================================
+        if plan.route == "TABLE":
+            table = plan.table_answer
+            final_answer, image_url, sources = table["answer"], table["image"], table["sourceDocuments"]
+
         # ==============================================================================
         # 🔴 LUỒNG A: SCAN FOLLOWUP (Chỉ chạy khi User đang nhìn vào Camera)
         # ==============================================================================
-        # Điều kiện: Intent là Followup VÀ Focus đang là SCAN VÀ Có dữ liệu Scan
-        if intent == "FOLLOWUP" and current_focus == "SCAN" and scanned_food:
-            print("🚀 CASE A: Trả lời về món Scan (General Knowledge).")
-            
-            system_prompt = (
-                f"Bạn là Lucfin. Người dùng đang hỏi về món họ vừa chụp ảnh: {scanned_food}. "
-                "Hãy trả lời ngắn gọn (80 chữ), tập trung dinh dưỡng, không cần tra cứu DB."
-            )
-            ai_msg = llm.invoke([SystemMessage(content=system_prompt), HumanMessage(content=req.question)])
+        elif plan.route == "SCAN":
+            with span("generate") as generate:
+                ai_msg = await llm.ainvoke(build_direct_messages(plan, req.question), config=langchain_config("scan"))
+            timings["generate_ms"] = generate.ms
             final_answer = remove_think_tags(str(ai_msg.content))
             image_url = "USE_LOCAL_IMAGE"
-            sources = ["Kiến thức tổng quát Lucfin"]
+            sources = scan_sources(plan)
 
         # ==============================================================================
         # 🔵 LUỒNG B: RAG FOODDB (Chạy khi New Topic HOẶC Focus đang là RAG)
         # ==============================================================================
-        elif intent == "NEW_TOPIC" or (intent == "FOLLOWUP" and current_focus == "RAG"):
-            print("books CASE B: Chạy RAG tìm kiếm trong FoodDB.")
-            
-            index = get_root_index()
-            rag_chain = get_conversational_rag_chain(llm, index)
-            response = rag_chain.invoke({"input": req.question, "chat_history": chat_history})
+        elif plan.route == "RAG":
+            # Index đã nạp sẵn lúc startup; nếu startup lỗi thì thử nạp lại trong thread pool
+            index = await resources.aget_index()
+            rag_chain = get_rag_chain(resources, index)
+            response = await rag_chain.ainvoke({"input": req.question, "chat_history": plan.chat_history},
+                                             filters=rag_filters(req.question))
             
+            timings.update(response.get("timings", {}))
             raw_answer = remove_think_tags(str(response["answer"]))
-            final_answer = raw_answer # Tạm gán
-            
-            # --- 👇👇👇 LOGIC MỚI: KIỂM TRA TỪ CHỐI (REFUSAL CHECK) 👇👇👇 ---
-            # Các từ khóa cho thấy Bot đang từ chối trả lời món hư cấu
-            refusal_keywords = ["món ăn hư cấu", "không phải là món ăn thực tế", "không có thực", "xin lỗi"]
-            
-            is_refused = any(keyword in raw_answer.lower() for keyword in refusal_keywords)
-            
-            if is_refused:
-                print("🚫 Phát hiện câu trả lời từ chối -> Ẩn ảnh và nguồn.")
-                image_url = None
-                sources = []
-            else:
-                # Chỉ lấy ảnh nếu KHÔNG bị từ chối
-                source_docs = response.get("context", [])
-                if source_docs:
-                    meta = source_docs[0].metadata
-                    image_url = meta.get("image_link") or meta.get("image")
-                    sources = [d.metadata.get("dish_name", "Tài liệu") for d in source_docs]
-                
-                # Check ảnh trong text (nếu có)
-                final_answer, extracted_img = extract_image_link(raw_answer)
-                if not image_url and extracted_img: image_url = extracted_img
+            final_answer, image_url, sources = finalize_rag_answer(raw_answer, response.get("context", []))
 
         # ==============================================================================
         # 🟡 LUỒNG C: CHITCHAT (ĐÃ SỬA: CẤM TRẢ LỜI THỜI TIẾT)
         # ==============================================================================
         else:
-            print("💬 CASE C: Chitchat (Kích hoạt bộ lọc nội dung).")
-            # 👇👇👇 PROMPT CỰC GẮT ĐỂ CẤM HỎI THỜI TIẾT 👇👇👇
-            system_instruction = (
-                "Bạn là Lucfin, trợ lý chuyên về DINH DƯỠNG và ẨM THỰC. "
-                "QUY TẮC TỪ CHỐI (REFUSAL POLICY):"
-                "1. Nếu người dùng hỏi về: Thời tiết, Giá vàng, Chứng khoán, Chính trị, Lịch sử, Code, Tin tức..."
-                "   -> HÃY TỪ CHỐI LỊCH SỰ. Nói: 'Xin lỗi, tôi là trợ lý dinh dưỡng, tôi không có thông tin về vấn đề này.'"
-                "   -> TUYỆT ĐỐI KHÔNG bịa ra thời tiết hay thông tin sai lệch."
-                "2. Nếu hỏi 'Bạn là ai', 'Ai tạo ra bạn':"
-                "   -> Trả lời: 'Tôi là Lucfin, sản phẩm của đội ngũ NutriAI.'"
-            )
-            ai_msg = llm.invoke([("system", system_instruction), ("human", req.question)])
+            with span("generate") as generate:
+                ai_msg = await llm.ainvoke(build_direct_messages(plan, req.question), config=langchain_config("chitchat"))
+            timings["generate_ms"] = generate.ms
             final_answer = remove_think_tags(str(ai_msg.content))
 
-        # 4. Update History
-        chat_history.append(HumanMessage(content=req.question))
-        chat_history.append(AIMessage(content=final_answer))
-        if len(chat_history) > 6: CHAT_HISTORIES[req.session_id] = chat_history[-6:]
-
-        return ChatMessageResponse(answer=final_answer, image=image_url, sourceDocuments=list(set(sources)))
+        timings["total_ms"] = (time.perf_counter() - started) * 1000
+        http_response.headers["Server-Timing"] = server_timing(plan.route, timings)
+        logger.info("ask done", extra={"route": plan.route, **{k: round(v, 1) for k, v in timings.items()}})
+        return await finish_request(req, resources, plan, final_answer, image_url, sources)
 
     except Exception as e:
-        print(f"❌ Error: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        logger.exception("ask failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# --- API ASK (STREAMING SSE) ---
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/ask/stream")
+async def ask_nutrition_stream(req: NutritionRequest, resources: AppResources = Depends(get_resources)):
+    """
+    Giống /ask nhưng trả Server-Sent Events:
+      event: token  -> {"text": "..."} (đã lọc <think>...</think> theo từng chunk)
+      event: done   -> ChatMessageResponse + ttft_ms / total_ms
+      event: error  -> {"detail": "..."}
+    """
+    async def event_stream():
+        started = time.perf_counter()
+        ttft_ms = None
+        try:
+            plan = await plan_request(req, resources)
+            set_route("CACHE" if plan.cached is not None else plan.route)
+            ready = plan.cached if plan.cached is not None else plan.table_answer
+            if ready is not None:
+                # Cache hit / bảng dinh dưỡng: câu trả lời đã có sẵn -> 1 token + done
+                if plan.route == "TABLE":
+                    response = await finish_request(req, resources, plan, ready["answer"], ready["image"],
+                                              ready["sourceDocuments"])
+                    ready = response.model_dump()
+                else:
+                    await append_chat_history(req.session_id, req.question, ready["answer"])
+                ttft_ms = (time.perf_counter() - started) * 1000
+                yield sse_event("token", {"text": ready["answer"]})
+                yield sse_event("done", {**ready, "ttft_ms": round(ttft_ms, 1), "total_ms": round(ttft_ms, 1)})
+                return
+
+            think_filter = ThinkTagFilter()
+            raw_parts, source_docs = [], []
+
+            if plan.route == "RAG":
+                index = await resources.aget_index()
+                rag_chain = get_rag_chain(resources, index)
+                chunks = rag_chain.astream({"input": req.question, "chat_history": plan.chat_history},
+                                          filters=rag_filters(req.question))
+            else:
+                chunks = resources.llm.astream(build_direct_messages(plan, req.question),
+                                               config=langchain_config(plan.route.lower()))
+
+            async for chunk in chunks:
+                if isinstance(chunk, dict):
+                    if "context" in chunk:
+                        source_docs = chunk["context"]
+                    text = chunk.get("answer", "")
+                else:
+                    text = str(chunk.content)
+                if not text:
+                    continue
+                raw_parts.append(text)
+                visible = think_filter.feed(text)
+                if visible:
+                    if ttft_ms is None:
+                        ttft_ms = (time.perf_counter() - started) * 1000
+                    yield sse_event("token", {"text": visible})
+
+            rest = think_filter.flush()
+            if rest:
+                yield sse_event("token", {"text": rest})
+
+            raw_answer = remove_think_tags("".join(raw_parts))
+            if plan.route == "RAG":
+                final_answer, image_url, sources = finalize_rag_answer(raw_answer, source_docs)
+            elif plan.route == "SCAN":
+                final_answer, image_url, sources = raw_answer, "USE_LOCAL_IMAGE", scan_sources(plan)
+            else:
+                final_answer, image_url, sources = raw_answer, None, []
+
+            response = await finish_request(req, resources, plan, final_answer, image_url, sources)
+            total_ms = (time.perf_counter() - started) * 1000
+            logger.info("stream done", extra={"route": plan.route, "ttft_ms": round(ttft_ms or total_ms, 1),
+                                              "total_ms": round(total_ms, 1)})
+            yield sse_event("done", {**response.model_dump(), "ttft_ms": round(ttft_ms or total_ms, 1),
+                                     "total_ms": round(total_ms, 1)})
+        except Exception as e:
+            logger.exception("ask stream failed")
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,159 @@
+import re
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+from utils.utils import fold_accents
+
+# ==============================================================================
+# BỘ PHÂN LOẠI Ý ĐỊNH CỤC BỘ (KHÔNG GỌI LLM)
+# ==============================================================================
+# Thứ tự: luật regex + tra tên món FoodDB (micro giây) -> centroid embedding (vài chục ms)
+# -> chỉ khi vẫn không chắc mới gọi LLM classify_query trong end_points.
+
+class IntentResult(NamedTuple):
+    intent: str          # FOLLOWUP / NEW_TOPIC / CHITCHAT
+    confidence: float    # 0..1
+    source: str          # "rules" / "centroid" / "llm"
+
+
+# Đại từ / từ chỉ định -> đang hỏi tiếp món trước đó
+FOLLOWUP_PATTERN = re.compile(
+    r"\b(món này|món đó|món kia|món vừa|cái này|cái đó|nó|vừa ăn|vừa chụp|vừa rồi|"
+    r"ở trên|như vậy|thế thì|còn gì)\b"
+)
+FOLLOWUP_FOLDED = re.compile(r"\b(mon nay|mon do|mon kia|cai nay|cai do|vua an|vua chup)\b")
+
+# Câu hỏi chỉ có vị ngữ dinh dưỡng, không có chủ ngữ ("có béo không?", "bao nhiêu calo?")
+PREDICATE_PATTERN = re.compile(
+    r"\b(có|ăn|thì|vậy|không|nhiều|bao nhiêu|là|được|nên|béo|ngon|calo|calories|kcal|"
+    r"đạm|protein|chất béo|fat|giảm cân|tăng cân|healthy|tốt|hại|mập|sao|thế nào|gì|ạ|nhỉ|hả|à)\b"
+)
+
+CHITCHAT_PATTERN = re.compile(
+    r"\b(thời tiết|mưa|nắng|giá vàng|chứng khoán|cổ phiếu|chính trị|bóng đá|tin tức|lịch sử|"
+    r"xin chào|chào bạn|hello|hi|bạn là ai|ai tạo ra|cảm ơn|tạm biệt|code|lập trình|bitcoin)\b"
+)
+FOOD_PATTERN = re.compile(
+    r"\b(món|ăn|uống|nấu|calo|calories|kcal|dinh dưỡng|đạm|protein|chất béo|béo|công thức|"
+    r"thành phần|nguyên liệu|giảm cân|tăng cân|bữa|thực đơn|ngon|kho|xào|chiên|nướng|luộc|hấp)\b"
+)
+
+# Câu mẫu cho nearest-centroid (embedding đã nạp sẵn của AITeamVN/Vietnamese_Embedding)
+INTENT_PROTOTYPES = {
+    "FOLLOWUP": [
+        "Món này có béo không?",
+        "Nó bao nhiêu calo vậy?",
+        "Ăn cái này buổi tối được không?",
+        "Món vừa rồi có nhiều đạm không?",
+        "Vậy người tiểu đường ăn được không?",
+    ],
+    "NEW_TOPIC": [
+        "Phở bò bao nhiêu calo?",
+        "Cơm hến có những thành phần gì?",
+        "Cách nấu canh chua cá lóc",
+        "Bún bò Huế có tốt cho người giảm cân không?",
+        "Gỏi cuốn có nhiều protein không?",
+    ],
+    "CHITCHAT": [
+        "Thời tiết hôm nay thế nào?",
+        "Bạn là ai?",
+        "Giá vàng hôm nay bao nhiêu?",
+        "Kể cho tôi nghe tin bóng đá",
+        "Xin chào, cảm ơn bạn nhé",
+    ],
+}
+
+
+class LocalIntentClassifier:
+    def __init__(self, dish_names: Optional[List[str]] = None, embed_model=None):
+        self.embed_model = embed_model
+        self._centroids = None
+
+        # Tên món đã chuẩn hóa (bỏ dấu) -> regex 1 lần, ưu tiên tên dài trước
+        folded = sorted({fold_accents(n) for n in (dish_names or []) if n and len(fold_accents(n)) >= 3},
+                        key=len, reverse=True)
+        self._dish_pattern = (
+            re.compile(r"\b(" + "|".join(re.escape(n) for n in folded) + r")\b") if folded else None
+        )
+
+    # --- Tầng 1: luật + tra tên món ---
+    def find_dish(self, query: str) -> Optional[str]:
+        if self._dish_pattern is None:
+            return None
+        match = self._dish_pattern.search(fold_accents(query))
+        return match.group(1) if match else None
+
+    def classify_rules(self, query: str) -> IntentResult:
+        text = " ".join(query.lower().split())
+        folded = fold_accents(query)
+        has_deictic = bool(FOLLOWUP_PATTERN.search(text) or FOLLOWUP_FOLDED.search(folded))
+        has_food = bool(FOOD_PATTERN.search(text))
+        dish = self.find_dish(query)
+
+        if dish:
+            # "So với phở thì món này thế nào" -> có cả 2 tín hiệu, để tầng sau quyết định
+            return IntentResult("NEW_TOPIC", 0.6 if has_deictic else 0.95, "rules")
+        if has_deictic:
+            return IntentResult("FOLLOWUP", 0.9, "rules")
+        if CHITCHAT_PATTERN.search(text) and not has_food:
+            return IntentResult("CHITCHAT", 0.9, "rules")
+
+        # Bỏ hết từ vị ngữ/hư từ: còn lại >= 2 âm tiết thì có thể là tên món (kể cả món không có trong DB)
+        remainder = PREDICATE_PATTERN.sub(" ", re.sub(r"[^\w\s]", " ", text)).split()
+        if has_food and len(remainder) >= 2:
+            return IntentResult("NEW_TOPIC", 0.7, "rules")
+        if has_food and not remainder:
+            # Chỉ có vị ngữ ("có béo không?") -> chắc chắn hỏi tiếp món trước
+            return IntentResult("FOLLOWUP", 0.8, "rules")
+        if has_food:
+            # Còn 1 âm tiết lạ ("Phở bao nhiêu calo?" khi Phở không có trong FoodDB): có thể là tên món
+            # -> dưới ngưỡng, để centroid / LLM quyết định thay vì trả lời bằng context scan cũ
+            return IntentResult("FOLLOWUP", 0.5, "rules")
+        return IntentResult("FOLLOWUP", 0.3, "rules")
+
+    def needs_context(self, query: str):
+        """
+        Câu hỏi có cần lịch sử chat để hiểu không? -> (True/False, lý do).
+        Dùng để bỏ qua bước LLM viết lại câu hỏi (contextualize) khi câu đã độc lập.
+        """
+        text = " ".join(query.lower().split())
+        if self.find_dish(query):
+            return False, "dish"
+        if FOLLOWUP_PATTERN.search(text) or FOLLOWUP_FOLDED.search(fold_accents(query)):
+            return True, "deictic"
+        # Tỉnh lược chủ ngữ ("có béo không?", "bao nhiêu calo?") -> vẫn ám chỉ món trước đó
+        remainder = PREDICATE_PATTERN.sub(" ", re.sub(r"[^\w\s]", " ", text)).split()
+        if not remainder:
+            return True, "ellipsis"
+        return False, "standalone"
+
+    # --- Tầng 2: nearest-centroid bằng embedding ---
+    def _get_centroids(self):
+        if self._centroids is None:
+            labels, rows = [], []
+            for label, examples in INTENT_PROTOTYPES.items():
+                vecs = np.asarray(self.embed_model.get_text_embedding_batch(examples), dtype=np.float32)
+                vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+                centroid = vecs.mean(axis=0)
+                rows.append(centroid / np.linalg.norm(centroid))
+                labels.append(label)
+            self._centroids = (labels, np.stack(rows))
+        return self._centroids
+
+    def classify_centroid(self, query: str, prior: IntentResult) -> IntentResult:
+        """Blocking (embedding CPU) -> gọi qua run_blocking."""
+        if self.embed_model is None:
+            return prior
+        labels, centroids = self._get_centroids()
+        q = np.asarray(self.embed_model.get_query_embedding(query), dtype=np.float32)
+        sims = centroids @ (q / np.linalg.norm(q))
+        order = np.argsort(sims)[::-1]
+        best = labels[order[0]]
+        margin = float(sims[order[0]] - sims[order[1]])
+
+        # Margin cosine ~0.1 đã là tách biệt rõ với model này
+        confidence = min(0.99, 0.5 + margin * 4)
+        if best == prior.intent:
+            confidence = max(confidence, prior.confidence)
+        return IntentResult(best, confidence, "centroid")
@@ -1,107 +1,356 @@
-from typing import List, Any
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Any, Optional
 from langchain_core.retrievers import BaseRetriever
-from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
 from langchain_core.documents import Document
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
+from pydantic import PrivateAttr
+
+from api.prompt_builder import REWRITE_HISTORY_TOKENS, PromptBuilder, trim_history
+from config.sparse_index import reciprocal_rank_fusion
+from utils.concurrency import run_blocking
+from utils.embed_cache import normalize_query
+from utils.observability import get_logger, langchain_config, record_stage, span
+from utils.utils import remove_think_tags
+
+logger = get_logger("rag")
 
 # ==============================================================================
 # 1. CLASS WRAPPER (CẦU NỐI GIỮA LLAMAINDEX VÀ LANGCHAIN)
 # ==============================================================================
 class LlamaIndexRetrieverWrapper(BaseRetriever):
     index: Any 
+    # Cross-Encoder (config/rerank.py). None -> chỉ dùng vector search như cũ
+    reranker: Any = None
+    top_k: int = 3
+    # Stage 1 lấy dư N ứng viên, Stage 2 rerank lấy top_k
+    candidate_k: int = int(os.getenv("RERANK_CANDIDATES", "10"))
+    # Bỏ qua rerank khi kết quả vector đã "chắc chắn": score top1 đủ cao VÀ cách xa top2
+    skip_rerank_score: float = float(os.getenv("RERANK_SKIP_SCORE", "0.85"))
+    skip_rerank_margin: float = float(os.getenv("RERANK_SKIP_MARGIN", "0.1"))
+    # MetadataFilters mặc định; end_points truyền theo từng câu hỏi (rag_filters -> config.vector_store.nutrition_filters)
+    filters: Any = None
+    # api.dish_index.DishNameIndex: câu hỏi nêu đúng tên món -> trả node luôn, không embedding / vector search
+    dish_index: Any = None
+    # config.sparse_index.SparseIndex: BM25 chạy song song với dense, gộp bằng RRF. None -> chỉ dense
+    sparse_index: Any = None
+    rrf_k: int = int(os.getenv("RRF_K", "60"))
+    # Retriever LlamaIndex dựng sẵn theo (số ứng viên, filters) -> không gọi as_retriever mỗi câu hỏi
+    max_cached_retrievers: int = 32
+    _retrievers: Any = PrivateAttr(default_factory=OrderedDict)
+    _retrievers_lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @staticmethod
+    def _filters_key(filters):
+        if filters is None:
+            return None
+        return filters.model_dump_json() if hasattr(filters, "model_dump_json") else repr(filters)
+
+    def _get_index_retriever(self, fetch_k: int, filters):
+        key = (fetch_k, self._filters_key(filters))
+        # Đọc PrivateAttr 1 lần (mỗi lần truy cập qua pydantic tốn vài µs)
+        cache, lock = self._retrievers, self._retrievers_lock
+        with lock:
+            retriever = cache.get(key)
+            if retriever is not None:
+                cache.move_to_end(key)
+                return retriever
+        retriever = self.index.as_retriever(similarity_top_k=fetch_k, filters=filters)
+        with lock:
+            cache[key] = retriever
+            while len(cache) > self.max_cached_retrievers:
+                cache.popitem(last=False)
+        return retriever
+
+    def _is_decisive(self, nodes, top_k: int) -> bool:
+        if len(nodes) <= top_k:
+            return True
+        top, second = nodes[0].score or 0.0, nodes[1].score or 0.0
+        return top >= self.skip_rerank_score and (top - second) >= self.skip_rerank_margin
+
+    def _rerank(self, query: str, nodes):
+        # 1 forward pass duy nhất cho toàn bộ ứng viên
+        pairs = [(query, node.get_text()) for node in nodes]
+        scores = self.reranker.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+        return sorted(zip(nodes, map(float, scores)), key=lambda x: x[1], reverse=True)
 
     def _get_relevant_documents(
-        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun,
+        top_k: Optional[int] = None, filters: Any = None,
     ) -> List[Document]:
         """
         Hàm này nhận câu hỏi (query), gọi LlamaIndex để tìm kiếm,
         sau đó chuyển đổi kết quả thành định dạng Document của LangChain.
+        top_k / filters truyền lúc gọi (retriever.ainvoke(q, top_k=5, filters=...)) ghi đè mặc định.
         """
-        # Tạo retriever từ index gốc
-        retriever = self.index.as_retriever(similarity_top_k=3)
-        
-        # Thực hiện truy vấn
-        nodes = retriever.retrieve(query)
-        
+        top_k = top_k or self.top_k
+        filters = filters if filters is not None else self.filters
+
+        # Stage 0: tra tên món (bỏ qua khi có filters vì node tra được chưa chắc thỏa filter)
+        if self.dish_index is not None and filters is None:
+            with span("dish_lookup") as lookup:
+                matches = self.dish_index.lookup(query, limit=top_k)
+            if matches:
+                logger.info("retrieve: dish-name hit -> bỏ qua vector search", extra={
+                    "method": matches[0].method, "dishes": [m.dish_name for m in matches],
+                    "lookup_us": round(lookup.ms * 1000),
+                })
+                return self._to_documents(
+                    [(m.node, {"dish_match": m.method, "dish_match_score": m.score}) for m in matches]
+                )
+
+        use_reranker = self.reranker is not None
+        # BM25 bỏ qua khi có filters (như tra tên món: node khớp từ khóa chưa chắc thỏa filter)
+        use_sparse = self.sparse_index is not None and filters is None
+        fetch_k = max(self.candidate_k, top_k) if use_reranker or use_sparse else top_k
+
+        # Stage 1: Vector search (lấy dư ứng viên nếu có reranker / BM25 để gộp)
+        with span("vector_search") as vector:
+            nodes = self._get_index_retriever(fetch_k, filters).retrieve(query)
+        decisive = self._is_decisive(nodes, top_k)
+
+        # Stage 1b: BM25 + Reciprocal Rank Fusion (thứ hạng, không cần chuẩn hóa điểm 2 bên)
+        lexical = []
+        if use_sparse:
+            with span("sparse_search") as sparse:
+                lexical = [node for node, _ in self.sparse_index.search(query, fetch_k)]
+            # Dense chỉ "chắc chắn" khi BM25 không chỉ ra món khác ở hạng 1
+            decisive = decisive and (not lexical or not nodes or lexical[0].node_id == nodes[0].node_id)
+            nodes = [node for node, _ in reciprocal_rank_fusion([nodes, lexical], k=self.rrf_k)][:fetch_k]
+
+        # Stage 2: Cross-Encoder rerank (bỏ qua nếu top vector score đã quyết định)
+        skipped = not use_reranker or decisive
+        if skipped:
+            ranked = [(node, None) for node in nodes[:top_k]]
+        else:
+            with span("rerank") as rerank:
+                ranked = self._rerank(query, nodes)[:top_k]
+
+        logger.info("retrieve: vector search", extra={
+            "vector_ms": round(vector.ms, 1), "candidates": len(nodes), "fetch_k": fetch_k,
+            "sparse_us": round(sparse.ms * 1000) if use_sparse else None, "sparse_hits": len(lexical),
+            "rerank_ms": None if skipped else round(rerank.ms, 1),
+        })
+        return self._to_documents(
+            [(node, {"rerank_score": score} if score is not None else {}) for node, score in ranked]
+        )
+
+    @staticmethod
+    def _to_documents(ranked) -> List[Document]:
         # Chuyển đổi Node (LlamaIndex) -> Document (LangChain)
         docs = []
-        for node in nodes:
+        for node, extra in ranked:
             # Lấy nội dung text
             content = node.get_text()
             
-            # Lấy metadata (tên món, ảnh, nguồn...)
-            metadata = node.metadata if node.metadata else {}
+            # Lấy metadata (tên món, ảnh, nguồn...) - copy để không sửa node gốc trong index
+            metadata = dict(node.metadata) if node.metadata else {}
+            metadata.update(extra)
             
             # Đóng gói thành Document
             docs.append(Document(page_content=content, metadata=metadata))
             
         return docs
 
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun,
+        top_k: Optional[int] = None, filters: Any = None,
+    ) -> List[Document]:
+        """
+        Bản async: LlamaIndex retrieve + embedding CPU là code đồng bộ,
+        nên đẩy sang thread pool giới hạn thay vì chạy thẳng trên event loop.
+        """
+        return await run_blocking(
+            self._get_relevant_documents, query, run_manager=run_manager.get_sync(),
+            top_k=top_k, filters=filters,
+        )
+
 # ==============================================================================
-# 2. HÀM TẠO CHAIN RAG (DÙNG PROMPT V14 - CHUẨN RAG)
+# 2. PROMPT: CÔ LẬP CÂU HỎI (CONTEXTUALIZE) + TRẢ LỜI (V14 - RAG CHUẨN MỰC CHO FOODDB)
 # ==============================================================================
-def get_conversational_rag_chain(llm, index):
-    # Bước 1: Khởi tạo Retriever
-    retriever = LlamaIndexRetrieverWrapper(index=index)
-    
-    # Bước 2: Prompt để "Cô lập câu hỏi" (Contextualize)
-    # Giúp AI hiểu câu hỏi dựa trên lịch sử (ví dụ: "Nó bao nhiêu calo?" -> "Phở bao nhiêu calo?")
-    contextualize_q_system_prompt = (
-        "Given a chat history and the latest user question "
-        "which might reference context in the chat history, "
-        "formulate a standalone question which can be understood "
-        "without the chat history. Do NOT answer the question, "
-        "just reformulate it if needed and otherwise return it as is."
-    )
-    
-    contextualize_q_prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", contextualize_q_system_prompt),
-            ("placeholder", "{chat_history}"),
-            ("human", "{input}"),
-        ]
-    )
-    
-    # Tạo History Aware Retriever
-    history_aware_retriever = create_history_aware_retriever(
-        llm, retriever, contextualize_q_prompt
-    )
-    
-    # Bước 3: Prompt Trả lời (V14 - RAG CHUẨN MỰC CHO FOODDB)
-    qa_system_prompt = (
-        "Bạn là Lucfin, chuyên gia dinh dưỡng thực tế. "
-        "Dưới đây là tài liệu tham khảo (Context) từ FoodDB:\n"
-        "---------------------\n"
-        "{context}\n"
-        "---------------------\n\n"
-        
-        "QUY TRÌNH TRẢ LỜI:"
-        "1. KIỂM TRA THỰC TẾ (REALITY CHECK - QUAN TRỌNG NHẤT):"
-        "   - Trước khi trả lời, hãy tự hỏi: Món này có thật và ăn được không?"
-        "   - Nếu món ăn là HƯ CẤU, PHI LÝ hoặc KHÔNG THỂ ĂN ĐƯỢC (Ví dụ: 'Trứng khủng long', 'Thịt rồng', 'Canh nước mắt cá sấu', 'Bê tông xào', 'Gạch nung chấm mắm')..."
-        "   -> TỪ CHỐI TRẢ LỜI NGAY. Nói: 'Xin lỗi, món [Tên món] không phải là thực phẩm thực tế, Lucfin không thể phân tích.'"
-        "   -> TUYỆT ĐỐI KHÔNG BỊA ra dinh dưỡng cho các món hư cấu này."
-        "   -> TUYỆT ĐỐI KHÔNG dùng bảng (Markdown Table) với các ký tự '|' và '---'."
-        
-        "2. XỬ LÝ DỰA TRÊN CONTEXT:"
-        "   - Nếu là món ăn thật (Ví dụ: 'Phở', 'Cơm hến') -> Ưu tiên dùng thông tin trong Context để trả lời."
-        
-        "3. XỬ LÝ KHI THIẾU DỮ LIỆU (FALLBACK):"
-        "   - Nếu là món thật nhưng không có trong Context -> Được phép dùng kiến thức chuyên gia để ước lượng."
-        "   - Nếu hỏi CÔNG THỨC mà không có trong Context -> Báo chưa có dữ liệu."
-    )
+# Giúp AI hiểu câu hỏi dựa trên lịch sử (ví dụ: "Nó bao nhiêu calo?" -> "Phở bao nhiêu calo?")
+CONTEXTUALIZE_Q_SYSTEM_PROMPT = (
+    "Given a chat history and the latest user question "
+    "which might reference context in the chat history, "
+    "formulate a standalone question which can be understood "
+    "without the chat history. Do NOT answer the question, "
+    "just reformulate it if needed and otherwise return it as is."
+)
+
+# System prompt TĨNH (không chứa {context}) -> giống hệt từng byte giữa các request, provider cache được
+# prefix; context + câu hỏi nằm ở tin nhắn cuối (QA_HUMAN_TEMPLATE), ghép theo ngân sách token (api/prompt_builder.py)
+QA_SYSTEM_PROMPT = (
+    "Bạn là Lucfin, chuyên gia dinh dưỡng thực tế. "
+    "Tài liệu tham khảo (Context) từ FoodDB nằm ở đầu tin nhắn cuối của người dùng.\n\n"
     
-    qa_prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", qa_system_prompt),
-            ("placeholder", "{chat_history}"),
-            ("human", "{input}"),
-        ]
-    )
+    "QUY TRÌNH TRẢ LỜI:"
+    "1. KIỂM TRA THỰC TẾ (REALITY CHECK - QUAN TRỌNG NHẤT):"
+    "   - Trước khi trả lời, hãy tự hỏi: Món này có thật và ăn được không?"
+    "   - Nếu món ăn là HƯ CẤU, PHI LÝ hoặc KHÔNG THỂ ĂN ĐƯỢC (Ví dụ: 'Trứng khủng long', 'Thịt rồng', 'Canh nước mắt cá sấu', 'Bê tông xào', 'Gạch nung chấm mắm')..."
+    "   -> TỪ CHỐI TRẢ LỜI NGAY. Nói: 'Xin lỗi, món [Tên món] không phải là thực phẩm thực tế, Lucfin không thể phân tích.'"
+    "   -> TUYỆT ĐỐI KHÔNG BỊA ra dinh dưỡng cho các món hư cấu này."
+    "   -> TUYỆT ĐỐI KHÔNG dùng bảng (Markdown Table) với các ký tự '|' và '---'."
     
-    question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
-    rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
+    "2. XỬ LÝ DỰA TRÊN CONTEXT:"
+    "   - Nếu là món ăn thật (Ví dụ: 'Phở', 'Cơm hến') -> Ưu tiên dùng thông tin trong Context để trả lời."
     
-    return rag_chain
\ No newline at end of file
+    "3. XỬ LÝ KHI THIẾU DỮ LIỆU (FALLBACK):"
+    "   - Nếu là món thật nhưng không có trong Context -> Được phép dùng kiến thức chuyên gia để ước lượng."
+    "   - Nếu hỏi CÔNG THỨC mà không có trong Context -> Báo chưa có dữ liệu."
+)
+
+QA_HUMAN_TEMPLATE = (
+    "Context:\n"
+    "---------------------\n"
+    "{context}\n"
+    "---------------------\n\n"
+    "{input}"
+)
+
+# ==============================================================================
+# 3. CHAIN RAG HỘI THOẠI (THAY create_history_aware_retriever + create_retrieval_chain)
+# ==============================================================================
+class ConversationalRAGChain:
+    """
+    Contextualize -> Retrieve -> Answer, nhưng chỉ gọi LLM viết lại câu hỏi khi thật sự cần:
+      - Không có lịch sử chat                      -> dùng nguyên câu hỏi
+      - Câu hỏi nêu tên món có trong FoodDB         -> đã độc lập
+      - Không có đại từ / từ chỉ định / tỉnh lược    -> đã độc lập
+    Khi cần viết lại: chạy song song retrieval "đoán trước" trên câu gốc; nếu câu viết lại
+    trùng câu gốc thì dùng luôn kết quả đó thay vì retrieve lần 2.
+    Kết quả giữ đúng dạng của create_retrieval_chain: {"input", "chat_history", "context", "answer"}
+    + "standalone_question" và "timings" (ms từng bước).
+    """
+
+    def __init__(self, llm, retriever, classifier=None, speculative=True):
+        self.retriever = retriever
+        self.classifier = classifier
+        self.speculative = speculative
+        contextualize_q_prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", CONTEXTUALIZE_Q_SYSTEM_PROMPT),
+                ("placeholder", "{chat_history}"),
+                ("human", "{input}"),
+            ]
+        )
+        qa_prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", QA_SYSTEM_PROMPT),
+                ("placeholder", "{chat_history}"),
+                ("human", QA_HUMAN_TEMPLATE),
+            ]
+        )
+        self.prompt_builder = PromptBuilder(QA_SYSTEM_PROMPT, QA_HUMAN_TEMPLATE)
+        self.rewrite_chain = contextualize_q_prompt | llm | StrOutputParser()
+        self.answer_chain = qa_prompt | llm | StrOutputParser()
+
+    def needs_rewrite(self, question: str, chat_history) -> tuple:
+        if not chat_history:
+            return False, "no_history"
+        if self.classifier is None:
+            return True, "no_classifier"
+        return self.classifier.needs_context(question)
+
+    async def _rewrite(self, question: str, chat_history) -> str:
+        # Viết lại câu hỏi chỉ cần vài lượt gần nhất
+        chat_history, _ = trim_history(chat_history, REWRITE_HISTORY_TOKENS, self.prompt_builder.counter)
+        raw = await self.rewrite_chain.ainvoke({"input": question, "chat_history": chat_history},
+                                               config=langchain_config("contextualize"))
+        return remove_think_tags(str(raw)).strip() or question
+
+    async def prepare(self, inputs: dict, top_k: Optional[int] = None, filters: Any = None) -> dict:
+        """
+        Bước Contextualize + Retrieve. Trả về dict đầu vào cho bước trả lời.
+        top_k / filters là tham số theo từng request -> chain dựng 1 lần vẫn dùng chung được.
+        """
+        question, chat_history = inputs["input"], inputs.get("chat_history") or []
+        search_kwargs = {k: v for k, v in (("top_k", top_k), ("filters", filters)) if v is not None}
+        # request_id đi theo metadata vào callback của retriever (LlamaIndexRetrieverWrapper)
+        search_kwargs["config"] = langchain_config("retrieve")
+        timings = {}
+        t0 = time.perf_counter()
+        rewrite, reason = self.needs_rewrite(question, chat_history)
+
+        if not rewrite:
+            standalone = question
+            docs = await self.retriever.ainvoke(question, **search_kwargs)
+            timings["contextualize_ms"] = 0.0
+            timings["retrieve_ms"] = (time.perf_counter() - t0) * 1000
+        else:
+            speculative = asyncio.create_task(self.retriever.ainvoke(question, **search_kwargs)) if self.speculative else None
+            try:
+                standalone = await self._rewrite(question, chat_history)
+            except BaseException:
+                if speculative is not None:
+                    speculative.cancel()
+                raise
+            t1 = time.perf_counter()
+            timings["contextualize_ms"] = (t1 - t0) * 1000
+            if speculative is not None and normalize_query(standalone) == normalize_query(question):
+                reason += "+speculative_hit"
+                docs = await speculative
+            else:
+                if speculative is not None:
+                    speculative.cancel()
+                docs = await self.retriever.ainvoke(standalone, **search_kwargs)
+            timings["retrieve_ms"] = (time.perf_counter() - t1) * 1000
+
+        if rewrite:
+            record_stage("contextualize", timings["contextualize_ms"])
+        record_stage("retrieve", timings["retrieve_ms"])
+        logger.info("contextualize + retrieve", extra={
+            "rewrite": rewrite, "rewrite_reason": reason, "contextualize_ms": round(timings["contextualize_ms"], 1),
+            "retrieve_ms": round(timings["retrieve_ms"], 1), "docs": len(docs),
+            "standalone_question": standalone if standalone != question else None,
+        })
+        return {
+            "input": question, "chat_history": chat_history, "standalone_question": standalone,
+            "context": docs, "rewrite_reason": reason, "timings": timings,
+        }
+
+    def _answer_inputs(self, prepared: dict) -> dict:
+        # Context chỉ gồm trường hợp với loại câu hỏi + lịch sử cắt cho vừa PROMPT_TOKEN_BUDGET
+        plan = self.prompt_builder.build(prepared["input"], prepared["standalone_question"],
+                                         prepared["chat_history"], prepared["context"])
+        logger.info("prompt tokens", extra={"route": "RAG", **plan.stats})
+        return {"input": prepared["input"], "chat_history": plan.chat_history, "context": plan.context}
+
+    async def ainvoke(self, inputs: dict, top_k: Optional[int] = None, filters: Any = None) -> dict:
+        prepared = await self.prepare(inputs, top_k=top_k, filters=filters)
+        with span("generate") as generate:
+            answer = await self.answer_chain.ainvoke(self._answer_inputs(prepared), config=langchain_config("generate"))
+        prepared["timings"]["generate_ms"] = generate.ms
+        return {**prepared, "answer": answer}
+
+    def invoke(self, inputs: dict, top_k: Optional[int] = None, filters: Any = None) -> dict:
+        """Bản đồng bộ cho script (evaluation); server luôn dùng ainvoke / astream."""
+        return asyncio.run(self.ainvoke(inputs, top_k=top_k, filters=filters))
+
+    async def astream(self, inputs: dict, top_k: Optional[int] = None, filters: Any = None):
+        """Yield {"context": docs} trước, sau đó từng {"answer": chunk}, cuối cùng {"timings": ...}."""
+        prepared = await self.prepare(inputs, top_k=top_k, filters=filters)
+        yield {"context": prepared["context"], "standalone_question": prepared["standalone_question"]}
+        with span("generate") as generate:
+            async for chunk in self.answer_chain.astream(self._answer_inputs(prepared),
+                                                         config=langchain_config("generate")):
+                yield {"answer": chunk}
+        prepared["timings"]["generate_ms"] = generate.ms
+        yield {"timings": prepared["timings"]}
+
+
+def get_conversational_rag_chain(llm, index, reranker=None, filters=None, classifier=None, dish_index=None,
+                                 sparse_index=None):
+    """Dựng chain (prompt, retriever, parser). Tốn chi phí -> gọi 1 lần rồi dùng lại (AppResources.get_rag_chain)."""
+    # Retriever: tra tên món -> (nếu không khớp) vector search + BM25 (RRF) -> Cross-Encoder rerank
+    retriever = LlamaIndexRetrieverWrapper(index=index, reranker=reranker, filters=filters, dish_index=dish_index,
+                                           sparse_index=sparse_index)
+    # classifier (LocalIntentClassifier) biết tên món FoodDB -> quyết định có cần viết lại câu hỏi
+    return ConversationalRAGChain(llm, retriever, classifier=classifier)
@@ -0,0 +1,257 @@
+import re
+from types import SimpleNamespace
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from api.dish_index import DishNameIndex
+from utils.utils import fold_accents
+
+# ==============================================================================
+# BẢNG DINH DƯỠNG DẠNG CỘT + BỘ PARSE CÂU HỎI SỐ (KHÔNG GỌI LLM)
+# ==============================================================================
+# Cùng metadata mà build_index.py lưu vào node (dish_name, calories, protein, fat, image_link).
+# Trả lời trực tiếp:
+#   - tra cứu : "Phở bò bao nhiêu calo?", "cơm hến có bao nhiêu đạm và chất béo"
+#   - lọc/xếp : "món nào dưới 300 calo nhiều đạm", "top 3 món ít béo nhất", "món từ 20 đến 30g protein"
+# Câu mở (cách nấu, có nên ăn, vì sao...) -> None -> end_points dùng RAG như cũ; điều kiện số trong câu
+# (parse_nutrition_conditions) vẫn được lọc ngay trong vector store.
+
+NUTRIENTS = ("calories", "protein", "fat")
+# (tên hiển thị, đơn vị)
+LABELS = {"calories": ("năng lượng", "kcal"), "protein": ("đạm", "g"), "fat": ("chất béo", "g")}
+
+# Tất cả regex chạy trên text đã bỏ dấu (fold_accents) -> người dùng gõ không dấu vẫn khớp
+_NUTRIENT_WORDS = [
+    ("calories", r"calories|calo|kcal|cal|nang luong"),
+    ("protein", r"protein|chat dam|dam"),
+    ("fat", r"chat beo|beo|fat|lipid"),
+]
+NUTRIENT_PATTERN = re.compile(r"\b(" + "|".join(w for _, w in _NUTRIENT_WORDS) + r")\b")
+_NUTRIENT_OF = [(name, re.compile(r"^(" + words + r")$")) for name, words in _NUTRIENT_WORDS]
+
+_NUMBER = r"(\d+(?:[.,]\d+)?)"
+_UNIT = r"\s*(kcal|calories|calo|cal|gram|gam|g)?\b"
+COMPARE_PATTERN = re.compile(
+    r"(duoi|it hon|nho hon|khong qua|toi da|tren|nhieu hon|lon hon|cao hon|it nhat|toi thieu|<=|>=|<|>)\s*"
+    + _NUMBER + _UNIT
+)
+RANGE_PATTERN = re.compile(r"(?:tu|trong khoang|khoang)\s*" + _NUMBER + _UNIT + r"\s*(?:den|toi|-)\s*" + _NUMBER + _UNIT)
+SORT_PATTERN = re.compile(
+    r"\b(?<!bao )(nhieu|giau|cao|it|thap|ngheo)\s+(" + "|".join(w for _, w in _NUTRIENT_WORDS) + r")\b"
+)
+LIST_PATTERN = re.compile(r"\b(mon nao|nhung mon|cac mon|mon gi|goi y|liet ke|top \d+|\d+ mon)\b")
+# "món từ 20 đến 30g protein": chỉ chữ "món" + điều kiện số, không nêu tên món cụ thể ("món này" = món đang nói)
+BARE_LIST_PATTERN = re.compile(r"\bmon\b(?!\s+(nay|do|kia|vua|ay)\b)")
+# Hỏi số lượng ("có béo không?" là câu đánh giá -> để LLM trả lời)
+LOOKUP_PATTERN = re.compile(r"\b(bao nhieu|bn|may|ham luong|dinh duong)\b")
+LIMIT_PATTERN = re.compile(r"\b(?:top\s*(\d+)|(\d+)\s*mon)\b")
+# Câu hỏi mở -> cần LLM giải thích, không trả lời bằng bảng
+OPEN_ENDED_PATTERN = re.compile(
+    r"\b(tai sao|vi sao|cach|cong thuc|nau|so sanh|nen|co tot|tot khong|giam can|tang can|an kieng|"
+    r"tieu duong|huyet ap|bau|an toi|thay the|ngon)\b"
+)
+
+_STRICT = {"duoi": "<", "it hon": "<", "nho hon": "<", "<": "<", "tren": ">", "nhieu hon": ">",
+           "lon hon": ">", "cao hon": ">", ">": ">"}
+_INCLUSIVE = {"khong qua": "<=", "toi da": "<=", "<=": "<=", "it nhat": ">=", "toi thieu": ">=", ">=": ">="}
+
+
+class Condition(NamedTuple):
+    nutrient: str
+    op: str          # < <= > >=
+    value: float
+
+
+class NutritionQuery(NamedTuple):
+    kind: str                                 # "lookup" / "list"
+    nutrients: Tuple[str, ...]                # nutrient được hỏi / hiển thị
+    conditions: Tuple[Condition, ...] = ()
+    sort: Optional[Tuple[str, bool]] = None   # (nutrient, giảm dần?)
+    limit: int = 5
+
+
+def _nutrient_of(word: Optional[str]) -> Optional[str]:
+    if not word:
+        return None
+    if word in ("kcal", "calories", "calo", "cal"):
+        return "calories"
+    for name, pattern in _NUTRIENT_OF:
+        if pattern.match(word):
+            return name
+    return None
+
+
+def _nearest_nutrient(text: str, start: int, end: int) -> Optional[str]:
+    """Chất dinh dưỡng gần đoạn số nhất: ưu tiên ngay sau ("dưới 20g đạm"), rồi ngay trước ("đạm dưới 20g")."""
+    after = NUTRIENT_PATTERN.match(text, end + (1 if text[end:end + 1] == " " else 0))
+    if after:
+        return _nutrient_of(after.group(1))
+    before = list(NUTRIENT_PATTERN.finditer(text, max(0, start - 20), start))
+    return _nutrient_of(before[-1].group(1)) if before else None
+
+
+def _number(raw: str) -> float:
+    return float(raw.replace(",", "."))
+
+
+def _normalize(question: str) -> str:
+    text = fold_accents(question)
+    text = re.sub(r"[^\w\s<>=.,-]", " ", text)
+    return " ".join(text.split())
+
+
+def _parse_conditions(text: str) -> Tuple[Optional[List[Condition]], str]:
+    """(điều kiện số, phần text còn lại). Có số mà không rõ chất dinh dưỡng -> (None, text)."""
+    # Khoảng "từ A đến B" trước, rồi so sánh đơn
+    conditions = []
+    for match in RANGE_PATTERN.finditer(text):
+        nutrient = (_nutrient_of(match.group(2)) or _nutrient_of(match.group(4))
+                    or _nearest_nutrient(text, match.start(), match.end()))
+        if nutrient is None:
+            return None, text
+        conditions += [Condition(nutrient, ">=", _number(match.group(1))),
+                       Condition(nutrient, "<=", _number(match.group(3)))]
+    remaining = RANGE_PATTERN.sub(" ", text)
+    for match in COMPARE_PATTERN.finditer(remaining):
+        unit_nutrient = _nutrient_of(match.group(3))
+        nutrient = unit_nutrient or _nearest_nutrient(remaining, match.start(), match.end())
+        if nutrient is None:
+            return None, text
+        op = _STRICT.get(match.group(1)) or _INCLUSIVE[match.group(1)]
+        conditions.append(Condition(nutrient, op, _number(match.group(2))))
+    return conditions, COMPARE_PATTERN.sub(" ", remaining)
+
+
+def parse_nutrition_conditions(question: str) -> Tuple[Condition, ...]:
+    """
+    Chỉ các điều kiện số, kể cả trong câu hỏi mở đi RAG ("món nào dưới 300 calo tốt cho người tiểu đường?")
+    -> end_points đẩy xuống vector store thành MetadataFilters (config.vector_store.nutrition_filters).
+    """
+    conditions, _ = _parse_conditions(_normalize(question))
+    return tuple(conditions or ())
+
+
+def parse_nutrition_query(question: str, has_dish: bool) -> Optional[NutritionQuery]:
+    """Parse câu hỏi số theo mẫu phổ biến. Không chắc chắn -> None (để RAG xử lý)."""
+    text = _normalize(question)
+    if OPEN_ENDED_PATTERN.search(text):
+        return None
+
+    # 1. Điều kiện số
+    conditions, remaining = _parse_conditions(text)
+    if conditions is None:
+        return None
+
+    # 2. Sắp xếp: "nhiều đạm", "ít calo nhất"
+    sort = None
+    sort_match = SORT_PATTERN.search(remaining)
+    if sort_match:
+        sort = (_nutrient_of(sort_match.group(2)), sort_match.group(1) in ("nhieu", "giau", "cao"))
+
+    mentioned = tuple(dict.fromkeys(_nutrient_of(m.group(1)) for m in NUTRIENT_PATTERN.finditer(text)))
+    is_list = bool(LIST_PATTERN.search(text)) or bool(conditions and not has_dish and BARE_LIST_PATTERN.search(text))
+
+    if is_list and (conditions or sort):
+        limit_match = LIMIT_PATTERN.search(text)
+        if limit_match:
+            limit = int(limit_match.group(1) or limit_match.group(2))
+        else:
+            limit = 1 if re.search(r"\bnhat\b", text) else 5
+        shown = tuple(dict.fromkeys([c.nutrient for c in conditions] + ([sort[0]] if sort else [])))
+        return NutritionQuery("list", shown, tuple(conditions), sort, max(1, min(limit, 20)))
+
+    if has_dish and not is_list and not conditions and not sort and LOOKUP_PATTERN.search(text):
+        if mentioned:
+            return NutritionQuery("lookup", mentioned)
+        if re.search(r"\bdinh duong\b", text):
+            return NutritionQuery("lookup", NUTRIENTS)
+    return None
+
+
+class NutritionTable:
+    def __init__(self, metadata: List[dict], dish_index: Optional[DishNameIndex] = None):
+        rows = [m for m in metadata if m.get("dish_name")]
+        self.names = np.array([str(m["dish_name"]) for m in rows], dtype=object)
+        self.images = [m.get("image_link") or "" for m in rows]
+        # 0 = thiếu dữ liệu (build_index ghi 0 khi ô CSV trống) -> NaN để không lọt vào lọc / xếp hạng
+        self.values = {
+            nutrient: np.array([float(m.get(nutrient) or 0) or np.nan for m in rows], dtype=np.float32)
+            for nutrient in NUTRIENTS
+        }
+        self._row_of = {fold_accents(name): i for i, name in reversed(list(enumerate(self.names)))}
+        self.dish_index = dish_index or DishNameIndex(
+            [SimpleNamespace(metadata={"dish_name": name}) for name in self.names]
+        )
+
+    def __len__(self):
+        return len(self.names)
+
+    def _format(self, row: int, nutrients) -> str:
+        parts = [f"{self.values[n][row]:.0f} {LABELS[n][1]} {LABELS[n][0]}".replace("kcal năng lượng", "kcal")
+                 for n in nutrients if not np.isnan(self.values[n][row])]
+        return ", ".join(parts)
+
+    def _lookup(self, query: NutritionQuery, matches) -> Optional[dict]:
+        rows = [self._row_of.get(fold_accents(m.dish_name)) for m in matches]
+        rows = [r for r in rows if r is not None]
+        # Thiếu số liệu cho món được hỏi -> để RAG / LLM ước lượng
+        if not rows or any(np.isnan(self.values[n][r]) for r in rows for n in query.nutrients):
+            return None
+        if len(rows) == 1:
+            answer = f"Theo FoodDB, 1 phần **{self.names[rows[0]]}** có khoảng {self._format(rows[0], query.nutrients)}."
+        else:
+            answer = "Theo FoodDB (1 phần ăn):\n" + "\n".join(
+                f"- **{self.names[r]}**: khoảng {self._format(r, query.nutrients)}" for r in rows
+            )
+        return {"answer": answer, "image": self.images[rows[0]] or None,
+                "sourceDocuments": [str(self.names[r]) for r in rows]}
+
+    def _list(self, query: NutritionQuery) -> dict:
+        mask = np.ones(len(self.names), dtype=bool)
+        for cond in query.conditions:
+            column = self.values[cond.nutrient]
+            with np.errstate(invalid="ignore"):
+                mask &= {"<": column < cond.value, "<=": column <= cond.value,
+                         ">": column > cond.value, ">=": column >= cond.value}[cond.op]
+        if query.sort:
+            mask &= ~np.isnan(self.values[query.sort[0]])
+        rows = np.flatnonzero(mask)
+
+        described = [f"{LABELS[c.nutrient][0]} {c.op} {c.value:g} {LABELS[c.nutrient][1]}" for c in query.conditions]
+        if query.sort:
+            described.append(f"{'nhiều' if query.sort[1] else 'ít'} {LABELS[query.sort[0]][0]} nhất")
+        described = ", ".join(described)
+        if rows.size == 0:
+            return {"answer": f"Không có món nào trong FoodDB thỏa điều kiện: {described}.",
+                    "image": None, "sourceDocuments": []}
+
+        if query.sort:
+            column = self.values[query.sort[0]][rows]
+            key = -column if query.sort[1] else column
+            if rows.size > query.limit:
+                top = np.argpartition(key, query.limit - 1)[: query.limit]
+                rows, key = rows[top], key[top]
+            rows = rows[np.argsort(key, kind="stable")]
+        rows = rows[: query.limit]
+
+        lines = [f"{i}. **{self.names[r]}**: {self._format(r, query.nutrients or NUTRIENTS)}"
+                 for i, r in enumerate(rows, 1)]
+        answer = f"Các món trong FoodDB ({described}):\n" + "\n".join(lines)
+        return {"answer": answer, "image": self.images[rows[0]] or None,
+                "sourceDocuments": [str(self.names[r]) for r in rows]}
+
+    def answer_for(self, question: str, matches) -> Optional[dict]:
+        """Câu hỏi số không nêu tên món ("món này bao nhiêu calo?") về các món đã biết (vd. món vừa scan)."""
+        query = parse_nutrition_query(question, has_dish=True)
+        if query is None or query.kind != "lookup" or not matches:
+            return None
+        return self._lookup(query, matches)
+
+    def answer(self, question: str) -> Optional[dict]:
+        """Dict ChatMessageResponse (answer / image / sourceDocuments) hoặc None nếu cần RAG."""
+        matches = self.dish_index.lookup(question)
+        query = parse_nutrition_query(question, bool(matches))
+        if query is None:
+            return None
+        return self._lookup(query, matches) if query.kind == "lookup" else self._list(query)
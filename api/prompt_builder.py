@@ -0,0 +1,212 @@
+import os
+import re
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage
+
+from api.nutrition_table import NUTRIENT_PATTERN
+from utils.observability import get_logger
+from utils.utils import fold_accents
+
+logger = get_logger("prompt")
+
+# ==============================================================================
+# GHÉP PROMPT THEO NGÂN SÁCH TOKEN
+# ==============================================================================
+# Token đầu vào chiếm phần lớn độ trễ + chi phí Groq. Mỗi lần gọi LLM trả lời:
+#   1. System prompt TĨNH (giống hệt từng byte giữa các request) đứng đầu -> provider cache được prefix
+#   2. Context chỉ gồm các trường node hợp với loại câu hỏi (hỏi calo -> chỉ số dinh dưỡng)
+#   3. Lịch sử chat: câu trả lời cũ bị cắt ngắn, bỏ lượt cũ nhất cho tới khi vừa ngân sách
+# Số token đếm bằng tokenizer cục bộ (tiktoken); không có file BPE (máy offline, chưa đặt
+# TIKTOKEN_CACHE_DIR) -> ước lượng ~3 ký tự / token.
+# o200k_base (hay chars/3) chỉ XẤP XỈ tokenizer của Qwen trên Groq, tiếng Việt có thể lệch vài chục %
+# -> PROMPT_TOKEN_BUDGET phải chừa biên an toàn so với giới hạn thật (prompt_tokens Groq trả về là số đúng).
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "2000"))
+# Câu trả lời cũ trong lịch sử chỉ giữ phần đầu (thường đã nêu tên món + ý chính)
+HISTORY_ANSWER_TOKENS = int(os.getenv("HISTORY_ANSWER_TOKENS", "80"))
+# Lịch sử gửi kèm bước viết lại câu hỏi (contextualize)
+REWRITE_HISTORY_TOKENS = int(os.getenv("REWRITE_HISTORY_TOKENS", "400"))
+PROMPT_TOKENIZER = os.getenv("PROMPT_TOKENIZER", "o200k_base")
+# Phụ phí mỗi message của chat template (role + token phân cách)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class TokenCounter:
+    def __init__(self, encoding_name: str = PROMPT_TOKENIZER):
+        self.encoding = None
+        self.name = "chars/3"
+        try:
+            import tiktoken
+
+            self.encoding = tiktoken.get_encoding(encoding_name)
+            self.name = encoding_name
+        except Exception as e:
+            logger.warning("không nạp được tokenizer -> ước lượng theo số ký tự",
+                           extra={"tokenizer": encoding_name, "error": str(e)})
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return max(1, len(text) // 3)
+
+    def count_messages(self, messages: List[BaseMessage]) -> int:
+        return sum(self.count(str(m.content)) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cắt còn tối đa max_tokens token (thêm '…' nếu bị cắt)."""
+        if self.count(text) <= max_tokens:
+            return text
+        if self.encoding is not None:
+            clipped = self.encoding.decode(self.encoding.encode(text, disallowed_special=())[:max_tokens])
+        else:
+            clipped = text[:max_tokens * 3]
+        return clipped.rstrip() + "…"
+
+
+_counter: Optional[TokenCounter] = None
+_counter_lock = threading.Lock()
+
+
+def get_token_counter() -> TokenCounter:
+    """Singleton; nạp lần đầu có thể tải file BPE -> gọi trong warm-up (AppResources.load_llms)."""
+    global _counter
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                _counter = TokenCounter()
+    return _counter
+
+
+# ==============================================================================
+# TRƯỜNG CỦA NODE THEO LOẠI CÂU HỎI
+# ==============================================================================
+# page_content của node (build_index.row_to_node): "Món ăn / Phân loại / Mô tả / Thành phần / Cách nấu"
+_RECIPE = re.compile(r"\b(cach nau|cong thuc|che bien|cach lam|lam (sao|the nao)|nau (sao|the nao)|huong dan)\b")
+_INGREDIENTS = re.compile(r"\b(thanh phan|nguyen lieu|gom (nhung )?gi|lam tu|co nhung gi)\b")
+
+QUESTION_FIELDS = {
+    "nutrition": ("Món ăn", "Phân loại"),
+    "recipe": ("Món ăn", "Thành phần", "Cách nấu"),
+    "ingredients": ("Món ăn", "Thành phần"),
+    "general": ("Món ăn", "Phân loại", "Mô tả", "Thành phần", "Cách nấu"),
+}
+# Loại câu hỏi cần kèm chỉ số dinh dưỡng (metadata, không nằm trong page_content)
+WITH_NUTRITION = ("nutrition", "general")
+
+
+def question_type(question: str) -> str:
+    text = fold_accents(question)
+    if _RECIPE.search(text):
+        return "recipe"
+    if _INGREDIENTS.search(text):
+        return "ingredients"
+    if NUTRIENT_PATTERN.search(text):
+        return "nutrition"
+    return "general"
+
+
+def _fields(page_content: str) -> Dict[str, str]:
+    fields = {}
+    for line in page_content.splitlines():
+        label, sep, value = line.partition(":")
+        if sep:
+            fields[label.strip()] = value.strip()
+    return fields
+
+
+def format_document(doc, qtype: str) -> str:
+    """Chỉ giữ các trường cần cho loại câu hỏi (+ dòng dinh dưỡng từ metadata)."""
+    fields = _fields(doc.page_content)
+    if not fields:
+        return doc.page_content
+    lines = [f"{label}: {fields[label]}" for label in QUESTION_FIELDS[qtype] if fields.get(label)]
+    meta = doc.metadata or {}
+    if qtype in WITH_NUTRITION and any(meta.get(k) for k in ("calories", "protein", "fat")):
+        lines.append(f"Dinh dưỡng: {meta.get('calories', 0)} kcal, đạm {meta.get('protein', 0)}g, "
+                     f"chất béo {meta.get('fat', 0)}g")
+    return "\n".join(lines)
+
+
+# ==============================================================================
+# GHÉP THEO NGÂN SÁCH
+# ==============================================================================
+class PromptPlan(NamedTuple):
+    context: str
+    chat_history: List[BaseMessage]
+    stats: dict
+
+
+def trim_history(chat_history: List[BaseMessage], budget: int, counter: TokenCounter) -> Tuple[list, int]:
+    """Giữ lượt mới nhất trước, câu trả lời cũ cắt còn HISTORY_ANSWER_TOKENS; trả (history, số token)."""
+    kept, used = [], 0
+    for message in reversed(chat_history):
+        if isinstance(message, AIMessage):
+            content = counter.truncate(str(message.content), HISTORY_ANSWER_TOKENS)
+            if content != message.content:
+                message = AIMessage(content=content)
+        cost = counter.count(str(message.content)) + MESSAGE_OVERHEAD_TOKENS
+        if used + cost > budget:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+    # Không mở đầu bằng câu trả lời mồ côi (mất câu hỏi tương ứng)
+    while kept and isinstance(kept[0], AIMessage):
+        used -= counter.count(str(kept[0].content)) + MESSAGE_OVERHEAD_TOKENS
+        kept.pop(0)
+    return kept, used
+
+
+class PromptBuilder:
+    """Ghép context + lịch sử cho bước trả lời RAG sao cho tổng token đầu vào <= budget."""
+
+    def __init__(self, system_prompt: str, human_template: str, budget: int = PROMPT_TOKEN_BUDGET,
+                 counter: Optional[TokenCounter] = None):
+        self.counter = counter or get_token_counter()
+        self.budget = budget
+        # Phần cố định: system prompt + khung tin nhắn người dùng (không gồm context / câu hỏi)
+        self.fixed_tokens = (self.counter.count(system_prompt)
+                             + self.counter.count(human_template.format(context="", input=""))
+                             + 2 * MESSAGE_OVERHEAD_TOKENS)
+
+    def build(self, question: str, standalone: str, chat_history: List[BaseMessage], docs) -> PromptPlan:
+        counter = self.counter
+        qtype = question_type(standalone)
+        used = self.fixed_tokens + counter.count(question)
+
+        # 1. Context theo thứ hạng; tài liệu đầu luôn có mặt (bị cắt nếu quá dài)
+        parts, context_tokens = [], 0
+        for doc in docs:
+            text = format_document(doc, qtype)
+            cost = counter.count(text) + 2  # "\n\n" nối tài liệu
+            if used + context_tokens + cost > self.budget:
+                if not parts:
+                    text = counter.truncate(text, max(self.budget - used, 32))
+                    parts.append(text)
+                    context_tokens += counter.count(text)
+                break
+            parts.append(text)
+            context_tokens += cost
+        used += context_tokens
+
+        # 2. Lịch sử lấp phần còn lại
+        history, history_tokens = trim_history(chat_history, max(self.budget - used, 0), counter)
+        used += history_tokens
+
+        stats = {
+            "question_type": qtype, "prompt_tokens": used, "budget": self.budget,
+            "fixed_tokens": self.fixed_tokens, "context_tokens": context_tokens, "history_tokens": history_tokens,
+            "docs_used": len(parts), "docs": len(docs),
+            "history_kept": len(history), "history_dropped": len(chat_history) - len(history),
+            "tokenizer": counter.name,
+        }
+        return PromptPlan("\n\n".join(parts), history, stats)
+
+
+def log_direct_prompt(route: str, messages: List[BaseMessage]):
+    """Luồng SCAN / CHITCHAT: chỉ ghi số token (prompt đã ngắn, không có context / lịch sử)."""
+    logger.info("prompt tokens", extra={"route": route, "prompt_tokens": get_token_counter().count_messages(messages),
+                                        "tokenizer": get_token_counter().name})
@@ -0,0 +1,166 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import List, NamedTuple, Optional
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from api.prompt_builder import format_document, get_token_counter
+from utils.observability import get_logger
+
+logger = get_logger("scan_prefetch")
+
+# ==============================================================================
+# CHUẨN BỊ TRƯỚC CONTEXT CHO CÂU HỎI TIẾP THEO SAU KHI SCAN
+# ==============================================================================
+# /scan chỉ nhận tên món -> ngay lúc đó chạy nền (không chặn response của /scan):
+#   1. Tra món vừa chụp trong FoodDB (dish_index: exact / alias / fuzzy, vài µs); tên lớp CV là tên
+#      chung ("Chả cá") -> lookup_partial lấy món có tên chứa cụm đó ("Chả cá Lã Vọng")
+#   2. Dựng sẵn context (mô tả, thành phần, cách nấu, dinh dưỡng từ metadata) + ảnh / nguồn
+# Câu hỏi tiếp theo (luồng SCAN) dùng context đã sẵn: câu hỏi số ("món này bao nhiêu calo?") trả lời
+# thẳng từ bảng dinh dưỡng, câu còn lại LLM trả lời có căn cứ FoodDB thay vì chỉ biết tên món.
+# Scan mới của cùng session -> hủy task cũ. Lưu trong tiến trình (task asyncio không lưu được vào
+# SQLite / Redis): chạy nhiều worker thì worker khác không thấy -> quay về luồng SCAN như cũ.
+SCAN_PREFETCH = os.getenv("SCAN_PREFETCH", "1") != "0"
+# Câu hỏi đến khi task chưa xong: chờ tối đa bấy nhiêu giây rồi trả lời không có context
+SCAN_PREFETCH_WAIT = float(os.getenv("SCAN_PREFETCH_WAIT", "0.5"))
+SCAN_CONTEXT_TOKENS = int(os.getenv("SCAN_CONTEXT_TOKENS", "600"))
+
+# System prompt tĩnh (không chèn tên món) -> giữ nguyên prefix giữa các request; món vừa chụp nằm ở tin nhắn cuối
+SCAN_SYSTEM_PROMPT = (
+    "Bạn là Lucfin. Người dùng đang hỏi về món họ vừa chụp ảnh (ghi ở đầu câu hỏi). "
+    "Hãy trả lời ngắn gọn (80 chữ), tập trung dinh dưỡng. "
+    "Nếu có thông tin từ FoodDB đi kèm thì ưu tiên dùng số liệu đó."
+)
+
+
+class ScanContext(NamedTuple):
+    foods: str                  # chuỗi tên món như get_scanned_context trả về
+    dishes: List                # DishMatch khớp trong FoodDB (rỗng nếu không món nào khớp)
+    context: str                # các trường FoodDB đã ghép, <= SCAN_CONTEXT_TOKENS
+    image: Optional[str]
+    prepare_ms: float
+
+    @property
+    def sources(self) -> List[str]:
+        return [m.dish_name for m in self.dishes]
+
+
+def build_scan_messages(scanned_food: str, question: str, scan_context: Optional[ScanContext] = None):
+    """Messages cho luồng A (SCAN); có context chuẩn bị sẵn -> kèm thông tin FoodDB trước câu hỏi."""
+    header = f"Món vừa chụp: {scanned_food}"
+    if scan_context is not None and scan_context.context:
+        header += f"\nThông tin từ FoodDB:\n{scan_context.context}"
+    return [SystemMessage(content=SCAN_SYSTEM_PROMPT), HumanMessage(content=f"{header}\n\n{question}")]
+
+
+class _Entry:
+    __slots__ = ("foods", "task", "created")
+
+    def __init__(self, foods, task):
+        self.foods = foods
+        self.task = task
+        self.created = time.time()
+
+
+class ScanPrefetcher:
+    def __init__(self, max_entries=10000, ttl_seconds=600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # session_id -> _Entry, cũ nhất ở đầu
+        self.started = self.cancelled = self.failed = self.hits = self.waits = self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _drop(self, session_id):
+        entry = self._entries.pop(session_id, None)
+        if entry is not None and not entry.task.done():
+            entry.task.cancel()
+            self.cancelled += 1
+
+    def start(self, session_id: str, food_names: List[str], resources) -> Optional[asyncio.Task]:
+        """Hủy task của lần scan trước (nếu còn chạy) rồi chạy nền bước chuẩn bị cho lần scan này."""
+        self._drop(session_id)
+        if not SCAN_PREFETCH:
+            return None
+        foods = ", ".join(food_names)
+        task = asyncio.ensure_future(self._prepare(foods, list(food_names), resources))
+        task.add_done_callback(self._on_done)
+        self._entries[session_id] = _Entry(foods, task)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+        self.started += 1
+        return task
+
+    def _on_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            self.failed += 1
+            logger.warning("scan prefetch failed", extra={"error": str(task.exception())})
+
+    async def get(self, session_id: str, foods: str, wait: float = SCAN_PREFETCH_WAIT) -> Optional[ScanContext]:
+        """Context đã chuẩn bị cho đúng lần scan hiện tại của session (None nếu không có / chưa kịp xong)."""
+        entry = self._entries.get(session_id)
+        if entry is None or entry.foods != foods or time.time() - entry.created >= self.ttl_seconds:
+            self.misses += 1
+            return None
+        if not entry.task.done():
+            self.waits += 1
+            # asyncio.wait không hủy task khi hết giờ -> câu hỏi sau vẫn dùng được kết quả
+            await asyncio.wait({entry.task}, timeout=wait)
+        if not entry.task.done() or entry.task.cancelled() or entry.task.exception() is not None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry.task.result()
+
+    def peek(self, session_id: str) -> Optional[dict]:
+        """Trạng thái chuẩn bị của session (GET /scan/{session_id}) - không chờ."""
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        state = {"foods": entry.foods, "ready": entry.task.done() and not entry.task.cancelled()
+                 and entry.task.exception() is None}
+        if state["ready"]:
+            result = entry.task.result()
+            state.update(dishes=result.sources, image=result.image, prepare_ms=round(result.prepare_ms, 1))
+        return state
+
+    async def _prepare(self, foods: str, food_names: List[str], resources) -> ScanContext:
+        started = time.perf_counter()
+        if resources.dish_index is None:
+            # Scan ngay sau khi khởi động: chờ cùng task nạp index với request RAG
+            try:
+                await resources.aget_index()
+            except Exception:
+                pass
+        dishes, seen = [], set()
+        if resources.dish_index is not None:
+            for name in food_names:
+                matches = resources.dish_index.lookup(name, limit=1) or resources.dish_index.lookup_partial(name)
+                for match in matches:
+                    if match.dish_name not in seen:
+                        seen.add(match.dish_name)
+                        dishes.append(match)
+
+        counter = get_token_counter()
+        docs = [SimpleNamespace(page_content=m.node.get_content(), metadata=m.node.metadata) for m in dishes]
+        context = counter.truncate("\n\n".join(format_document(doc, "general") for doc in docs), SCAN_CONTEXT_TOKENS)
+        image = next((m.node.metadata.get("image_link") for m in dishes if m.node.metadata.get("image_link")), None)
+
+        prepare_ms = (time.perf_counter() - started) * 1000
+        logger.info("scan prefetch ready", extra={"foods": foods, "dishes": [m.dish_name for m in dishes],
+                                                  "methods": [m.method for m in dishes],
+                                                  "context_tokens": counter.count(context),
+                                                  "prepare_ms": round(prepare_ms, 1)})
+        return ScanContext(foods, dishes, context, image, prepare_ms)
+
+    def close(self):
+        for session_id in list(self._entries):
+            self._drop(session_id)
+
+    def stats(self):
+        return {"sessions": len(self._entries), "started": self.started, "cancelled": self.cancelled,
+                "failed": self.failed, "hits": self.hits, "waits": self.waits, "misses": self.misses}
@@ -1,69 +1,186 @@
+import argparse
+import hashlib
+import os
+import shutil
 import pandas as pd
-from llama_index.core import VectorStoreIndex, Settings
+from llama_index.core import Settings
 from llama_index.core.schema import TextNode # <--- Code mới dùng TextNode
 from config.embed import load_embed
+from config.sparse_index import SPARSE_DIR, SparseIndex
+from config.vector_store import CHROMA_DIR, load_stored_embeddings, save_vector_store, update_chroma_nodes
 
-def build_index(data_path="data_raw/foods.csv", persist_dir="FoodDB"):
-    # 1. Load Model GPU
-    print("🔌 Đang khởi động Model trên GPU...")
-    embed_model = load_embed()
-    Settings.embed_model = embed_model
-    
-    # 2. Đọc Data
+def row_to_node(row):
+    # Text để search
+    text_content = (
+        f"Món ăn: {row['dish_name']}\n"
+        f"Phân loại: {row['dish_type']}\n"
+        f"Mô tả: {row['description']}\n"
+        f"Thành phần: {row['ingredients']}\n"
+        f"Cách nấu: {row['cooking_method']}"
+    )
+
+    # Metadata hiển thị
+    metadata = {
+        "dish_name": str(row['dish_name']),
+        "calories": int(row['calories']) if pd.notna(row['calories']) else 0,
+        "protein": int(row['protein']) if pd.notna(row['protein']) else 0,
+        "fat": int(row['fat']) if pd.notna(row['fat']) else 0,
+        "image_link": str(row['image_link']) if pd.notna(row['image_link']) else ""
+    }
+
+    # ID ổn định theo tên món -> build lần sau so khớp được node cũ
+    node_id = "dish-" + hashlib.sha1(metadata["dish_name"].encode("utf-8")).hexdigest()[:16]
+    node = TextNode(id_=node_id, text=text_content, metadata=metadata)
+
+    # Hash đúng đoạn text sẽ được nhúng; content_hash KHÔNG được đưa vào text nhúng / prompt
+    embed_text = node.get_content(metadata_mode="embed")
+    node.metadata["content_hash"] = hashlib.sha256(embed_text.encode("utf-8")).hexdigest()
+    node.excluded_embed_metadata_keys.append("content_hash")
+    node.excluded_llm_metadata_keys.append("content_hash")
+    return node
+
+def diff_nodes(nodes, stored):
+    """So sánh node mới với index cũ -> (thêm, sửa, giữ nguyên, xóa)."""
+    added, changed, unchanged = [], [], []
+    for node in nodes:
+        if node.node_id not in stored:
+            added.append(node)
+        elif stored[node.node_id][0] != node.metadata["content_hash"]:
+            changed.append(node)
+        else:
+            unchanged.append(node)
+    current_ids = {node.node_id for node in nodes}
+    removed = [node_id for node_id in stored if node_id not in current_ids]
+    return added, changed, unchanged, removed
+
+def swap_directory(new_dir, target_dir):
+    """
+    Thay index cũ bằng bản mới đã ghi XONG: không bao giờ có trạng thái ghi dở ở target_dir.
+    Nếu đổi tên lỗi giữa chừng thì khôi phục bản cũ.
+    """
+    backup_dir = target_dir.rstrip("/\\") + ".old"
+    if os.path.exists(backup_dir):
+        shutil.rmtree(backup_dir)
+    had_old = os.path.exists(target_dir)
+    if had_old:
+        os.replace(target_dir, backup_dir)
+    try:
+        os.replace(new_dir, target_dir)
+    except Exception:
+        if had_old:
+            os.replace(backup_dir, target_dir)
+        raise
+    if had_old:
+        shutil.rmtree(backup_dir)
+
+def build_sparse_index(nodes, sparse_dir=SPARSE_DIR):
+    """Chỉ mục BM25 (không cần embedding) -> luôn dựng lại toàn bộ, ghi tạm rồi thay thế như dense index."""
+    sparse = SparseIndex.build([node.node_id for node in nodes], [node.get_text() for node in nodes])
+    tmp_dir = sparse_dir.rstrip("/\\") + ".tmp"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    sparse.save(tmp_dir)
+    swap_directory(tmp_dir, sparse_dir)
+    return sparse
+
+def build_index(data_path="data_raw/foods.csv", persist_dir="FoodDB", backend="simple", dtype="float32",
+                incremental=False, dry_run=False, sparse_dir=SPARSE_DIR):
+    # 1. Đọc Data
     print("📂 Đang đọc CSV...")
     df = pd.read_csv(data_path)
-    
-    # 3. Tạo Nodes thủ công (Manual Node Creation)
-    nodes = []
+
+    # 2. Tạo Nodes thủ công (Manual Node Creation)
     print("⚙️ Đang chuyển đổi dữ liệu sang Nodes...")
-    
-    for _, row in df.iterrows():
-        # Text để search
-        text_content = (
-            f"Món ăn: {row['dish_name']}\n"
-            f"Phân loại: {row['dish_type']}\n"
-            f"Mô tả: {row['description']}\n"
-            f"Thành phần: {row['ingredients']}\n"
-            f"Cách nấu: {row['cooking_method']}"
-        )
-        
-        # Metadata hiển thị
-        metadata = {
-            "dish_name": str(row['dish_name']),
-            "calories": int(row['calories']) if pd.notna(row['calories']) else 0,
-            "protein": int(row['protein']) if pd.notna(row['protein']) else 0,
-            "fat": int(row['fat']) if pd.notna(row['fat']) else 0,
-            "image_link": str(row['image_link']) if pd.notna(row['image_link']) else ""
-        }
-        
-        # Tạo Node
-        node = TextNode(text=text_content, metadata=metadata)
-        nodes.append(node)
-    
-    # 4. MANUAL EMBEDDING (BƯỚC QUAN TRỌNG NHẤT)
-    # Tự tay nhúng vector, bỏ qua cơ chế chậm chạp mặc định của LlamaIndex
-    print(f"🚀 Đang kích hoạt GPU nhúng vector cho {len(nodes)} món ăn...")
-    
-    # Lấy text ra
-    text_chunks = [node.get_content(metadata_mode="embed") for node in nodes]
-    
-    # Ép Model chạy batching 64
-    # Hàm này chạy cực nhanh (giống file debug_gpu.py)
-    embeddings = embed_model.get_text_embedding_batch(text_chunks, show_progress=True)
-    
-    # Gán vector ngược lại vào node
-    for node, embedding in zip(nodes, embeddings):
-        node.embedding = embedding
-
-    print("⚡ Đang đóng gói vào Index...")
-    
-    # 5. Tạo Index từ Nodes đã có Vector (cực nhanh vì không cần tính toán nữa)
-    index = VectorStoreIndex(nodes)
-    
-    # 6. Lưu lại
-    index.storage_context.persist(persist_dir=persist_dir)
-    print(f"✅ Đã XONG! Lưu dữ liệu vào '{persist_dir}'.")
-    return index
+    nodes = [row_to_node(row) for row in df.to_dict("records")]
+    seen = {}
+    for node in nodes:
+        # Trùng tên món -> thêm hậu tố để ID vẫn duy nhất
+        count = seen.get(node.node_id, 0)
+        seen[node.node_id] = count + 1
+        if count:
+            node.id_ = f"{node.node_id}-{count}"
+
+    # 3. So sánh với index cũ (chỉ khi --incremental)
+    stored = load_stored_embeddings(backend, persist_dir) if incremental else {}
+    added, changed, unchanged, removed = diff_nodes(nodes, stored)
+    print(f"🔍 Diff: +{len(added)} mới | ~{len(changed)} sửa | ={len(unchanged)} giữ nguyên | -{len(removed)} xóa")
+
+    if dry_run:
+        for label, items in (("+", added), ("~", changed)):
+            for node in items:
+                print(f"   {label} {node.metadata['dish_name']}")
+        for node_id in removed:
+            print(f"   - {node_id}")
+        return nodes
+
+    if incremental and not (added or changed or removed):
+        print("✅ Index đã khớp với CSV, không có gì để làm.")
+        return nodes
+
+    # 4. MANUAL EMBEDDING (BƯỚC QUAN TRỌNG NHẤT) - chỉ nhúng dòng mới / đã sửa
+    to_embed = added + changed
+    embed_model = None  # Chỉ xóa món -> không cần nạp model
+    if to_embed:
+        print("🔌 Đang khởi động Model trên GPU...")
+        embed_model = load_embed()
+        Settings.embed_model = embed_model
+
+        # Tự tay nhúng vector, bỏ qua cơ chế chậm chạp mặc định của LlamaIndex
+        print(f"🚀 Đang kích hoạt GPU nhúng vector cho {len(to_embed)} món ăn...")
+
+        # Lấy text ra
+        text_chunks = [node.get_content(metadata_mode="embed") for node in to_embed]
+
+        # Ép Model chạy batching
+        embeddings = embed_model.get_text_embedding_batch(text_chunks, show_progress=True)
+
+        # Gán vector ngược lại vào node
+        for node, embedding in zip(to_embed, embeddings):
+            node.embedding = embedding
+
+    # Dòng không đổi -> dùng lại vector đã lưu
+    for node in unchanged:
+        node.embedding = stored[node.node_id][1]
+
+    print(f"⚡ Đang đóng gói vào Index ({backend})...")
+
+    # 5. Ghi Nodes đã có Vector xuống backend (simple / compact / chroma), không cần tính toán lại
+    if backend == "chroma" and incremental:
+        # Chroma cập nhật tại chỗ theo id, không cần ghi lại cả collection
+        update_chroma_nodes(to_embed, removed)
+    elif backend == "chroma":
+        save_vector_store(nodes, backend=backend)
+    else:
+        # Ghi ra thư mục tạm rồi mới thay thế -> server/đọc song song không thấy index ghi dở
+        tmp_dir = persist_dir.rstrip("/\\") + ".tmp"
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        save_vector_store(nodes, backend=backend, persist_dir=tmp_dir, dtype=dtype, embed_model=embed_model)
+        swap_directory(tmp_dir, persist_dir)
+
+    # 6. Chỉ mục BM25 cho hybrid search (config/sparse_index.py)
+    print("🔤 Đang dựng chỉ mục BM25...")
+    sparse = build_sparse_index(nodes, sparse_dir)
+    print(f"   {sparse.stats()} -> '{sparse_dir}'")
+
+    location = CHROMA_DIR if backend == "chroma" else persist_dir
+    print(f"✅ Đã XONG! Lưu dữ liệu vào '{location}'.")
+    return nodes
 
 if __name__ == "__main__":
-    build_index()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build FoodDB vector index")
+    parser.add_argument("--data", default="data_raw/foods.csv")
+    parser.add_argument("--persist-dir", default="FoodDB")
+    parser.add_argument("--backend", "--format", dest="backend", choices=["simple", "compact", "chroma"],
+                        default=os.getenv("VECTOR_BACKEND", "simple").replace("auto", "simple"),
+                        help="simple = JSON của LlamaIndex, compact = embeddings.npy + nodes.jsonl, chroma = ./chroma_db")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32",
+                        help="Kiểu dữ liệu ma trận embedding (chỉ cho --backend compact)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Chỉ nhúng món mới/đã sửa (theo content hash), dùng lại vector cũ, xóa món đã bỏ")
+    parser.add_argument("--sparse-dir", default=SPARSE_DIR, help="Thư mục chỉ mục BM25 (hybrid search)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Chỉ in diff so với index hiện tại, không nhúng / không ghi")
+    args = parser.parse_args()
+    build_index(args.data, args.persist_dir, backend=args.backend, dtype=args.dtype,
+                incremental=args.incremental or args.dry_run, dry_run=args.dry_run, sparse_dir=args.sparse_dir)
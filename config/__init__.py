@@ -1,3 +1,10 @@
-from .embed import load_embed
-from .llm import load_llm
-from .vector_store import get_vector_store
+from importlib import import_module
+
+# Re-export lazy (PEP 562): import config.llm / config.rerank không kéo theo llama_index qua vector_store
+_EXPORTS = {"load_embed": ".embed", "load_llm": ".llm", "get_vector_store": ".vector_store"}
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        return getattr(import_module(_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
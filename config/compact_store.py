@@ -0,0 +1,148 @@
+import json
+import os
+from typing import List
+
+import numpy as np
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from llama_index.core.vector_stores import FilterCondition, MetadataFilters
+
+# ==============================================================================
+# COMPACT INDEX: ma trận embedding float32/float16 (.npy, memmap) + node text/metadata riêng
+# ==============================================================================
+# Thay cho JSON của SimpleVectorStore (parse từng float thành list Python -> chậm + tốn RAM).
+# Layout thư mục:
+#   embeddings.npy   [N, dim] đã chuẩn hóa L2 -> cosine = dot product
+#   nodes.jsonl      1 dòng / node: {"id", "text", "metadata"} (cùng thứ tự với ma trận)
+#   index_meta.json  {"format", "count", "dim", "dtype"}
+
+EMBEDDINGS_FILE = "embeddings.npy"
+NODES_FILE = "nodes.jsonl"
+META_FILE = "index_meta.json"
+COMPACT_FORMAT = "compact-v1"
+
+# float16 không có BLAS trên CPU -> nhân theo block, ép lên float32 từng phần
+_FP16_BLOCK_ROWS = 8192
+
+# Toán tử MetadataFilter của LlamaIndex -> phép so sánh vector hóa trên cột NumPy
+_FILTER_OPS = {
+    "==": np.equal, "!=": np.not_equal,
+    ">": np.greater, ">=": np.greater_equal,
+    "<": np.less, "<=": np.less_equal,
+    "in": lambda col, values: np.isin(col, list(values)),
+    "nin": lambda col, values: ~np.isin(col, list(values)),
+}
+
+
+def is_compact_dir(persist_dir: str) -> bool:
+    return os.path.exists(os.path.join(persist_dir, META_FILE))
+
+
+def save_compact_index(persist_dir: str, nodes: List[TextNode], dtype: str = "float32", dim: int = 0):
+    """Ghi node đã có embedding ra định dạng compact. Không có node -> ma trận (0, dim)."""
+    os.makedirs(persist_dir, exist_ok=True)
+    if any(node.embedding is None for node in nodes):
+        raise ValueError("❌ Có node chưa có embedding, không ghi được index compact.")
+    matrix = np.asarray([node.embedding for node in nodes], dtype=np.float32).reshape(len(nodes), -1 if nodes else dim)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms == 0, 1.0, norms)
+    np.save(os.path.join(persist_dir, EMBEDDINGS_FILE), matrix.astype(dtype))
+
+    with open(os.path.join(persist_dir, NODES_FILE), "w", encoding="utf-8") as f:
+        for node in nodes:
+            f.write(json.dumps({"id": node.node_id, "text": node.text, "metadata": node.metadata},
+                               ensure_ascii=False) + "\n")
+
+    with open(os.path.join(persist_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump({"format": COMPACT_FORMAT, "count": len(nodes), "dim": int(matrix.shape[1]),
+                   "dtype": dtype}, f)
+
+
+class CompactRetriever:
+    """Giao diện giống retriever LlamaIndex: .retrieve(query) -> List[NodeWithScore]."""
+
+    def __init__(self, index, similarity_top_k: int = 3, filters: MetadataFilters = None):
+        self.index = index
+        self.similarity_top_k = similarity_top_k
+        self.filters = filters
+
+    def retrieve(self, query) -> List[NodeWithScore]:
+        bundle = query if isinstance(query, QueryBundle) else QueryBundle(query_str=query)
+        embedding = bundle.embedding
+        if embedding is None:
+            embedding = self.index.embed_model.get_query_embedding(bundle.query_str)
+        ids, scores = self.index.search(embedding, self.similarity_top_k, filters=self.filters)
+        return [NodeWithScore(node=self.index.nodes[i], score=float(s)) for i, s in zip(ids, scores)]
+
+
+class CompactVectorIndex:
+    def __init__(self, embeddings: np.ndarray, nodes: List[TextNode], embed_model=None):
+        self.embeddings = embeddings
+        self.nodes = nodes
+        self.embed_model = embed_model
+        self._columns = {}
+
+    @classmethod
+    def load(cls, persist_dir: str, embed_model=None, mmap: bool = True):
+        embeddings = np.load(os.path.join(persist_dir, EMBEDDINGS_FILE), mmap_mode="r" if mmap else None)
+        nodes = []
+        with open(os.path.join(persist_dir, NODES_FILE), encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                nodes.append(TextNode(id_=row["id"], text=row["text"], metadata=row["metadata"]))
+        if len(nodes) != embeddings.shape[0]:
+            raise ValueError(f"❌ Index hỏng: {len(nodes)} node nhưng {embeddings.shape[0]} vector.")
+        return cls(embeddings, nodes, embed_model)
+
+    def _scores(self, query: np.ndarray) -> np.ndarray:
+        if self.embeddings.dtype == np.float32:
+            return self.embeddings @ query
+        out = np.empty(self.embeddings.shape[0], dtype=np.float32)
+        for start in range(0, self.embeddings.shape[0], _FP16_BLOCK_ROWS):
+            block = np.asarray(self.embeddings[start:start + _FP16_BLOCK_ROWS], dtype=np.float32)
+            out[start:start + len(block)] = block @ query
+        return out
+
+    def _column(self, key: str) -> np.ndarray:
+        # Cột metadata (calories, protein, ...) dựng 1 lần, dùng lại cho mọi truy vấn có filter
+        if key not in self._columns:
+            values = [node.metadata.get(key) for node in self.nodes]
+            try:
+                self._columns[key] = np.asarray(values, dtype=np.float64)
+            except (TypeError, ValueError):
+                self._columns[key] = np.asarray(values, dtype=object)
+        return self._columns[key]
+
+    def _filter_mask(self, filters: MetadataFilters) -> np.ndarray:
+        masks = []
+        for f in filters.filters:
+            if isinstance(f, MetadataFilters):
+                masks.append(self._filter_mask(f))
+                continue
+            op = getattr(f.operator, "value", f.operator)
+            if op not in _FILTER_OPS:
+                raise ValueError(f"❌ Compact index chưa hỗ trợ toán tử filter '{op}'")
+            masks.append(_FILTER_OPS[op](self._column(f.key), f.value))
+        if not masks:
+            return np.ones(len(self.nodes), dtype=bool)
+        combine = np.logical_or if filters.condition == FilterCondition.OR else np.logical_and
+        return combine.reduce(masks)
+
+    def search(self, query_embedding, top_k: int, filters: MetadataFilters = None):
+        """1 phép nhân ma trận-vector + argpartition -> (ids, scores) giảm dần."""
+        if self.embeddings.shape[0] == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        query = np.array(query_embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        scores = self._scores(query)
+        if filters is not None:
+            scores = np.where(self._filter_mask(filters), scores, -np.inf)
+            top_k = min(top_k, int(np.isfinite(scores).sum()))
+        k = min(top_k, scores.shape[0])
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
+
+    def as_retriever(self, similarity_top_k: int = 3, filters: MetadataFilters = None, **kwargs):
+        return CompactRetriever(self, similarity_top_k=similarity_top_k, filters=filters)
@@ -1,16 +1,126 @@
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-import torch
+import os
+from typing import Any, List
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import PrivateAttr
+
+from config.onnx_backend import ensure_quantized, onnx_model_kwargs, resolve_backend
+from utils.batching import MicroBatcher
+from utils.embed_cache import EmbeddingCache
+from utils.observability import get_logger
+
+logger = get_logger("embed")
+
+# Micro-batching câu hỏi lúc phục vụ (MICROBATCH=0 để tắt)
+MICROBATCH = os.getenv("MICROBATCH", "1") != "0"
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", "16"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "2"))
+
+
+EMBED_MODEL_NAME = "AITeamVN/Vietnamese_Embedding"
+
+
+def load_embed(embed_batch_size: int = 3, backend: str = None):
+    """backend: torch / onnx (mặc định INFERENCE_BACKEND, xem config/onnx_backend.py)."""
+    # torch + transformers nặng (vài giây) -> chỉ import khi thật sự nạp model
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    backend = resolve_backend(backend)
+    if backend == "onnx":
+        # CPU-only: ONNX Runtime int8, thư mục export cục bộ thay cho tên model trên Hub
+        logger.info("loading embedding model", extra={"device": "cpu", "backend": "onnx"})
+        return HuggingFaceEmbedding(
+            model_name=ensure_quantized(EMBED_MODEL_NAME, "embed"),
+            device="cpu",
+            embed_batch_size=embed_batch_size,
+            backend="onnx",
+            model_kwargs=onnx_model_kwargs(),
+        )
+
+    import torch
 
-def load_embed():
-    
     device_str = "cuda" if torch.cuda.is_available() else "cpu"
     
-    print(f"Đang chạy Embedding trên thiết bị: {device_str.upper()}")
+    logger.info("loading embedding model", extra={"device": device_str, "backend": "torch"})
 
     embed_model = HuggingFaceEmbedding(
         #Phải chỉ định model tiếng Việt
-        model_name="AITeamVN/Vietnamese_Embedding", 
+        model_name=EMBED_MODEL_NAME, 
         device=device_str,  # Truyền string vào đây
-        embed_batch_size=3 # Card T1000 tải tốt mức này
+        # Build index: 3 văn bản / lần (Card T1000 tải tốt mức này); phục vụ câu hỏi ngắn -> batch lớn hơn
+        embed_batch_size=embed_batch_size
     )
-    return embed_model
\ No newline at end of file
+    return embed_model
+
+
+class CachedQueryEmbedding(BaseEmbedding):
+    """Bọc embedding model: câu hỏi đi qua EmbeddingCache, văn bản (build index) đi thẳng model gốc."""
+
+    _inner: Any = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, inner: BaseEmbedding, cache: EmbeddingCache, **kwargs):
+        super().__init__(model_name=inner.model_name, embed_batch_size=inner.embed_batch_size, **kwargs)
+        self._inner = inner
+        self._cache = cache
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        return self._inner
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        embedding = self._cache.get(query)
+        if embedding is None:
+            embedding = self._inner.get_query_embedding(query)
+            self._cache.put(query, embedding)
+        return embedding
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        embedding = self._cache.get(query)
+        if embedding is None:
+            embedding = await self._inner.aget_query_embedding(query)
+            self._cache.put(query, embedding)
+        return embedding
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._inner.get_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._inner.get_text_embedding_batch(texts)
+
+
+class BatchedQueryEmbedding(BaseEmbedding):
+    """
+    Câu hỏi từ các request đồng thời đi qua MicroBatcher -> 1 forward pass cho cả nhóm.
+    load_embed() không đặt query_instruction nên embedding câu hỏi = embedding văn bản (_get_text_embeddings).
+    """
+
+    _inner: Any = PrivateAttr()
+    _batcher: MicroBatcher = PrivateAttr()
+
+    def __init__(self, inner: BaseEmbedding, max_batch_size: int = EMBED_BATCH_MAX,
+                 max_wait_ms: float = EMBED_BATCH_WAIT_MS, **kwargs):
+        super().__init__(model_name=inner.model_name, embed_batch_size=inner.embed_batch_size, **kwargs)
+        self._inner = inner
+        self._batcher = MicroBatcher(inner._get_text_embeddings, max_batch_size=max_batch_size,
+                                     max_wait_ms=max_wait_ms, name="embed")
+
+    @property
+    def batcher(self) -> MicroBatcher:
+        return self._batcher
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._batcher([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return (await self._batcher.acall([query]))[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._inner.get_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._inner.get_text_embedding_batch(texts)
@@ -1,12 +1,30 @@
 from dotenv import load_dotenv
 import os
-# llm api
-from llama_index.llms.groq import Groq
+# llm api: import bên trong hàm (lazy) -> import app / main không kéo theo groq SDK
 
 
 # Load llm
 def load_llm():
+    from llama_index.llms.groq import Groq
+
     load_dotenv()  # load biến môi trường từ file .env
     API_KEY = os.getenv("MY_API_KEY")
     llm = Groq(model="qwen/qwen3-32b", api_key=API_KEY)
-    return llm
\ No newline at end of file
+    return llm
+
+
+# Chat model LangChain (dùng cho /ask). Nhận httpx client dùng chung để giữ kết nối keep-alive.
+# LLM_BASE_URL: trỏ sang server tương thích Groq khác (vd. evaluation/fake_groq_server.py khi load test)
+def load_chat_llm(model=None, http_client=None, http_async_client=None):
+    from langchain_groq import ChatGroq
+
+    load_dotenv()
+    API_KEY = os.getenv("MY_API_KEY")
+    return ChatGroq(
+        model=model or os.getenv("LLM_MODEL", "qwen/qwen3-32b"),
+        api_key=API_KEY,
+        base_url=os.getenv("LLM_BASE_URL") or None,
+        temperature=0,
+        http_client=http_client,
+        http_async_client=http_async_client,
+    )
@@ -0,0 +1,90 @@
+import os
+import shutil
+import threading
+
+from utils.observability import get_logger
+
+logger = get_logger("onnx")
+
+# ==============================================================================
+# BACKEND SUY LUẬN: PYTORCH HOẶC ONNX RUNTIME INT8 (CHỌN BẰNG INFERENCE_BACKEND)
+# ==============================================================================
+#   torch : mặc định - GPU nếu có (FP16 cho reranker), không thì FP32 trên CPU
+#   onnx  : máy chỉ có CPU - export model sang ONNX, lượng tử hóa động int8 (weights int8, activation
+#           lượng tử hóa lúc chạy), cache tại ONNX_DIR/<model>/onnx/model_qint8_<arch>.onnx
+# Lần nạp đầu export mất vài phút (cần optimum + optimum-onnx, ghim phiên bản trong requirements.txt);
+# các lần sau chỉ đọc file đã cache.
+# Phải kiểm tra lại độ khớp với PyTorch khi đổi model / cấu hình: evaluation/onnx_parity.py
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch").lower()
+ONNX_DIR = os.getenv("ONNX_DIR", "./onnx_models")
+# Bộ lệnh của CPU production: avx512_vnni / avx512 / avx2 / arm64
+ONNX_QUANTIZATION = os.getenv("ONNX_QUANTIZATION", "avx512_vnni")
+# 0 = số core vật lý (hyper-thread không giúp GEMM int8, còn làm nhiễu p95)
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+
+_export_lock = threading.Lock()
+
+
+def resolve_backend(backend=None) -> str:
+    backend = (backend or INFERENCE_BACKEND).lower()
+    if backend not in ("torch", "onnx"):
+        raise ValueError(f"❌ INFERENCE_BACKEND không hợp lệ: '{backend}' (torch / onnx)")
+    return backend
+
+
+def quantized_file_name() -> str:
+    return f"onnx/model_qint8_{ONNX_QUANTIZATION}.onnx"
+
+
+def export_dir(model_name: str) -> str:
+    return os.path.join(ONNX_DIR, model_name.replace("/", "__"))
+
+
+def ensure_quantized(model_name: str, kind: str) -> str:
+    """
+    Trả thư mục chứa model ONNX int8 (+ tokenizer / config) của `model_name`, export nếu chưa có.
+    kind: "embed" (SentenceTransformer) / "rerank" (CrossEncoder).
+    """
+    out_dir = export_dir(model_name)
+    if os.path.exists(os.path.join(out_dir, quantized_file_name())):
+        return out_dir
+    with _export_lock:
+        if os.path.exists(os.path.join(out_dir, quantized_file_name())):
+            return out_dir
+        from sentence_transformers import CrossEncoder, SentenceTransformer, export_dynamic_quantized_onnx_model
+
+        logger.info("exporting ONNX int8 model", extra={"model": model_name, "quantization": ONNX_QUANTIZATION,
+                                                        "out_dir": out_dir})
+        model_cls = SentenceTransformer if kind == "embed" else CrossEncoder
+        # backend="onnx" trên model chưa có file .onnx -> optimum export bản FP32
+        model = model_cls(model_name, device="cpu", backend="onnx")
+        # Ghi vào thư mục tạm rồi đổi tên: tiến trình khác không bao giờ thấy bản export dở
+        tmp_dir = out_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        model.save_pretrained(tmp_dir)
+        export_dynamic_quantized_onnx_model(model, ONNX_QUANTIZATION, tmp_dir)
+        # Bản export cũ cho kiểu lượng tử hóa khác -> thay hẳn
+        shutil.rmtree(out_dir, ignore_errors=True)
+        os.replace(tmp_dir, out_dir)
+    return out_dir
+
+
+def _intra_op_threads() -> int:
+    if ONNX_THREADS > 0:
+        return ONNX_THREADS
+    import psutil
+
+    return psutil.cpu_count(logical=False) or os.cpu_count() or 1
+
+
+def onnx_model_kwargs() -> dict:
+    """model_kwargs cho SentenceTransformer / CrossEncoder(backend="onnx") -> ORTModel.from_pretrained."""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = _intra_op_threads()
+    # Micro-batcher chỉ chạy 1 forward pass / lúc -> không cần song song giữa các node của graph
+    options.inter_op_num_threads = 1
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    return {"file_name": quantized_file_name(), "provider": "CPUExecutionProvider", "session_options": options}
@@ -1,27 +1,93 @@
-from sentence_transformers import CrossEncoder
-import torch
+import os
+import threading
 
-_reranker_model = None
+import numpy as np
 
-def load_reranker():
+from config.onnx_backend import ensure_quantized, onnx_model_kwargs, resolve_backend
+from utils.batching import MicroBatcher
+from utils.observability import get_logger
+
+logger = get_logger("rerank")
+
+RERANK_MODEL_NAME = "BAAI/bge-reranker-v2-m3"
+
+# 1 instance / backend (evaluation/onnx_parity.py nạp cả 2 để so sánh)
+_reranker_models = {}
+_reranker_lock = threading.Lock()
+
+# Micro-batching cặp (câu hỏi, ứng viên) của các request đồng thời (MICROBATCH=0 để tắt)
+MICROBATCH = os.getenv("MICROBATCH", "1") != "0"
+RERANK_BATCH_MAX = int(os.getenv("RERANK_BATCH_MAX", "64"))      # ~6 request x 10 ứng viên
+RERANK_BATCH_WAIT_MS = float(os.getenv("RERANK_BATCH_WAIT_MS", "2"))
+
+def load_reranker(backend: str = None):
     """
     Loads the Cross-Encoder model as a singleton.
-    Forces FP16 via model_kwargs to save VRAM on Quadro T1000.
+    torch: forces FP16 via model_kwargs to save VRAM on Quadro T1000.
+    onnx : dynamic int8 ONNX Runtime on CPU (config/onnx_backend.py).
     """
-    global _reranker_model
-    if _reranker_model is None:
-        device_str = "cuda" if torch.cuda.is_available() else "cpu"
-        print(f"🚀 Loading Cross-Encoder on device: {device_str.upper()} (FP16 Mode)")
-        
-        # SỬA LỖI TẠI ĐÂY: Dùng model_kwargs để truyền torch_dtype
-        _reranker_model = CrossEncoder(
-            'BAAI/bge-reranker-v2-m3', 
-            device=device_str,
-            # Đây là cách chính xác nhất cho phiên bản mới
-            model_kwargs={"torch_dtype": torch.float16} 
-        )
+    backend = resolve_backend(backend)
+    model = _reranker_models.get(backend)
+    if model is not None:
+        return model
+
+    # Có thể được gọi từ nhiều thread (thread pool của /ask) -> chỉ load 1 lần
+    with _reranker_lock:
+        model = _reranker_models.get(backend)
+        if model is not None:
+            return model
+        # Import lazy: sentence_transformers kéo theo torch + transformers
+        from sentence_transformers import CrossEncoder
+
+        if backend == "onnx":
+            logger.info("loading Cross-Encoder (ONNX int8)", extra={"device": "cpu"})
+            model = CrossEncoder(
+                ensure_quantized(RERANK_MODEL_NAME, "rerank"),
+                device="cpu",
+                backend="onnx",
+                model_kwargs=onnx_model_kwargs(),
+            )
+        else:
+            import torch
+
+            device_str = "cuda" if torch.cuda.is_available() else "cpu"
+            logger.info("loading Cross-Encoder (FP16)", extra={"device": device_str})
+
+            # SỬA LỖI TẠI ĐÂY: Dùng model_kwargs để truyền torch_dtype
+            model = CrossEncoder(
+                RERANK_MODEL_NAME,
+                device=device_str,
+                # Đây là cách chính xác nhất cho phiên bản mới
+                model_kwargs={"torch_dtype": torch.float16}
+            )
         
         # Cấu hình max_length sau khi khởi tạo (An toàn tuyệt đối)
-        _reranker_model.max_length = 512 
+        model.max_length = 512 
+        _reranker_models[backend] = model
+
+    return model
+
+
+class BatchedReranker:
+    """
+    Cùng giao diện predict() với CrossEncoder, nhưng cặp của nhiều request được gom vào 1 lần predict
+    (1 forward pass, batch_size = tổng số cặp) rồi tách điểm trả về từng request.
+    """
+
+    def __init__(self, model, max_batch_size: int = RERANK_BATCH_MAX, max_wait_ms: float = RERANK_BATCH_WAIT_MS):
+        self.model = model
+        self.batcher = MicroBatcher(self._predict_batch, max_batch_size=max_batch_size,
+                                    max_wait_ms=max_wait_ms, name="rerank")
+
+    def _predict_batch(self, pairs):
+        return self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+
+    def predict(self, pairs, batch_size=None, show_progress_bar=False, **kwargs):
+        return np.asarray(self.batcher(list(pairs)), dtype=np.float32)
+
+
+def load_batched_reranker():
+    """Reranker dùng lúc phục vụ: singleton CrossEncoder (+ micro-batching nếu bật)."""
+    model = load_reranker()
+    return BatchedReranker(model) if MICROBATCH else model
 
-    return _reranker_model
\ No newline at end of file
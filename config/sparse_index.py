@@ -0,0 +1,167 @@
+import json
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.observability import get_logger
+from utils.utils import fold_accents
+
+logger = get_logger("sparse_index")
+
+# ==============================================================================
+# CHỈ MỤC THƯA BM25 (KHỚP TỪ KHÓA) CHẠY SONG SONG VỚI DENSE SEARCH
+# ==============================================================================
+# Tên món / nguyên liệu tiếng Việt ("hến", "mắm ruốc") thường khớp từ vựng tốt hơn embedding.
+# build_index.py dựng sẵn chỉ mục ngược dạng CSR (numpy) tại SPARSE_DIR:
+#   vocab.json   : danh sách term (vị trí = term id)
+#   indptr.npy   : [V+1] postings của term t nằm trong [indptr[t], indptr[t+1])
+#   doc_ids.npy  : [nnz] int32 vị trí văn bản
+#   weights.npy  : [nnz] float32 trọng số BM25 đã tính sẵn (idf * tf đã chuẩn hóa độ dài)
+#   meta.json    : k1, b, node_ids (vị trí văn bản -> node_id của dense index)
+# Truy vấn = cộng trọng số các postings (np.bincount) -> vài chục µs với FoodDB.
+SPARSE_DIR = os.getenv("SPARSE_DIR", "./FoodDB_sparse")
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Âm tiết đã bỏ dấu + cặp âm tiết liền kề: "Mắm ruốc" -> ["mam", "ruoc", "mam_ruoc"].
+    Tiếng Việt viết tách âm tiết, nên cặp liền kề giúp từ ghép khớp mạnh hơn 2 âm tiết rời rạc.
+    """
+    syllables = _WORD.findall(fold_accents(text))
+    return syllables + [f"{a}_{b}" for a, b in zip(syllables, syllables[1:])]
+
+
+class SparseIndex:
+    def __init__(self, terms: List[str], indptr: np.ndarray, doc_ids: np.ndarray, weights: np.ndarray,
+                 node_ids: List[str], k1: float = BM25_K1, b: float = BM25_B):
+        self.vocab: Dict[str, int] = {term: i for i, term in enumerate(terms)}
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.node_ids = node_ids
+        self.k1, self.b = k1, b
+        self.nodes: List[Any] = [None] * len(node_ids)
+        self._valid: Optional[np.ndarray] = None     # None = mọi vị trí đều có node
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    # --- DỰNG / LƯU / NẠP ---
+    @classmethod
+    def build(cls, node_ids: List[str], texts: List[str], k1: float = BM25_K1, b: float = BM25_B):
+        term_freqs = [Counter(tokenize(text)) for text in texts]
+        lengths = np.array([sum(tf.values()) for tf in term_freqs], dtype=np.float32)
+        avg_length = float(lengths.mean()) if len(lengths) else 1.0
+        # Phần mẫu số BM25 phụ thuộc độ dài văn bản: k1 * (1 - b + b * |d| / avgdl)
+        norm = k1 * (1 - b + b * lengths / max(avg_length, 1e-6))
+
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for doc, tf in enumerate(term_freqs):
+            for term, count in tf.items():
+                postings.setdefault(term, []).append((doc, count))
+
+        n_docs = len(texts)
+        terms = sorted(postings)
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        doc_ids, weights = [], []
+        for i, term in enumerate(terms):
+            docs = postings[term]
+            # IDF của BM25 (Lucene): luôn > 0 kể cả term xuất hiện trong mọi văn bản
+            idf = np.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc, count in docs:
+                doc_ids.append(doc)
+                weights.append(idf * count * (k1 + 1) / (count + norm[doc]))
+            indptr[i + 1] = len(doc_ids)
+        return cls(terms, indptr, np.asarray(doc_ids, dtype=np.int32), np.asarray(weights, dtype=np.float32),
+                   list(node_ids), k1=k1, b=b)
+
+    @classmethod
+    def from_nodes(cls, nodes):
+        index = cls.build([node.node_id for node in nodes], [node.get_text() for node in nodes])
+        return index.bind(nodes)
+
+    def save(self, sparse_dir: str):
+        os.makedirs(sparse_dir, exist_ok=True)
+        terms = sorted(self.vocab, key=self.vocab.get)
+        with open(os.path.join(sparse_dir, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(terms, f, ensure_ascii=False)
+        np.save(os.path.join(sparse_dir, "indptr.npy"), self.indptr)
+        np.save(os.path.join(sparse_dir, "doc_ids.npy"), self.doc_ids)
+        np.save(os.path.join(sparse_dir, "weights.npy"), self.weights)
+        with open(os.path.join(sparse_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "node_ids": self.node_ids}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, sparse_dir: str):
+        with open(os.path.join(sparse_dir, "vocab.json"), encoding="utf-8") as f:
+            terms = json.load(f)
+        with open(os.path.join(sparse_dir, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays = [np.load(os.path.join(sparse_dir, f"{name}.npy")) for name in ("indptr", "doc_ids", "weights")]
+        return cls(terms, *arrays, node_ids=meta["node_ids"], k1=meta["k1"], b=meta["b"])
+
+    def bind(self, nodes):
+        """Gắn node của dense index theo node_id (văn bản không còn trong index -> bị bỏ khi tìm)."""
+        by_id = {node.node_id: node for node in nodes}
+        self.nodes = [by_id.get(node_id) for node_id in self.node_ids]
+        valid = np.array([node is not None for node in self.nodes], dtype=bool)
+        self._valid = None if valid.all() else valid
+        return self
+
+    # --- TRUY VẤN ---
+    def scores(self, query: str) -> np.ndarray:
+        """Điểm BM25 của mọi văn bản (0 = không có term nào khớp)."""
+        term_ids = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+        if not term_ids:
+            return np.zeros(len(self.node_ids), dtype=np.float32)
+        slices = [slice(self.indptr[t], self.indptr[t + 1]) for t in term_ids]
+        docs = np.concatenate([self.doc_ids[s] for s in slices])
+        weights = np.concatenate([self.weights[s] for s in slices])
+        scores = np.bincount(docs, weights=weights, minlength=len(self.node_ids))
+        if self._valid is not None:
+            scores[~self._valid] = 0.0
+        return scores
+
+    def search(self, query: str, top_k: int) -> List[Tuple[Any, float]]:
+        """[(node, điểm BM25)] giảm dần, chỉ gồm văn bản có ít nhất 1 term khớp."""
+        scores = self.scores(query)
+        matched = int(np.count_nonzero(scores))
+        k = min(top_k, matched)
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.nodes[i], float(scores[i])) for i in top]
+
+    def stats(self) -> dict:
+        return {"docs": len(self.node_ids), "terms": len(self.vocab), "postings": int(len(self.doc_ids))}
+
+
+def reciprocal_rank_fusion(rankings: List[List[Any]], k: int = 60, key=lambda node: node.node_id):
+    """RRF: điểm = tổng 1 / (k + hạng) qua các danh sách -> [(node, điểm)] giảm dần."""
+    fused: Dict[Any, list] = {}
+    for ranking in rankings:
+        for rank, node in enumerate(ranking, start=1):
+            entry = fused.setdefault(key(node), [node, 0.0])
+            entry[1] += 1.0 / (k + rank)
+    return sorted(((node, score) for node, score in fused.values()), key=lambda x: x[1], reverse=True)
+
+
+def load_sparse_index(nodes, sparse_dir: str = SPARSE_DIR) -> SparseIndex:
+    """Chỉ mục dựng sẵn bởi build_index.py; chưa có (index cũ) -> dựng trong RAM từ node của dense index."""
+    if os.path.exists(os.path.join(sparse_dir, "meta.json")):
+        index = SparseIndex.load(sparse_dir).bind(nodes)
+        missing = sum(node is None for node in index.nodes)
+        if missing or len(index) != len(nodes):
+            logger.warning("BM25 index lệch với dense index (chạy lại build_index.py)",
+                           extra={"sparse_docs": len(index), "dense_docs": len(nodes), "missing": missing})
+        return index
+    logger.warning("chưa có BM25 index dựng sẵn -> dựng trong RAM", extra={"sparse_dir": sparse_dir})
+    return SparseIndex.from_nodes(nodes)
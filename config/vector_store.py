@@ -1,24 +1,258 @@
 import os
-from llama_index.core import StorageContext, load_index_from_storage, Settings
-from config.embed import load_embed
+from llama_index.core import MockEmbedding, StorageContext, VectorStoreIndex, load_index_from_storage, Settings
+from llama_index.core.vector_stores import FilterOperator, MetadataFilter, MetadataFilters
+from config.compact_store import CompactVectorIndex, is_compact_dir, save_compact_index
+from config.embed import EMBED_BATCH_MAX, MICROBATCH, BatchedQueryEmbedding, CachedQueryEmbedding, load_embed
 from config.llm import load_llm
+from utils.embed_cache import get_query_cache
+from utils.observability import get_logger, span
 
-def get_vector_store():
-    # 1. Đường dẫn tới DB vừa build
-    PERSIST_DIR = "./FoodDB"
-    
+logger = get_logger("vector_store")
+
+# ==============================================================================
+# BACKEND VECTOR STORE (chọn bằng biến môi trường VECTOR_BACKEND)
+# ==============================================================================
+#   simple  : JSON mặc định của LlamaIndex (./FoodDB)
+#   compact : embeddings.npy memmap + nodes.jsonl (build_index.py --backend compact)
+#   chroma  : Chroma PersistentClient (SQLite + HNSW) tại ./chroma_db
+#   auto    : compact nếu PERSIST_DIR là định dạng compact, ngược lại simple
+PERSIST_DIR = os.getenv("PERSIST_DIR", "./FoodDB")
+CHROMA_DIR = os.getenv("CHROMA_DIR", "./chroma_db")
+CHROMA_COLLECTION = os.getenv("CHROMA_COLLECTION", "foods")
+
+
+def get_backend_name():
+    backend = os.getenv("VECTOR_BACKEND", "auto").lower()
+    if backend == "auto":
+        return "compact" if is_compact_dir(PERSIST_DIR) else "simple"
+    return backend
+
+
+def _get_chroma_collection(reset=False):
+    import chromadb
+
+    client = chromadb.PersistentClient(path=CHROMA_DIR)
+    if reset and CHROMA_COLLECTION in [c.name for c in client.list_collections()]:
+        client.delete_collection(CHROMA_COLLECTION)
+    # Cosine để khớp với SimpleVectorStore / compact
+    return client.get_or_create_collection(CHROMA_COLLECTION, metadata={"hnsw:space": "cosine"})
+
+
+def _load_simple():
     if not os.path.exists(PERSIST_DIR):
         raise ValueError(f"❌ Không tìm thấy thư mục '{PERSIST_DIR}'. Hãy chạy build_index.py trước!")
+    # Parse docstore / vector store JSON (phần chậm) - chưa cần embedding model
+    return StorageContext.from_defaults(persist_dir=PERSIST_DIR)
+
+
+def _load_compact():
+    if not is_compact_dir(PERSIST_DIR):
+        raise ValueError(f"❌ '{PERSIST_DIR}' không phải index compact. Chạy build_index.py --backend compact!")
+    return CompactVectorIndex.load(PERSIST_DIR)
+
+
+def _load_chroma():
+    from llama_index.vector_stores.chroma import ChromaVectorStore
+
+    collection = _get_chroma_collection()
+    if collection.count() == 0:
+        raise ValueError(f"❌ Collection Chroma '{CHROMA_COLLECTION}' đang rỗng. Chạy build_index.py --backend chroma!")
+    # Không đọc lại toàn bộ vector vào RAM: HNSW + SQLite nằm trên đĩa, filter đẩy xuống Chroma (where)
+    return ChromaVectorStore(chroma_collection=collection)
+
+
+def _assemble_simple(storage_context, embed_model):
+    return load_index_from_storage(storage_context, embed_model=embed_model)
+
+
+def _assemble_compact(index, embed_model):
+    index.embed_model = embed_model
+    return index
+
+
+def _assemble_chroma(vector_store, embed_model):
+    return VectorStoreIndex.from_vector_store(vector_store, embed_model=embed_model)
+
+
+# backend -> (đọc dữ liệu index từ đĩa, ghép với embedding model)
+_BACKEND_LOADERS = {
+    "simple": (_load_simple, _assemble_simple),
+    "compact": (_load_compact, _assemble_compact),
+    "chroma": (_load_chroma, _assemble_chroma),
+}
+
+
+def _checked_backend():
+    backend = get_backend_name()
+    if backend not in _BACKEND_LOADERS:
+        raise ValueError(f"❌ VECTOR_BACKEND không hợp lệ: '{backend}' (simple / compact / chroma)")
+    return backend
+
 
-    print(f"📂 Đang tải Vector Database từ: {PERSIST_DIR}")
+def load_embed_model():
+    """Embedding model (+ micro-batch + cache query embedding). Cấu hình phải khớp với lúc build index."""
+    if MICROBATCH:
+        # encode() chia theo embed_batch_size -> nâng lên để cả micro-batch đi chung 1 forward pass
+        embed_model = BatchedQueryEmbedding(load_embed(embed_batch_size=max(3, EMBED_BATCH_MAX)))
+    else:
+        embed_model = load_embed()
+    if os.getenv("EMBED_CACHE", "1") != "0":
+        # Query embedding đi qua cache LRU/TTL (câu hỏi lặp lại không phải nhúng lại trên CPU)
+        embed_model = CachedQueryEmbedding(embed_model, get_query_cache(embed_model.model_name))
+    return embed_model
 
-    # 2. Cấu hình Global (QUAN TRỌNG: Phải khớp với lúc build)
-    Settings.embed_model = load_embed()
+
+def load_index_storage():
+    """
+    Phần đọc đĩa của index, KHÔNG cần embedding model -> chạy song song với load_embed_model()
+    (AppResources.start_warm_up), rồi ghép lại bằng assemble_index().
+    """
+    backend = _checked_backend()
+    location = CHROMA_DIR if backend == "chroma" else PERSIST_DIR
+    logger.info("loading vector store", extra={"backend": backend, "location": location})
+    with span("index_load") as load:
+        storage = _BACKEND_LOADERS[backend][0]()
+    logger.info("index loaded", extra={"backend": backend, "load_ms": round(load.ms, 1)})
+    return storage
+
+
+def assemble_index(storage, embed_model):
+    return _BACKEND_LOADERS[_checked_backend()][1](storage, embed_model)
+
+
+def get_vector_store():
+    """Nạp tuần tự embedding model + index (script / evaluation; server dùng AppResources.start_warm_up)."""
+    _checked_backend()
+
+    # Cấu hình Global (QUAN TRỌNG: Phải khớp với lúc build)
+    embed_model = load_embed_model()
+    Settings.embed_model = embed_model
     Settings.llm = load_llm()
+    return assemble_index(load_index_storage(), embed_model)
+
+
+def get_index_version():
+    """Chuỗi phiên bản FoodDB (backend + mtime file dữ liệu) - đổi khi build lại index."""
+    backend = get_backend_name()
+    if backend == "chroma":
+        paths = [os.path.join(CHROMA_DIR, "chroma.sqlite3")]
+    elif backend == "compact":
+        paths = [os.path.join(PERSIST_DIR, name) for name in ("index_meta.json", "nodes.jsonl")]
+    else:
+        paths = [os.path.join(PERSIST_DIR, "docstore.json")]
+    stamps = [f"{os.path.getmtime(p):.0f}" for p in paths if os.path.exists(p)]
+    return f"{backend}:" + ":".join(stamps)
+
+
+def save_vector_store(nodes, backend="simple", persist_dir=PERSIST_DIR, dtype="float32", embed_model=None):
+    """
+    Ghi các node ĐÃ CÓ embedding xuống backend được chọn (dùng bởi build_index.py).
+    embed_model: model vừa dùng để nhúng (None khi --incremental chỉ xóa món -> không nạp model).
+    """
+    if backend == "compact":
+        save_compact_index(persist_dir, nodes, dtype=dtype)
+    elif backend == "chroma":
+        from llama_index.vector_stores.chroma import ChromaVectorStore
+
+        ChromaVectorStore(chroma_collection=_get_chroma_collection(reset=True)).add(nodes)
+    elif backend == "simple":
+        if embed_model is None:
+            # Không truyền model -> LlamaIndex tự tìm model mặc định (OpenAI) và lỗi. Node đã có vector
+            # nên không nhúng lại gì: MockEmbedding chỉ để dựng index (lúc phục vụ dùng model thật)
+            if any(node.embedding is None for node in nodes):
+                raise ValueError("❌ Có node chưa có embedding mà không truyền embed_model")
+            embed_model = MockEmbedding(embed_dim=len(nodes[0].embedding) if nodes else 1)
+        index = VectorStoreIndex(nodes, embed_model=embed_model)
+        index.storage_context.persist(persist_dir=persist_dir)
+    else:
+        raise ValueError(f"❌ Backend không hợp lệ: '{backend}'")
+
+
+def load_stored_embeddings(backend="simple", persist_dir=PERSIST_DIR):
+    """
+    Đọc {node_id: (content_hash, embedding)} từ index đã build (cho build_index.py --incremental).
+    Index cũ chưa có content_hash -> hash = None -> mọi dòng sẽ được nhúng lại.
+    """
+    stored = {}
+    if backend == "compact":
+        if not is_compact_dir(persist_dir):
+            return stored
+        index = CompactVectorIndex.load(persist_dir, mmap=False)
+        for node, embedding in zip(index.nodes, index.embeddings):
+            stored[node.node_id] = (node.metadata.get("content_hash"), embedding.astype("float32").tolist())
+    elif backend == "chroma":
+        data = _get_chroma_collection().get(include=["embeddings", "metadatas"])
+        for node_id, embedding, meta in zip(data["ids"], data["embeddings"], data["metadatas"]):
+            stored[node_id] = (meta.get("content_hash"), list(embedding))
+    elif backend == "simple":
+        if not os.path.exists(os.path.join(persist_dir, "docstore.json")):
+            return stored
+        storage_context = StorageContext.from_defaults(persist_dir=persist_dir)
+        embedding_dict = storage_context.vector_store.data.embedding_dict
+        for node_id, node in storage_context.docstore.docs.items():
+            if node_id in embedding_dict:
+                stored[node_id] = (node.metadata.get("content_hash"), embedding_dict[node_id])
+    return stored
+
+
+def update_chroma_nodes(upsert_nodes, delete_ids):
+    """Cập nhật Chroma tại chỗ: xóa node bị bỏ/sửa rồi thêm bản mới (mỗi lệnh là 1 transaction SQLite)."""
+    from llama_index.vector_stores.chroma import ChromaVectorStore
+
+    collection = _get_chroma_collection()
+    ids = list(delete_ids) + [node.node_id for node in upsert_nodes]
+    if ids:
+        collection.delete(ids=ids)
+    if upsert_nodes:
+        ChromaVectorStore(chroma_collection=collection).add(upsert_nodes)
+
+
+def get_node_metadata(index):
+    """Trả về list metadata (dish_name, calories, ...) của toàn bộ node trong index."""
+    if isinstance(index, CompactVectorIndex):
+        return [dict(node.metadata or {}) for node in index.nodes]
+    if index.docstore.docs:
+        return [dict(node.metadata or {}) for node in index.docstore.docs.values()]
+    # Chroma: node chỉ nằm trong vector store -> đọc metadata thẳng từ collection (bỏ field nội bộ "_...")
+    metadatas = index.vector_store.client.get(include=["metadatas"])["metadatas"]
+    return [{k: v for k, v in m.items()
+             if not k.startswith("_") and k not in ("doc_id", "document_id", "ref_doc_id", "content_hash")}
+            for m in metadatas]
+
+
+def get_index_nodes(index):
+    """Trả về toàn bộ TextNode của index (compact / docstore / Chroma)."""
+    if isinstance(index, CompactVectorIndex):
+        return list(index.nodes)
+    if index.docstore.docs:
+        return list(index.docstore.docs.values())
+    from llama_index.core.vector_stores.utils import metadata_dict_to_node
+
+    # Chroma: node được lưu nguyên trong metadata "_node_content" của từng bản ghi
+    data = index.vector_store.client.get(include=["metadatas", "documents"])
+    nodes = []
+    for node_id, meta, text in zip(data["ids"], data["metadatas"], data["documents"]):
+        node = metadata_dict_to_node(meta, text=text)
+        node.id_ = node_id
+        nodes.append(node)
+    return nodes
+
+
+# Condition.op (api/nutrition_table.py) -> toán tử MetadataFilter
+_CONDITION_OPERATORS = {"<": FilterOperator.LT, "<=": FilterOperator.LTE,
+                        ">": FilterOperator.GT, ">=": FilterOperator.GTE}
+
 
-    # 3. Load Index
-    storage_context = StorageContext.from_defaults(persist_dir=PERSIST_DIR)
-    index = load_index_from_storage(storage_context)
-    
-    print("✅ Đã nạp Index thành công!")
-    return index
\ No newline at end of file
+def nutrition_filters(conditions):
+    """
+    Điều kiện số [(nutrient, op, value)] -> MetadataFilters; simple / compact / Chroma lọc ngay trong store
+    trước khi lấy top-k (không lấy top-k rồi mới lọc bỏ).
+    """
+    filters, guarded = [], set()
+    for nutrient, op, value in conditions:
+        filters.append(MetadataFilter(key=nutrient, operator=_CONDITION_OPERATORS[op], value=value))
+        if op in ("<", "<=") and nutrient not in guarded:
+            # build_index ghi 0 khi ô CSV trống -> món thiếu số liệu không được lọt qua điều kiện "dưới"
+            guarded.add(nutrient)
+            filters.append(MetadataFilter(key=nutrient, operator=FilterOperator.GT, value=0))
+    return MetadataFilters(filters=filters) if filters else None
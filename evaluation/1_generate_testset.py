@@ -23,25 +23,29 @@ def generate_testset():
         if pd.notna(row['ingredients']):
             test_data.append({
                 "question": f"Thành phần chính của món {dish_name} gồm những gì?",
-                "ground_truth": row['ingredients']
+                "ground_truth": row['ingredients'],
+                "dish_name": dish_name
             })
             
         # 2. Tạo câu hỏi về Calo (Nutrition) - Nếu có cột calories
         if pd.notna(row['calories']):
              test_data.append({
                 "question": f"Món {dish_name} bao nhiêu calo?",
-                "ground_truth": f"Khoảng {row['calories']} calo."
+                "ground_truth": f"Khoảng {row['calories']} calo.",
+                "dish_name": dish_name
             })
 
     # Thêm vài câu hỏi bẫy (Edge Cases) thủ công
     test_data.append({
         "question": "Món trứng khủng long kho tộ có ngon không?",
-        "ground_truth": "Xin lỗi, đây là món ăn hư cấu không có thực."
+        "ground_truth": "Xin lỗi, đây là món ăn hư cấu không có thực.",
+        "dish_name": ""
     })
     
     test_data.append({
         "question": "Thời tiết hôm nay thế nào?",
-        "ground_truth": "Xin lỗi, tôi là trợ lý dinh dưỡng, tôi không trả lời về thời tiết."
+        "ground_truth": "Xin lỗi, tôi là trợ lý dinh dưỡng, tôi không trả lời về thời tiết.",
+        "dish_name": ""
     })
 
     # Lưu ra CSV
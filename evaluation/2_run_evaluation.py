@@ -1,22 +1,68 @@
+"""
+Chấm điểm Lucfin RAG bằng Ragas trên TOÀN BỘ evaluation/testset_ground_truth.csv.
+
+  1. Inference song song: N worker (--concurrency) + giới hạn tốc độ gọi Groq (--rps), tự retry khi lỗi
+     Chain dựng qua AppResources giống hệt app (reranker, dish index, BM25, intent classifier),
+     chỉ thay model trả lời bằng EVAL_RAG_MODEL
+  2. Checkpoint: mỗi câu trả lời xong được ghi ngay vào evaluation/eval_checkpoint.jsonl
+     -> chạy lại chỉ làm các câu chưa xong / bị lỗi; --skip-inference để chỉ chấm lại
+     Mỗi câu gắn "dấu vân tay" của lần chạy (git HEAD + thay đổi chưa commit trong api/ config/ utils/, model, index,
+     biến môi trường ảnh hưởng câu trả lời). Checkpoint của cấu hình khác -> từ chối chạy tiếp,
+     --fresh để cất checkpoint cũ sang file .bak và trả lời lại từ đầu.
+  3. Ragas chấm song song, embedding của giám khảo nhúng theo batch
+
+Chạy:
+    python evaluation/2_run_evaluation.py --concurrency 4 --rps 0.5
+    python evaluation/2_run_evaluation.py --skip-inference        # chỉ chấm lại từ checkpoint
+    python evaluation/2_run_evaluation.py --limit 10              # test nhanh
+    python evaluation/2_run_evaluation.py --fresh                 # sau khi đổi code / prompt / index / model
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import subprocess
 import sys
 import os
+import time
 import pandas as pd
 from datasets import Dataset
 from ragas import evaluate
 from ragas.metrics import faithfulness, answer_relevancy, context_precision
+from ragas.run_config import RunConfig
 from langchain_groq import ChatGroq
 from langchain_core.embeddings import Embeddings
 from dotenv import load_dotenv
 
 # --- SETUP ĐƯỜNG DẪN ---
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from config.vector_store import get_vector_store
-from config.embed import load_embed
-from api.langchain_utils import get_conversational_rag_chain
+from config.vector_store import get_index_version
+from config.embed import EMBED_MODEL_NAME, load_embed
+from config.llm import load_chat_llm
+from config.onnx_backend import INFERENCE_BACKEND
+from api.dependencies import AppResources
 
 load_dotenv()
 api_key = os.getenv("MY_API_KEY")
 
+TESTSET_PATH = os.path.join("evaluation", "testset_ground_truth.csv")
+CHECKPOINT_PATH = os.path.join("evaluation", "eval_checkpoint.jsonl")
+OUTPUT_EXCEL = os.path.join("evaluation", "lucfin_final_report.xlsx")
+# Dùng Llama 3.3 70B thay cho Qwen đã bị xóa
+RAG_MODEL = os.getenv("EVAL_RAG_MODEL", "llama-3.3-70b-versatile")
+JUDGE_MODEL = "llama-3.3-70b-versatile"
+# Biến môi trường mà chain RAG của app (AppResources.get_rag_chain) thật sự đọc -> đổi câu trả lời / context
+FINGERPRINT_ENV = (
+    "LLM_BASE_URL",                                                          # config/llm.py
+    "VECTOR_BACKEND", "PERSIST_DIR", "CHROMA_DIR", "CHROMA_COLLECTION",      # config/vector_store.py
+    "DISH_INDEX", "DISH_FUZZY_THRESHOLD", "DISH_ALIASES_PATH", "HYBRID_SEARCH",  # api/dependencies.py
+    "SPARSE_DIR", "BM25_K1", "BM25_B",                                       # config/sparse_index.py
+    "RERANK_CANDIDATES", "RERANK_SKIP_SCORE", "RERANK_SKIP_MARGIN", "RRF_K",  # api/langchain_utils.py
+    "PROMPT_TOKEN_BUDGET", "HISTORY_ANSWER_TOKENS", "REWRITE_HISTORY_TOKENS", "PROMPT_TOKENIZER",  # api/prompt_builder.py
+)
+# Code quyết định câu trả lời: sửa chỗ khác (script, biểu đồ, README) không làm mất checkpoint
+ANSWER_PATHS = ("api", "config", "utils")
+
 # ==============================================================================
 # 👇 CLASS WRAPPER ĐÃ FIX LỖI VALIDATION
 # ==============================================================================
@@ -28,94 +74,231 @@ class LlamaIndexToLangchainWrapper(Embeddings):
         self.model = "AITeamVN/Vietnamese_Embedding"
 
     def embed_documents(self, texts: list[str]) -> list[list[float]]:
-        # Gọi model thật để embed
-        return [self.internal_model.get_text_embedding(t) for t in texts]
+        # Nhúng cả lô 1 lần (embed_batch_size của model) thay vì từng câu một
+        return self.internal_model.get_text_embedding_batch(list(texts))
 
     def embed_query(self, text: str) -> list[float]:
         # Gọi model thật để embed
         return self.internal_model.get_query_embedding(text)
 # ==============================================================================
 
-def run_evaluation():
+
+def question_key(question: str) -> str:
+    return hashlib.sha1(question.strip().encode("utf-8")).hexdigest()[:16]
+
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_fingerprint():
+    """(mã ngắn, chi tiết) của cấu hình sinh câu trả lời - đổi code / prompt / index / model -> mã khác."""
+    parts = {
+        "git_head": _git("rev-parse", "HEAD").strip(),
+        # Code đã sửa nhưng chưa commit cũng làm đổi câu trả lời
+        "git_dirty": hashlib.sha1(_git("diff", "HEAD", "--", *ANSWER_PATHS).encode("utf-8")).hexdigest()[:12],
+        "rag_model": RAG_MODEL,
+        "embed_model": EMBED_MODEL_NAME,
+        "inference_backend": INFERENCE_BACKEND,
+        # Mức lượng tử hóa chỉ có tác dụng với backend ONNX
+        "onnx_quantization": os.getenv("ONNX_QUANTIZATION") if INFERENCE_BACKEND == "onnx" else None,
+        "index_version": get_index_version(),
+        "env": {name: os.getenv(name) for name in FINGERPRINT_ENV if os.getenv(name) is not None},
+    }
+    digest = hashlib.sha1(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    return digest, parts
+
+
+def load_checkpoint(path, fingerprint):
+    """({key: record} của đúng cấu hình hiện tại, {fingerprint khác: số câu}) từ các lần chạy trước."""
+    done, stale = {}, {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    if record.get("fingerprint") == fingerprint:
+                        done[record["key"]] = record
+                    else:
+                        old = record.get("fingerprint") or "không rõ"
+                        stale[old] = stale.get(old, 0) + 1
+    return done, stale
+
+
+class RateLimiter:
+    """Giãn đều thời điểm bắt đầu các request: tối đa `rps` request / giây (0 = không giới hạn)."""
+
+    def __init__(self, rps: float):
+        self.interval = 1.0 / rps if rps > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def run_inference(rag_chain, rows, checkpoint_path, fingerprint, concurrency, rps, retries):
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rps)
+    write_lock = asyncio.Lock()
+    finished = 0
+
+    async def answer_one(row):
+        nonlocal finished
+        async with semaphore:
+            for attempt in range(retries + 1):
+                await limiter.wait()
+                started = time.perf_counter()
+                try:
+                    # Fake chat history rỗng
+                    response = await rag_chain.ainvoke({"input": row["question"], "chat_history": []})
+                    break
+                except Exception as e:
+                    if attempt == retries:
+                        print(f"   ❌ Lỗi: {row['question'][:60]} -> {e}")
+                        return
+                    # 429 / timeout của Groq -> chờ lùi dần rồi thử lại
+                    await asyncio.sleep(2 ** attempt)
+
+        record = {
+            "key": row["key"], "fingerprint": fingerprint,
+            "question": row["question"], "ground_truth": row["ground_truth"],
+            "answer": str(response["answer"]),
+            # Lấy list nội dung context
+            "contexts": [doc.page_content for doc in response["context"]] or ["No context found"],
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            "timings": {k: round(v, 1) for k, v in response.get("timings", {}).items()},
+        }
+        async with write_lock:
+            # Ghi ngay từng câu -> dừng giữa chừng vẫn giữ được phần đã làm
+            with open(checkpoint_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            finished += 1
+            print(f"   ✅ [{finished}/{len(rows)}] {record['latency_ms']:.0f}ms  {row['question'][:60]}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(answer_one(row) for row in rows))
+    elapsed = time.perf_counter() - started
+    if rows:
+        print(f"⏱️ Inference {finished}/{len(rows)} câu trong {elapsed:.1f}s ({finished / elapsed:.2f} câu/s)")
+
+
+def run_evaluation(args):
     print("🚀 Đang khởi động hệ thống Lucfin RAG để chấm thi...")
-    
-    # 1. Load Model & Wrap lại
-    print("   - Loading Embedding Model...")
-    llama_embed_model = load_embed()
-    ragas_embed_model = LlamaIndexToLangchainWrapper(llama_embed_model) 
-
-    print("   - Loading Vector Store...")
-    vector_store = get_vector_store()
-    
-    # Load LLM
-    print("   - Loading LLMs...")
-    # Dùng Llama 3.3 70B thay cho Qwen đã bị xóa
-    llm_rag = ChatGroq(model="llama-3.3-70b-versatile", api_key=api_key, temperature=0)
-    rag_chain = get_conversational_rag_chain(llm_rag, vector_store)
-    
-    judge_llm = ChatGroq(model="llama-3.3-70b-versatile", api_key=api_key, temperature=0)
-
-    # 2. Đọc Testset & Cắt ngắn
-    testset_path = os.path.join("evaluation", "testset_ground_truth.csv")
-    if not os.path.exists(testset_path):
-        print("❌ Không tìm thấy file testset_ground_truth.csv")
+
+    # 1. Đọc toàn bộ Testset (không cắt head(10) nữa)
+    if not os.path.exists(args.testset):
+        print(f"❌ Không tìm thấy file {args.testset}")
         return
+    df = pd.read_csv(args.testset)
+    if args.limit:
+        df = df.head(args.limit)
+    df["key"] = [question_key(q) for q in df["question"]]
+    print(f"📥 Đã tải {len(df)} câu hỏi.")
 
-    full_df = pd.read_csv(testset_path)
-    
-    # 👇 CẮT LẤY 5 CÂU (Đảm bảo cắt ngay từ đầu)
-    df = full_df.head(10).copy()
-    print(f"📥 Đã tải {len(df)} câu hỏi (Test nhanh 5 câu).")
-
-    # 3. Bot làm bài (Inference)
-    answers = []
-    contexts = []
-    
-    print("🤖 Bot đang trả lời...")
-    for index, row in df.iterrows():
-        question = row['question']
-        try:
-            # Fake chat history rỗng
-            response = rag_chain.invoke({"input": question, "chat_history": []})
-            
-            ans_text = str(response['answer'])
-            # Lấy list nội dung context
-            source_docs = [doc.page_content for doc in response['context']]
-            
-            answers.append(ans_text)
-            contexts.append(source_docs)
-            print(f"   ✅ Done Q{index+1}")
-        except Exception as e:
-            print(f"   ❌ Lỗi Q{index+1}: {e}")
-            answers.append("Lỗi hệ thống")
-            contexts.append(["No context found"])
-
-    # 4. Chuẩn bị dữ liệu chấm
+    fingerprint, parts = run_fingerprint()
+    print(f"🔖 Cấu hình {fingerprint}: {json.dumps(parts, ensure_ascii=False)}")
+    if args.fresh and os.path.exists(args.checkpoint):
+        backup = f"{args.checkpoint}.{time.strftime('%Y%m%d-%H%M%S')}.bak"
+        os.replace(args.checkpoint, backup)
+        print(f"🗂️ --fresh: checkpoint cũ chuyển sang {backup}")
+    done, stale = load_checkpoint(args.checkpoint, fingerprint)
+    if stale:
+        # Câu trả lời sinh bởi code / prompt / index / model khác -> không được chấm như kết quả mới
+        print(f"❌ {args.checkpoint} có câu trả lời của cấu hình khác ({stale}), hiện tại là {fingerprint}.")
+        print("   Chạy lại với --fresh để trả lời lại từ đầu (checkpoint cũ được giữ trong file .bak).")
+        return
+    todo = [row for row in df.to_dict("records") if row["key"] not in done]
+    print(f"💾 Checkpoint: {len(df) - len(todo)} câu đã có kết quả, còn {len(todo)} câu cần trả lời.")
+
+    # 2. Bot làm bài (Inference) - chỉ các câu chưa có trong checkpoint
+    embed_model = None
+    if todo and not args.skip_inference:
+        # Dựng chain đúng như app (reranker, dish index, BM25, intent classifier), chỉ thay model trả lời
+        print("   - Loading models + Vector Store (AppResources)...")
+        resources = AppResources()
+        resources.load_models()
+        index = resources.get_index()  # load_models nuốt lỗi index -> gọi lại để lỗi hiện ra
+        if resources.components["reranker"].state != "ready":
+            print(f"❌ Không nạp được reranker ({resources.components['reranker'].error}) "
+                  "-> điểm sẽ không phản ánh pipeline thật.")
+            return
+        resources.llm = load_chat_llm(model=RAG_MODEL, http_client=resources.http_client,
+                                      http_async_client=resources.http_async_client)
+        embed_model = resources.embed_model
+        rag_chain = resources.get_rag_chain(index)
+
+        print(f"🤖 Bot đang trả lời ({args.concurrency} worker, tối đa {args.rps or '∞'} request/s)...")
+        asyncio.run(run_inference(rag_chain, todo, args.checkpoint, fingerprint, args.concurrency, args.rps,
+                                  args.retries))
+        done, _ = load_checkpoint(args.checkpoint, fingerprint)
+
+    # 3. Embedding cho giám khảo: dùng lại model AppResources đã nạp, chỉ nạp riêng khi bỏ qua inference
+    if embed_model is None:
+        print("   - Loading Embedding Model...")
+        embed_model = load_embed()
+    ragas_embed_model = LlamaIndexToLangchainWrapper(embed_model)
+
+    # 4. Chuẩn bị dữ liệu chấm (theo đúng thứ tự testset, bỏ câu còn lỗi)
+    records = [done[k] for k in df["key"] if k in done]
+    if not records:
+        print("❌ Chưa có câu trả lời nào để chấm.")
+        return
+    missing = len(df) - len(records)
+    if missing:
+        print(f"⚠️ {missing} câu chưa có câu trả lời (lỗi) -> chạy lại để bổ sung.")
     ragas_data = {
-        'question': df['question'].tolist(),
-        'answer': answers,
-        'contexts': contexts,
-        'ground_truth': df['ground_truth'].tolist()
+        'question': [r["question"] for r in records],
+        'answer': [r["answer"] for r in records],
+        'contexts': [r["contexts"] for r in records],
+        'ground_truth': [r["ground_truth"] for r in records],
     }
     dataset = Dataset.from_dict(ragas_data)
 
     # 5. Chấm điểm
-    print("\n⚖️  Giám khảo Ragas đang chấm điểm...")
+    print(f"\n⚖️  Giám khảo Ragas đang chấm điểm {len(records)} câu...")
+    judge_llm = ChatGroq(model=JUDGE_MODEL, api_key=api_key, temperature=0)
     # Lưu ý: Cảnh báo "1 generations instead of 3" là bình thường với Groq, cứ kệ nó.
     results = evaluate(
         dataset=dataset,
         metrics=[faithfulness, answer_relevancy, context_precision],
-        llm=judge_llm, 
-        embeddings=ragas_embed_model # Dùng Wrapper đã fix
+        llm=judge_llm,
+        embeddings=ragas_embed_model,  # Dùng Wrapper đã fix
+        run_config=RunConfig(max_workers=args.concurrency, max_retries=args.retries),
     )
 
     # 6. Xuất kết quả
     print("\n📊 KẾT QUẢ FINAL:")
     print(results)
-    
-    output_excel = os.path.join("evaluation", "lucfin_final_report.xlsx")
-    results.to_pandas().to_excel(output_excel, index=False)
-    print(f"✅ Xong! File Excel lưu tại: {output_excel}")
+
+    report = results.to_pandas()
+    report["latency_ms"] = [r["latency_ms"] for r in records]
+    report["fingerprint"] = fingerprint
+    report.to_excel(args.output, index=False)
+    print(f"✅ Xong! File Excel lưu tại: {args.output}")
+
 
 if __name__ == "__main__":
-    run_evaluation()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Ragas evaluation cho Lucfin RAG")
+    parser.add_argument("--testset", default=TESTSET_PATH)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--output", default=OUTPUT_EXCEL)
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("EVAL_CONCURRENCY", "4")))
+    parser.add_argument("--rps", type=float, default=float(os.getenv("EVAL_RPS", "0.5")),
+                        help="Số request Groq tối đa mỗi giây (0 = không giới hạn)")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--limit", type=int, default=0, help="Chỉ lấy N câu đầu (0 = toàn bộ testset)")
+    parser.add_argument("--skip-inference", action="store_true", help="Chỉ chấm lại từ checkpoint")
+    parser.add_argument("--fresh", action="store_true",
+                        help="Cất checkpoint cũ (.bak) và trả lời lại toàn bộ (bắt buộc khi cấu hình đổi)")
+    run_evaluation(parser.parse_args())
@@ -0,0 +1,156 @@
+"""
+Benchmark throughput của /ask khi có nhiều request đồng thời.
+
+So sánh 2 chế độ:
+  - blocking: mô phỏng code cũ (gọi .invoke / retrieve đồng bộ ngay trên event loop)
+  - async:    luồng mới (ainvoke + thread pool giới hạn cho retriever)
+
+LLM Groq và LlamaIndex được thay bằng bản giả có độ trễ cố định,
+nên benchmark chạy offline và chỉ đo phần "xếp hàng" do event loop bị chặn.
+
+Chạy:  python evaluation/benchmark_async.py --requests 32 --concurrency 16
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from typing import Any, List, Optional
+
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# --- SETUP ĐƯỜNG DẪN ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import api.end_points as end_points
+import api.langchain_utils as langchain_utils
+from api.dependencies import AppResources
+
+
+class FakeGroq(BaseChatModel):
+    """Chat model giả: trả lời cố định sau `latency` giây."""
+    latency: float = 0.3
+    blocking: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-groq"
+
+    def _text(self, messages) -> str:
+        prompt = " ".join(str(m.content) for m in messages)
+        if "Phân loại câu hỏi" in prompt:
+            return "NEW_TOPIC"
+        # Giống qwen3: có khối <think> trước câu trả lời
+        return "<think>Người dùng hỏi về calo của phở.</think>\n\nPhở bò khoảng 450 calo mỗi tô, nhiều đạm từ thịt bò."
+
+    def _reply(self, messages) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._text(messages)))])
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return self._reply(messages)
+
+    async def _agenerate(self, messages, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs) -> ChatResult:
+        if self.blocking:
+            # Mô phỏng code cũ: gọi HTTP đồng bộ ngay trong coroutine
+            time.sleep(self.latency)
+        else:
+            await asyncio.sleep(self.latency)
+        return self._reply(messages)
+
+    async def _astream(self, messages, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs):
+        # Chia đều độ trễ cho từng "token" (từ) để đo time-to-first-token
+        tokens = self._text(messages).split(" ")
+        for i, token in enumerate(tokens):
+            await asyncio.sleep(self.latency / len(tokens))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token if i == 0 else " " + token))
+
+
+class FakeRetriever:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def retrieve(self, query):
+        # Embedding CPU + similarity search là tác vụ đồng bộ
+        time.sleep(self.latency)
+        return []
+
+
+class FakeIndex:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def as_retriever(self, **kwargs):
+        return FakeRetriever(self.latency)
+
+
+class FakeResources(AppResources):
+    """
+    AppResources thật, chỉ thay LLM + index bằng bản giả (không cần API key / model thật).
+    Thành phần mới thêm vào AppResources tự có ở đây; embed_model / reranker / chỉ mục phụ giữ None
+    (tắt semantic cache, rerank, tra bảng) để đo đúng số lần gọi LLM.
+    """
+    def __init__(self, llm, index):
+        super().__init__()
+        self.llm = self.classifier_llm = llm
+        self.index = index
+
+
+def install_fakes(app, mode, llm_latency, retrieve_latency):
+    blocking = mode == "blocking"
+    llm = FakeGroq(latency=llm_latency, blocking=blocking)
+    app.state.resources = FakeResources(llm, FakeIndex(retrieve_latency))
+
+    if blocking:
+        # Bỏ thread pool: retriever chạy thẳng trên event loop như trước
+        async def inline(func, *args, **kwargs):
+            return func(*args, **kwargs)
+        end_points.run_blocking = inline
+        langchain_utils.run_blocking = inline
+
+
+async def run_load(app, n_requests, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        async def one(i):
+            async with sem:
+                r = await client.post("/ask", json={"question": "Phở bao nhiêu calo?", "session_id": f"bench-{i}"})
+                r.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(n_requests)))
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /ask blocking vs async")
+    parser.add_argument("--mode", choices=["blocking", "async", "both"], default="both")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--retrieve-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    if args.mode == "both":
+        print(f"📊 {args.requests} request, concurrency={args.concurrency}, "
+              f"LLM={args.llm_latency}s/call, retrieve={args.retrieve_latency}s")
+        # Mỗi chế độ chạy trong process riêng để các bản fake không dính nhau
+        for mode in ("blocking", "async"):
+            subprocess.run([
+                sys.executable, __file__, "--mode", mode,
+                "--requests", str(args.requests), "--concurrency", str(args.concurrency),
+                "--llm-latency", str(args.llm_latency), "--retrieve-latency", str(args.retrieve_latency),
+            ], check=True)
+        return
+
+    from main import app
+    install_fakes(app, args.mode, args.llm_latency, args.retrieve_latency)
+    elapsed = asyncio.run(run_load(app, args.requests, args.concurrency))
+    print(f"   [{args.mode:8}] {elapsed:6.2f}s  ->  {args.requests / elapsed:6.2f} req/s")
+
+if __name__ == "__main__":
+    main()
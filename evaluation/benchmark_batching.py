@@ -0,0 +1,127 @@
+"""
+Throughput vs p95 latency của micro-batching (utils/batching.py) cho embedding câu hỏi và rerank.
+
+Mỗi client là 1 thread (giống retriever chạy trong run_blocking), gửi liên tục `--requests` lời gọi:
+  - embed : 1 câu hỏi / lời gọi
+  - rerank: `--candidates` cặp (câu hỏi, ứng viên) / lời gọi
+So sánh:
+  - none     : mỗi lời gọi 1 forward pass riêng (như trước)
+  - wait=Xms : MicroBatcher với max_wait_ms = X (0 = chỉ gom những gì đã xếp hàng khi model bận)
+
+Mặc định dùng model giả: 1 forward pass = `--overhead-ms` + `--item-ms` x số phần tử, và chỉ 1 pass chạy
+tại 1 thời điểm (GPU / torch dùng hết core CPU cho 1 pass). --real dùng model thật (load_embed / load_reranker).
+
+Chạy:  python evaluation/benchmark_batching.py --kind embed --concurrency 1 4 16
+       python evaluation/benchmark_batching.py --kind rerank --real
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+# --- SETUP ĐƯỜNG DẪN ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.batching import MicroBatcher
+
+QUESTIONS = ["Phở bò bao nhiêu calo?", "Bún chả có nhiều đạm không?", "Cơm tấm sườn bì chả bao nhiêu chất béo?",
+             "Gỏi cuốn tôm thịt có tốt cho người ăn kiêng không?", "Bánh mì thịt nướng bao nhiêu calo?"]
+
+
+class FakeModel:
+    """Forward pass giả: chi phí cố định + theo số phần tử, các pass chạy tuần tự (1 thiết bị)."""
+
+    def __init__(self, overhead_ms, item_ms):
+        self.overhead, self.per_item = overhead_ms / 1000, item_ms / 1000
+        self._device = threading.Lock()
+
+    def forward(self, items):
+        with self._device:
+            time.sleep(self.overhead + self.per_item * len(items))
+        return [0.0] * len(items)
+
+
+def build_forward(args):
+    if not args.real:
+        return FakeModel(args.overhead_ms, args.item_ms).forward
+    if args.kind == "embed":
+        from config.embed import load_embed
+        model = load_embed(embed_batch_size=max(3, args.max_batch))
+        return model._get_text_embeddings
+    from config.rerank import load_reranker
+    model = load_reranker()
+    return lambda pairs: list(model.predict(pairs, batch_size=len(pairs), show_progress_bar=False))
+
+
+def make_items(args, i):
+    question = QUESTIONS[i % len(QUESTIONS)]
+    if args.kind == "embed":
+        return [question]
+    return [(question, f"Món {j}: thành phần dinh dưỡng, calo, đạm, chất béo...") for j in range(args.candidates)]
+
+
+def run(call, args, concurrency):
+    latencies = []
+    lock = threading.Lock()
+
+    def client(cid):
+        local = []
+        for r in range(args.requests):
+            items = make_items(args, cid * args.requests + r)
+            t0 = time.perf_counter()
+            call(items)
+            local.append((time.perf_counter() - t0) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark micro-batching embedding / rerank")
+    parser.add_argument("--kind", choices=["embed", "rerank"], default="embed")
+    parser.add_argument("--real", action="store_true", help="Dùng model thật thay cho model giả")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=30, help="Số lời gọi mỗi client")
+    parser.add_argument("--waits", type=float, nargs="+", default=[0, 2, 5], help="Các max_wait_ms cần thử")
+    parser.add_argument("--max-batch", type=int, default=None, help="Mặc định 16 (embed) / 64 (rerank)")
+    parser.add_argument("--candidates", type=int, default=10, help="Số ứng viên rerank mỗi lời gọi")
+    parser.add_argument("--overhead-ms", type=float, default=15.0, help="Model giả: chi phí cố định mỗi pass")
+    parser.add_argument("--item-ms", type=float, default=1.0, help="Model giả: chi phí mỗi phần tử")
+    args = parser.parse_args()
+    args.max_batch = args.max_batch or (16 if args.kind == "embed" else 64)
+
+    forward = build_forward(args)
+    forward(make_items(args, 0))  # warm-up (nạp model / JIT)
+    modes = [("none", forward)]
+    for wait in args.waits:
+        batcher = MicroBatcher(forward, max_batch_size=args.max_batch, max_wait_ms=wait, name=f"bench-{wait:g}")
+        modes.append((f"wait={wait:g}ms", batcher))
+
+    model = "thật" if args.real else f"giả ({args.overhead_ms:g}ms + {args.item_ms:g}ms/phần tử)"
+    print(f"🚀 {args.kind}, model {model}, max_batch={args.max_batch}, {args.requests} lời gọi / client")
+    print(f"\n   {'clients':>7}  {'chế độ':<11} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'batch TB':>9}")
+    for concurrency in args.concurrency:
+        for name, call in modes:
+            before = call.stats() if isinstance(call, MicroBatcher) else None
+            throughput, p50, p95 = run(call, args, concurrency)
+            avg_batch = "-"
+            if before is not None:
+                after = call.stats()
+                batches = after["batches"] - before["batches"]
+                avg_batch = f"{(after['items'] - before['items']) / max(batches, 1):.1f}"
+            print(f"   {concurrency:>7}  {name:<11} {throughput:>8.1f} {p50:>9.1f} {p95:>9.1f} {avg_batch:>9}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
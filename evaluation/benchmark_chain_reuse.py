@@ -0,0 +1,82 @@
+"""
+Microbenchmark: chi phí dựng chain RAG + as_retriever cho MỖI request so với dựng 1 lần rồi dùng lại.
+
+  - build_chain : get_conversational_rag_chain(...) (2 ChatPromptTemplate + retriever + parser)
+  - as_retriever: index.as_retriever(similarity_top_k, filters) trong mỗi lần retrieve
+LLM / embedding là bản giả (không gọi mạng) -> chỉ đo phần overhead Python đã bị loại bỏ.
+
+Chạy:  python evaluation/benchmark_chain_reuse.py --iterations 2000 --nodes 500
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from llama_index.core import Settings, VectorStoreIndex
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.schema import TextNode
+
+# --- SETUP ĐƯỜNG DẪN ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from api.langchain_utils import LlamaIndexRetrieverWrapper, get_conversational_rag_chain
+
+
+def measure(func, iterations):
+    samples = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - t0) * 1e6)
+    samples.sort()
+    return statistics.mean(samples), samples[len(samples) // 2], samples[int(len(samples) * 0.95)]
+
+
+def report(label, stats):
+    mean, p50, p95 = stats
+    print(f"   {label:<38} mean={mean:9.1f}µs  p50={p50:9.1f}µs  p95={p95:9.1f}µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Overhead dựng chain / retriever theo từng request")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--nodes", type=int, default=500)
+    args = parser.parse_args()
+
+    Settings.embed_model = MockEmbedding(embed_dim=64)
+    nodes = [TextNode(text=f"Món ăn số {i}", metadata={"dish_name": f"Món {i}", "calories": i % 900})
+             for i in range(args.nodes)]
+    index = VectorStoreIndex(nodes)
+    llm = FakeListChatModel(responses=["ok"])
+
+    print(f"📊 {args.iterations} lần lặp | index {args.nodes} node (MockEmbedding)")
+
+    print("1) Dựng chain RAG")
+    build = measure(lambda: get_conversational_rag_chain(llm, index), args.iterations)
+    report("dựng lại mỗi request (cũ)", build)
+    chain = get_conversational_rag_chain(llm, index)
+    report("dùng lại chain đã dựng (mới)", measure(lambda: chain, args.iterations))
+
+    print("2) Lấy retriever LlamaIndex trong _get_relevant_documents")
+    uncached = LlamaIndexRetrieverWrapper(index=index, max_cached_retrievers=0)
+    cached = LlamaIndexRetrieverWrapper(index=index)
+    before = measure(lambda: uncached._get_index_retriever(3, None), args.iterations)
+    after = measure(lambda: cached._get_index_retriever(3, None), args.iterations)
+    report("index.as_retriever mỗi câu hỏi (cũ)", before)
+    report("cache theo (top_k, filters) (mới)", after)
+
+    print("3) Retrieve đầy đủ (embedding giả + similarity + chuyển Document)")
+    query = "Món 42 bao nhiêu calo?"
+    full_before = measure(lambda: uncached.invoke(query), args.iterations // 4)
+    full_after = measure(lambda: cached.invoke(query), args.iterations // 4)
+    report("retrieve, as_retriever mỗi lần (cũ)", full_before)
+    report("retrieve, retriever cache (mới)", full_after)
+
+    saved = build[0] + before[0] - after[0]
+    print(f"\n⚡ Overhead loại bỏ mỗi request RAG: ~{saved:.0f}µs "
+          f"(chain {build[0]:.0f}µs + as_retriever {before[0] - after[0]:.0f}µs)")
+
+
+if __name__ == "__main__":
+    main()
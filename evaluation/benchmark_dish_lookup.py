@@ -0,0 +1,123 @@
+"""
+Hit-rate + độ trễ của chỉ mục tên món (api/dish_index.py) trên bộ testset.
+
+  - testset : evaluation/testset_ground_truth.csv (cột dish_name = món kỳ vọng, rỗng = câu bẫy / ngoài lề)
+  - variants: (--variants) tự sinh câu hỏi cho mọi món trong foods.csv ở 3 dạng:
+              nguyên văn / bỏ dấu + chữ thường / gõ sai 1 ký tự -> đo riêng exact và fuzzy
+
+Hit     = tra được món (bỏ qua vector search)
+Correct = món tra được đúng món kỳ vọng
+FP      = tra ra món cho câu hỏi không nêu món nào (câu bẫy / thời tiết)
+
+Chạy:  python evaluation/benchmark_dish_lookup.py --variants
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from llama_index.core.schema import TextNode
+
+# --- SETUP ĐƯỜNG DẪN ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from api.dish_index import DishNameIndex
+from utils.utils import fold_accents
+
+CSV_PATH = os.path.join("data_raw", "foods.csv")
+TESTSET_PATH = os.path.join("evaluation", "testset_ground_truth.csv")
+
+
+def load_testset(path, dish_names):
+    df = pd.read_csv(path)
+    if "dish_name" not in df.columns:
+        # Testset cũ chưa có cột dish_name -> suy ra từ tên món xuất hiện nguyên văn trong câu hỏi
+        by_length = sorted(dish_names, key=len, reverse=True)
+        df["dish_name"] = [next((n for n in by_length if n.lower() in q.lower()), "") for q in df["question"]]
+    return [(q, str(d) if pd.notna(d) else "", "testset") for q, d in zip(df["question"], df["dish_name"])]
+
+
+def typo(name, rng):
+    syllables = name.split()
+    candidates = [i for i, s in enumerate(syllables) if len(s) >= 3]
+    if not candidates:
+        return name
+    i = rng.choice(candidates)
+    j = rng.randrange(len(syllables[i]) - 1)
+    s = syllables[i]
+    syllables[i] = s[:j] + s[j + 1] + s[j] + s[j + 2:]  # Đảo 2 ký tự kề nhau
+    return " ".join(syllables)
+
+
+def make_variants(dish_names, rng):
+    rows = []
+    for name in dish_names:
+        rows.append((f"Món {name} bao nhiêu calo?", name, "nguyên văn"))
+        rows.append((f"{fold_accents(name)} co beo khong", name, "bỏ dấu"))
+        rows.append((f"{typo(name, rng)} ăn có tốt không", name, "gõ sai"))
+    return rows
+
+
+def evaluate(index, rows):
+    results = []
+    for question, expected, group in rows:
+        t0 = time.perf_counter()
+        matches = index.lookup(question, limit=1)
+        latency_us = (time.perf_counter() - t0) * 1e6
+        found = matches[0] if matches else None
+        results.append({
+            "group": group, "question": question, "expected": expected,
+            "found": found.dish_name if found else "", "method": found.method if found else "miss",
+            "correct": bool(found) and fold_accents(found.dish_name) == fold_accents(expected),
+            "latency_us": latency_us,
+        })
+    return pd.DataFrame(results)
+
+
+def report(df):
+    for group, part in df.groupby("group", sort=False):
+        named = part[part["expected"] != ""]
+        unnamed = part[part["expected"] == ""]
+        print(f"\n📊 {group}: {len(part)} câu")
+        if len(named):
+            print(f"   Hit rate : {(named['method'] != 'miss').mean():.1%}  | Correct: {named['correct'].mean():.1%}")
+        if len(unnamed):
+            print(f"   FP (câu không nêu món): {(unnamed['method'] != 'miss').mean():.1%} ({len(unnamed)} câu)")
+        print("   Theo cách khớp: " + ", ".join(f"{k}={v}" for k, v in part["method"].value_counts().items()))
+        lat = part["latency_us"].to_numpy()
+        print(f"   Độ trễ: p50={np.percentile(lat, 50):.1f}µs | p95={np.percentile(lat, 95):.1f}µs | "
+              f"p99={np.percentile(lat, 99):.1f}µs")
+        wrong = named[~named["correct"] & (named["method"] != "miss")]
+        for _, row in wrong.head(5).iterrows():
+            print(f"   ✗ '{row['question']}' -> {row['found']} (kỳ vọng {row['expected']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hit-rate của dish-name index")
+    parser.add_argument("--testset", default=TESTSET_PATH)
+    parser.add_argument("--variants", action="store_true", help="Sinh thêm câu hỏi bỏ dấu / gõ sai cho mọi món")
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("DISH_FUZZY_THRESHOLD", "0.8")))
+    args = parser.parse_args()
+
+    dish_names = pd.read_csv(CSV_PATH)["dish_name"].dropna().astype(str).tolist()
+    nodes = [TextNode(text=name, metadata={"dish_name": name}) for name in dish_names]
+    t0 = time.perf_counter()
+    index = DishNameIndex(nodes, fuzzy_threshold=args.threshold)
+    print(f"⚙️ Dựng index {index.stats()} trong {(time.perf_counter() - t0) * 1000:.1f}ms")
+
+    rows = []
+    if os.path.exists(args.testset):
+        rows += load_testset(args.testset, dish_names)
+    else:
+        print(f"⚠️ Không thấy {args.testset} (chạy evaluation/1_generate_testset.py trước).")
+    if args.variants:
+        rows += make_variants(dish_names, random.Random(42))
+    if not rows:
+        return
+    report(evaluate(index, rows))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Recall của retrieval trên testset: dense (vector) vs BM25 (config/sparse_index.py) vs hybrid (RRF).
+
+  - testset : evaluation/testset_ground_truth.csv (món kỳ vọng = cột dish_name / tên món nêu trong câu hỏi)
+  - variants: (--variants) câu hỏi sinh cho mọi món ở dạng nguyên văn / bỏ dấu / gõ sai
+
+Recall@k = món kỳ vọng nằm trong top-k, MRR = trung bình 1 / hạng của món kỳ vọng (0 nếu ngoài top-max).
+Dense cần embedding model + FoodDB thật; --sparse-only chỉ đo BM25 (không cần model).
+Tra tên món (api/dish_index.py) KHÔNG bật ở đây -> đo riêng phần dense / BM25 khi tra tên món trượt.
+
+Chạy:  python evaluation/benchmark_hybrid_recall.py --variants
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# --- SETUP ĐƯỜNG DẪN ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from benchmark_dish_lookup import CSV_PATH, TESTSET_PATH, load_testset, make_variants
+from config.sparse_index import SPARSE_DIR, load_sparse_index, reciprocal_rank_fusion
+from utils.utils import fold_accents
+
+KS = (1, 3, 5, 10)
+
+
+def load_nodes_and_dense(sparse_only):
+    """(nodes, hàm dense(query, k) -> [node]) từ FoodDB thật; sparse_only -> node dựng từ foods.csv."""
+    if sparse_only:
+        from build_index import row_to_node
+
+        nodes = [row_to_node(row) for row in pd.read_csv(CSV_PATH).to_dict("records")]
+        return nodes, None
+    from config.vector_store import get_index_nodes, get_vector_store
+
+    index = get_vector_store()
+    retrievers = {}
+
+    def dense(query, k):
+        if k not in retrievers:
+            retrievers[k] = index.as_retriever(similarity_top_k=k)
+        return [n.node for n in retrievers[k].retrieve(query)]
+
+    return get_index_nodes(index), dense
+
+
+def rank_of(expected, nodes):
+    target = fold_accents(expected)
+    for rank, node in enumerate(nodes, start=1):
+        if fold_accents(node.metadata.get("dish_name", "")) == target:
+            return rank
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall dense vs BM25 vs hybrid (RRF)")
+    parser.add_argument("--testset", default=TESTSET_PATH)
+    parser.add_argument("--variants", action="store_true", help="Sinh thêm câu hỏi bỏ dấu / gõ sai cho mọi món")
+    parser.add_argument("--sparse-only", action="store_true", help="Chỉ đo BM25 (không nạp embedding model)")
+    parser.add_argument("--sparse-dir", default=SPARSE_DIR)
+    parser.add_argument("--fetch-k", type=int, default=int(os.getenv("RERANK_CANDIDATES", "10")),
+                        help="Số ứng viên mỗi bên trước khi gộp RRF (giống retriever)")
+    parser.add_argument("--rrf-k", type=int, default=int(os.getenv("RRF_K", "60")))
+    args = parser.parse_args()
+
+    nodes, dense = load_nodes_and_dense(args.sparse_only)
+    t0 = time.perf_counter()
+    sparse = load_sparse_index(nodes, args.sparse_dir)
+    print(f"⚙️ BM25 {sparse.stats()} sẵn sàng sau {(time.perf_counter() - t0) * 1000:.1f}ms")
+
+    dish_names = [n.metadata.get("dish_name", "") for n in nodes]
+    rows = []
+    if os.path.exists(args.testset):
+        rows += load_testset(args.testset, dish_names)
+    else:
+        print(f"⚠️ Không thấy {args.testset} (chạy evaluation/1_generate_testset.py trước).")
+    if args.variants:
+        rows += make_variants(dish_names, random.Random(42))
+    rows = [r for r in rows if r[1]]  # Chỉ câu có món kỳ vọng
+    if not rows:
+        return
+
+    depth = max(max(KS), args.fetch_k)
+    results, sparse_us = [], []
+    for question, expected, group in rows:
+        t0 = time.perf_counter()
+        lexical = [node for node, _ in sparse.search(question, depth)]
+        sparse_us.append((time.perf_counter() - t0) * 1e6)
+        rankings = {"bm25": lexical}
+        if dense is not None:
+            vector = dense(question, depth)
+            rankings["dense"] = vector
+            fused = reciprocal_rank_fusion([vector[:args.fetch_k], lexical[:args.fetch_k]], k=args.rrf_k)
+            rankings["hybrid"] = [node for node, _ in fused]
+        for method, ranked in rankings.items():
+            rank = rank_of(expected, ranked[:depth])
+            results.append({"group": group, "method": method, "rank": rank if rank is not None else np.nan})
+
+    df = pd.DataFrame(results)
+    print(f"\n📊 Recall trên {len(rows)} câu hỏi (fetch_k={args.fetch_k}, rrf_k={args.rrf_k}):")
+    header = " ".join(f"{'R@' + str(k):>7}" for k in KS)
+    for group, part in df.groupby("group", sort=False):
+        print(f"\n   {group} ({len(part) // part['method'].nunique()} câu)")
+        print(f"   {'method':<8} {header} {'MRR':>7}")
+        for method, sub in part.groupby("method", sort=False):
+            ranks = sub["rank"]
+            recalls = " ".join(f"{(ranks <= k).mean():>7.1%}" for k in KS)
+            mrr = (1 / ranks.dropna()).sum() / len(ranks)
+            print(f"   {method:<8} {recalls} {mrr:>7.3f}")
+    print(f"\n⚡ BM25: p50={np.percentile(sparse_us, 50):.1f}µs | p95={np.percentile(sparse_us, 95):.1f}µs | "
+          f"p99={np.percentile(sparse_us, 99):.1f}µs / câu hỏi")
+
+
+if __name__ == "__main__":
+    main()
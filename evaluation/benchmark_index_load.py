@@ -0,0 +1,91 @@
+"""
+So sánh thời gian load + RSS giữa index JSON mặc định (SimpleVectorStore) và index compact (.npy memmap).
+
+Mỗi định dạng được đo trong 1 process riêng để RSS không bị cộng dồn.
+Không nạp embedding model thật (dùng MockEmbedding) để chỉ đo phần storage.
+
+Chạy:
+    python build_index.py --format compact --persist-dir FoodDB_compact
+    python evaluation/benchmark_index_load.py --simple FoodDB --compact FoodDB_compact
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+import psutil
+
+# --- SETUP ĐƯỜNG DẪN ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def measure(fmt, persist_dir, queries):
+    from llama_index.core import Settings, StorageContext, load_index_from_storage
+    from llama_index.core.embeddings import MockEmbedding
+    from llama_index.core.schema import QueryBundle
+    from config.compact_store import CompactVectorIndex
+
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+
+    start = time.perf_counter()
+    if fmt == "compact":
+        index = CompactVectorIndex.load(persist_dir)
+        dim = index.embeddings.shape[1]
+    else:
+        Settings.embed_model = MockEmbedding(embed_dim=1)
+        index = load_index_from_storage(StorageContext.from_defaults(persist_dir=persist_dir))
+        dim = len(next(iter(index.vector_store.data.embedding_dict.values())))
+    load_s = time.perf_counter() - start
+    rss_after = process.memory_info().rss
+
+    # Đo search với vector ngẫu nhiên (đã có embedding -> không gọi model)
+    retriever = index.as_retriever(similarity_top_k=3)
+    rng = np.random.default_rng(0)
+    latencies = []
+    for _ in range(queries):
+        bundle = QueryBundle(query_str="", embedding=rng.normal(size=dim).tolist())
+        t0 = time.perf_counter()
+        retriever.retrieve(bundle)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    return {
+        "format": fmt,
+        "load_s": load_s,
+        "rss_mb": (rss_after - rss_before) / 2**20,
+        "search_p50_ms": float(np.percentile(latencies, 50)),
+        "search_p95_ms": float(np.percentile(latencies, 95)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark load time / RSS của FoodDB")
+    parser.add_argument("--simple", default="FoodDB", help="Thư mục index JSON mặc định")
+    parser.add_argument("--compact", default="FoodDB_compact", help="Thư mục index compact")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--child", nargs=2, metavar=("FORMAT", "DIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child[0], args.child[1], args.queries)))
+        return
+
+    print(f"{'format':8} | {'load (s)':>9} | {'RSS (MB)':>9} | {'search p50':>11} | {'search p95':>11}")
+    for fmt, persist_dir in (("simple", args.simple), ("compact", args.compact)):
+        if not os.path.exists(persist_dir):
+            print(f"{fmt:8} | ⚠️ không có thư mục '{persist_dir}'")
+            continue
+        out = subprocess.run(
+            [sys.executable, __file__, "--child", fmt, persist_dir, "--queries", str(args.queries)],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip().splitlines()[-1]
+        r = json.loads(out)
+        print(f"{fmt:8} | {r['load_s']:9.3f} | {r['rss_mb']:9.1f} | "
+              f"{r['search_p50_ms']:9.3f}ms | {r['search_p95_ms']:9.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
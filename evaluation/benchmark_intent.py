@@ -0,0 +1,86 @@
+"""
+Đo độ chính xác + độ trễ của bộ phân loại ý định cục bộ (api/intent_classifier.py)
+trên bộ câu hỏi tiếng Việt có nhãn: evaluation/intent_queries.csv
+
+Chạy:
+    python evaluation/benchmark_intent.py              # chỉ luật regex + tên món
+    python evaluation/benchmark_intent.py --embed      # thêm tầng centroid embedding
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# --- SETUP ĐƯỜNG DẪN ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from api.intent_classifier import LocalIntentClassifier
+
+QUERIES_PATH = os.path.join("evaluation", "intent_queries.csv")
+CSV_PATH = os.path.join("data_raw", "foods.csv")
+THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.75"))
+
+
+def load_dish_names():
+    if os.path.exists(CSV_PATH):
+        return pd.read_csv(CSV_PATH)["dish_name"].dropna().astype(str).tolist()
+    print(f"⚠️ Không thấy {CSV_PATH}: chạy không có danh sách tên món FoodDB.")
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local intent classifier")
+    parser.add_argument("--embed", action="store_true", help="Bật tầng nearest-centroid (nạp embedding model)")
+    args = parser.parse_args()
+
+    embed_model = None
+    if args.embed:
+        from config.embed import load_embed
+        embed_model = load_embed()
+
+    classifier = LocalIntentClassifier(dish_names=load_dish_names(), embed_model=embed_model)
+    if embed_model is not None:
+        classifier._get_centroids()  # Warm-up, không tính vào latency
+
+    df = pd.read_csv(QUERIES_PATH)
+    rows = []
+    for question, label in zip(df["question"], df["label"]):
+        start = time.perf_counter()
+        result = classifier.classify_rules(question)
+        if result.confidence < THRESHOLD and embed_model is not None:
+            result = classifier.classify_centroid(question, result)
+        latency_us = (time.perf_counter() - start) * 1e6
+        rows.append({
+            "question": question, "label": label, "pred": result.intent,
+            "confidence": result.confidence, "source": result.source,
+            "confident": result.confidence >= THRESHOLD, "latency_us": latency_us,
+        })
+
+    res = pd.DataFrame(rows)
+    res["correct"] = res["label"] == res["pred"]
+    confident = res[res["confident"]]
+
+    print(f"\n📊 {len(res)} câu hỏi | ngưỡng tin cậy = {THRESHOLD}")
+    print(f"   Accuracy (mọi câu, không gọi LLM):      {res['correct'].mean():.1%}")
+    print(f"   Accuracy (câu đủ tin cậy, xử lý local): {confident['correct'].mean():.1%} "
+          f"trên {len(confident)} câu")
+    print(f"   Tỉ lệ phải fallback sang LLM:           {1 - res['confident'].mean():.1%}")
+    for source, group in res.groupby("source"):
+        lat = group["latency_us"].to_numpy()
+        print(f"   [{source:8}] n={len(group):3} | p50={np.percentile(lat, 50):8.1f}µs "
+              f"| p95={np.percentile(lat, 95):8.1f}µs")
+
+    print("\n🔀 Confusion matrix (hàng = nhãn, cột = dự đoán):")
+    print(pd.crosstab(res["label"], res["pred"]))
+
+    wrong = res[~res["correct"]]
+    if len(wrong):
+        print("\n❌ Các câu phân loại sai:")
+        for _, r in wrong.iterrows():
+            print(f"   - {r['question']}  ->  {r['pred']} (đúng: {r['label']}, conf={r['confidence']:.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Load test end-to-end /scan + /ask: p50 / p95 / p99, RPS và thời gian từng bước (header Server-Timing).
+
+Mỗi "phiên" là 1 kịch bản hội thoại thực tế, chọn ngẫu nhiên theo --mix:
+  - scan_followup : /scan món vừa chụp -> 2 câu hỏi tiếp về món đó (luồng A)
+  - new_topic     : hỏi món mới (RAG) -> 1 câu hỏi tiếp (RAG có lịch sử)
+  - nutrition     : "X bao nhiêu calo?" (bảng dinh dưỡng, không gọi LLM)
+  - chitchat      : xã giao / ngoài lề (luồng C)
+--concurrency phiên chạy đồng thời (mỗi phiên tuần tự như 1 người dùng thật).
+
+Mặc định chạy app trong process (httpx ASGITransport) với LLM là evaluation/fake_groq_server.py
+(HTTP thật qua LLM_BASE_URL, cấu hình được độ trễ / token rate) -> không cần API key.
+Chưa cài uvicorn -> LLM giả cũng chạy trong process qua ASGITransport.
+  --fake-index : index dựng từ data_raw/foods.csv với MockEmbedding (không cần model embedding / reranker)
+  --url        : bắn vào server đang chạy sẵn thay vì app trong process
+
+Kết quả từng request ghi ra --output (CSV) -> vẽ biểu đồ: python evaluation/visualize_chart.py --load
+
+Chạy:  python evaluation/benchmark_load.py --fake-index --sessions 200 --concurrency 16 --llm-latency 0.3
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+
+import httpx
+import numpy as np
+import pandas as pd
+
+# --- SETUP ĐƯỜNG DẪN ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from fake_groq_server import create_app as create_fake_groq
+
+CSV_PATH = os.path.join("data_raw", "foods.csv")
+OUTPUT_PATH = os.path.join("evaluation", "load_results.csv")
+FALLBACK_DISHES = ["Phở bò", "Cơm tấm sườn", "Bún chả", "Cơm hến", "Bánh mì", "Gỏi cuốn tôm thịt"]
+STAGES = ["plan", "contextualize", "retrieve", "generate"]
+
+# Model CV gửi tên lớp (không phải tên món FoodDB) -> /scan tự đổi qua CV_TO_VIETNAMESE trong api/end_points.py
+SCAN_CLASSES = ["Suon", "Cha Ca", "Tofu"]
+SCAN_FOLLOWUPS = ["Món này có béo không?", "Ăn món này buổi tối có được không?", "Nó có hợp cho người tập gym không?"]
+RAG_QUESTIONS = ["{dish} có tốt cho người giảm cân không?", "Cách nấu {dish} như thế nào?",
+                 "{dish} gồm những thành phần gì?"]
+RAG_FOLLOWUPS = ["Nó có nhiều đạm không?", "Người tiểu đường ăn món đó được không?"]
+TABLE_QUESTIONS = ["{dish} bao nhiêu calo?", "{dish} có bao nhiêu đạm và chất béo?"]
+CHITCHAT_QUESTIONS = ["Xin chào", "Bạn là ai?", "Hôm nay thời tiết thế nào?", "Giá vàng hôm nay bao nhiêu?"]
+
+
+# ==============================================================================
+# KỊCH BẢN (mỗi bước: (tên bước, endpoint, payload))
+# ==============================================================================
+def make_session(kind, session_id, dishes, rng):
+    dish = rng.choice(dishes)
+    if kind == "scan_followup":
+        return [("scan", "/scan", {"session_id": session_id, "detected_classes": [rng.choice(SCAN_CLASSES)]})] + [
+            (f"followup_{i}", "/ask", {"question": q, "session_id": session_id})
+            for i, q in enumerate(rng.sample(SCAN_FOLLOWUPS, 2), 1)
+        ]
+    if kind == "new_topic":
+        return [("question", "/ask", {"question": rng.choice(RAG_QUESTIONS).format(dish=dish), "session_id": session_id}),
+                ("followup_1", "/ask", {"question": rng.choice(RAG_FOLLOWUPS), "session_id": session_id})]
+    if kind == "nutrition":
+        return [("question", "/ask", {"question": rng.choice(TABLE_QUESTIONS).format(dish=dish), "session_id": session_id})]
+    return [("question", "/ask", {"question": rng.choice(CHITCHAT_QUESTIONS), "session_id": session_id})]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def parse_server_timing(header):
+    """'route;desc="RAG", plan;dur=1.2, retrieve;dur=30.5' -> ("RAG", {"plan": 1.2, "retrieve": 30.5})"""
+    route, stages = "", {}
+    for part in filter(None, (p.strip() for p in (header or "").split(","))):
+        name, *params = [p.strip() for p in part.split(";")]
+        for param in params:
+            key, _, value = param.partition("=")
+            if key == "dur":
+                stages[name] = float(value)
+            elif key == "desc":
+                route = value.strip('"')
+    return route, stages
+
+
+async def run_load(client, sessions, concurrency):
+    queue = list(reversed(sessions))
+    records = []
+    started = time.perf_counter()
+
+    async def worker():
+        while queue:
+            kind, steps = queue.pop()
+            for step, endpoint, payload in steps:
+                t0 = time.perf_counter()
+                try:
+                    r = await client.post(endpoint, json=payload)
+                    status, header = r.status_code, r.headers.get("server-timing")
+                except httpx.HTTPError as e:
+                    status, header = type(e).__name__, None
+                latency_ms = (time.perf_counter() - t0) * 1000
+                route, stages = parse_server_timing(header)
+                records.append({"scenario": kind, "step": step, "endpoint": endpoint,
+                                "route": route or ("SCAN_SYNC" if endpoint == "/scan" else ""),
+                                "status": status, "latency_ms": latency_ms, "start_s": t0 - started,
+                                **{f"{name}_ms": stages.get(name) for name in STAGES + ["total"]}})
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return pd.DataFrame(records), time.perf_counter() - started
+
+
+# ==============================================================================
+# DỰNG APP TRONG PROCESS
+# ==============================================================================
+def start_fake_llm(args):
+    """LLM giả qua HTTP thật (uvicorn); không có uvicorn -> trả server=None, gọi thẳng qua ASGITransport."""
+    fake = create_fake_groq(args.llm_latency, args.token_rate, args.jitter, args.answer_tokens)
+    try:
+        import uvicorn
+    except ImportError:
+        print("⚠️ Chưa cài uvicorn -> LLM giả chạy trong process (ASGITransport, không có chi phí mạng, "
+              "stream bị gom cả câu trả lời)")
+        return fake, None
+    server = uvicorn.Server(uvicorn.Config(fake, host="127.0.0.1", port=args.llm_port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return fake, server
+
+
+def build_mock_index(data_path):
+    from llama_index.core import Settings, VectorStoreIndex
+    from llama_index.core.embeddings import MockEmbedding
+    from build_index import row_to_node
+
+    Settings.embed_model = MockEmbedding(embed_dim=256)
+    nodes = [row_to_node(row) for _, row in pd.read_csv(data_path).iterrows()]
+    return VectorStoreIndex(nodes)
+
+
+def setup_app(args, fake_llm=None):
+    # Trỏ ChatGroq sang server giả TRƯỚC khi dựng AppResources
+    os.environ["LLM_BASE_URL"] = f"http://127.0.0.1:{args.llm_port}"
+    os.environ.setdefault("MY_API_KEY", "fake")
+    from main import app
+    from api.dependencies import AppResources
+
+    resources = AppResources()
+    if fake_llm is not None:
+        # Không có server HTTP -> client async của ChatGroq gọi thẳng app giả (các route dùng ainvoke / astream)
+        resources.http_async_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_llm),
+                                                        timeout=resources.http_async_client.timeout)
+    if args.fake_index:
+        resources.load_llms()
+        # Không có embedding thật -> tắt semantic cache / centroid (embed_model=None)
+        resources.attach_index(build_mock_index(args.data), "bench", None)
+    else:
+        resources.load_models()
+    app.state.resources = resources
+    dishes = list(resources.nutrition_table.names) if resources.nutrition_table is not None else []
+    return app, dishes
+
+
+# ==============================================================================
+# BÁO CÁO
+# ==============================================================================
+def percentiles(values):
+    return {f"p{p}": np.percentile(values, p) for p in (50, 95, 99)} if len(values) else {}
+
+
+def report(df, elapsed):
+    ok = df[df["status"] == 200]
+    print(f"\n📊 {len(df)} request trong {elapsed:.1f}s -> {len(ok) / elapsed:.1f} req/s "
+          f"({len(df) - len(ok)} lỗi)")
+    overall = percentiles(ok["latency_ms"])
+    if overall:
+        print("   Toàn bộ      : " + " | ".join(f"{k}={v:7.1f}ms" for k, v in overall.items()))
+
+    print("\n   Theo luồng (route):")
+    for route, part in ok.groupby("route"):
+        stats = percentiles(part["latency_ms"])
+        print(f"   {route:<10} n={len(part):<5} " + " | ".join(f"{k}={v:7.1f}ms" for k, v in stats.items()))
+
+    print("\n   Thời gian từng bước (Server-Timing, trung bình / p95 ms):")
+    for route, part in ok[ok["endpoint"] == "/ask"].groupby("route"):
+        cells = []
+        for stage in STAGES:
+            values = part[f"{stage}_ms"].dropna()
+            if len(values):
+                cells.append(f"{stage}={values.mean():.1f}/{np.percentile(values, 95):.1f}")
+        print(f"   {route:<10} " + "  ".join(cells))
+
+    print("\n   Theo kịch bản:")
+    for (scenario, step), part in ok.groupby(["scenario", "step"], sort=False):
+        stats = percentiles(part["latency_ms"])
+        print(f"   {scenario + '/' + step:<28} " + " | ".join(f"{k}={v:7.1f}ms" for k, v in stats.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test end-to-end /scan + /ask")
+    parser.add_argument("--url", help="Server đang chạy (vd. http://127.0.0.1:8000); bỏ trống = app trong process")
+    parser.add_argument("--sessions", type=int, default=200, help="Số phiên hội thoại")
+    parser.add_argument("--concurrency", type=int, default=16, help="Số phiên chạy đồng thời")
+    parser.add_argument("--mix", default="scan_followup=0.3,new_topic=0.3,nutrition=0.2,chitchat=0.2")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--fake-index", action="store_true", help="Index MockEmbedding từ --data (offline)")
+    parser.add_argument("--data", default=CSV_PATH)
+    parser.add_argument("--llm-port", type=int, default=8001)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Giây tới token đầu của LLM giả")
+    parser.add_argument("--token-rate", type=float, default=150.0, help="Token/giây của LLM giả")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--answer-tokens", type=int, default=80)
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    args = parser.parse_args()
+
+    fake = None
+    if args.url:
+        app, dishes = None, []
+        transport, base_url = None, args.url
+    else:
+        fake, server = start_fake_llm(args)
+        app, dishes = setup_app(args, fake_llm=fake if server is None else None)
+        transport, base_url = httpx.ASGITransport(app=app), "http://bench"
+    if not dishes:
+        dishes = (pd.read_csv(args.data)["dish_name"].dropna().astype(str).tolist()
+                  if os.path.exists(args.data) else FALLBACK_DISHES)
+
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=args.sessions)
+    sessions = [(kind, make_session(kind, f"load-{i}", dishes, rng)) for i, kind in enumerate(kinds)]
+
+    print(f"🚀 {args.sessions} phiên, concurrency={args.concurrency}, mix={args.mix}")
+    if fake is not None:
+        print(f"   LLM giả: {args.llm_latency}s tới token đầu, {args.token_rate} token/s, "
+              f"{args.answer_tokens} token/câu trả lời")
+
+    async def run():
+        async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=600) as client:
+            return await run_load(client, sessions, args.concurrency)
+
+    df, elapsed = asyncio.run(run())
+    report(df, elapsed)
+    if fake is not None:
+        llm_stats = fake.state.stats
+        print(f"\n   LLM giả: {llm_stats['requests']} lần gọi "
+              f"({llm_stats['requests'] / max(1, (df['endpoint'] == '/ask').sum()):.2f} lần / câu hỏi)")
+
+    df.to_csv(args.output, index=False)
+    print(f"\n✅ Kết quả từng request: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
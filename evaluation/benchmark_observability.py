@@ -0,0 +1,79 @@
+"""
+Chi phí của lớp quan sát (utils/observability.py) trên hot path:
+  - span()            : đo 1 bước + Histogram Prometheus + ghi vào trace của request
+  - log JSON          : 1 dòng logger.info(..., extra={...}) (ghi vào buffer, không tính I/O)
+  - middleware        : request /ping qua ASGI có và không có RequestContextMiddleware
+
+Chạy:  python evaluation/benchmark_observability.py --iterations 100000
+"""
+import argparse
+import asyncio
+import io
+import logging
+import os
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI
+
+# --- SETUP ĐƯỜNG DẪN ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.observability import RequestContextMiddleware, get_logger, span
+
+
+def per_call_us(func, iterations):
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - t0) / iterations * 1e6
+
+
+def make_app(instrumented):
+    app = FastAPI()
+    if instrumented:
+        app.add_middleware(RequestContextMiddleware)
+
+    @app.get("/ping")
+    async def ping():
+        return {"message": "pong"}
+    return app
+
+
+async def request_us(app, iterations):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for _ in range(max(50, iterations // 10)):  # Làm nóng client / app trước khi đo
+            await client.get("/ping")
+        t0 = time.perf_counter()
+        for _ in range(iterations):
+            await client.get("/ping")
+        return (time.perf_counter() - t0) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Overhead của span / log / middleware")
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+
+    def one_span():
+        with span("bench"):
+            pass
+
+    logger = get_logger("bench")
+    logging.getLogger("lucfin").handlers[0].stream = io.StringIO()  # Bỏ I/O stdout khỏi phép đo
+
+    print(f"📊 {args.iterations} lần lặp")
+    print(f"   span()                 : {per_call_us(one_span, args.iterations):7.2f}µs / lần")
+    log_n = args.iterations // 5
+    log_us = per_call_us(lambda: logger.info("bench", extra={"route": "RAG", "retrieve_ms": 12.3}), log_n)
+    print(f"   log JSON               : {log_us:7.2f}µs / dòng")
+
+    requests = max(200, args.iterations // 100)
+    plain = asyncio.run(request_us(make_app(False), requests))
+    instrumented = asyncio.run(request_us(make_app(True), requests))
+    print(f"   /ping không middleware : {plain:7.1f}µs / request")
+    print(f"   /ping có middleware    : {instrumented:7.1f}µs / request (+{instrumented - plain:.1f}µs)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+So sánh độ trễ /ask (trả về khi sinh xong) với time-to-first-token của /ask/stream (SSE).
+
+Dùng FakeGroq của benchmark_async.py (độ trễ chia đều theo token, có khối <think> như qwen3).
+TTFT lấy từ event "done" do server đo (ASGITransport của httpx gom cả body trước khi trả về).
+
+Chạy:  python evaluation/benchmark_stream.py --requests 10 --llm-latency 2.0
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+import numpy as np
+
+# --- SETUP ĐƯỜNG DẪN ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from benchmark_async import install_fakes
+
+
+def parse_sse(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        events.append((lines.get("event"), json.loads(lines.get("data", "{}"))))
+    return events
+
+
+async def run(app, n_requests):
+    transport = httpx.ASGITransport(app=app)
+    full, ttft, total = [], [], []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        for i in range(n_requests):
+            # Câu hỏi chitchat: không qua retriever, chỉ đo phần sinh của LLM
+            payload = {"question": "Xin chào", "session_id": f"stream-{i}"}
+
+            start = time.perf_counter()
+            r = await client.post("/ask", json=payload)
+            r.raise_for_status()
+            full.append((time.perf_counter() - start) * 1000)
+
+            r = await client.post("/ask/stream", json=payload)
+            r.raise_for_status()
+            events = parse_sse(r.text)
+            done = next(data for event, data in events if event == "done")
+            answer = "".join(data["text"] for event, data in events if event == "token")
+            assert "<think>" not in answer, answer
+            ttft.append(done["ttft_ms"])
+            total.append(done["total_ms"])
+    return full, ttft, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark time-to-first-token /ask/stream")
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--llm-latency", type=float, default=2.0)
+    args = parser.parse_args()
+
+    from main import app
+    install_fakes(app, "async", args.llm_latency, 0.0)
+    full, ttft, total = asyncio.run(run(app, args.requests))
+
+    print(f"📊 {args.requests} request, LLM={args.llm_latency}s/câu trả lời")
+    for name, values in (("/ask (toàn bộ)", full), ("/ask/stream TTFT", ttft), ("/ask/stream total", total)):
+        print(f"   {name:20} p50={np.percentile(values, 50):8.1f}ms | p95={np.percentile(values, 95):8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Server giả lập Groq (OpenAI-compatible /openai/v1/chat/completions) cho load test offline.
+
+  - Độ trễ: --latency (giây tới token đầu, ± --jitter) + --token-rate (token/giây khi sinh)
+  - stream=true trả SSE "chat.completion.chunk" + "data: [DONE]" như Groq thật
+  - Nội dung theo loại prompt: phân loại ý định -> 1 nhãn, viết lại câu hỏi -> trả nguyên câu,
+    còn lại -> câu trả lời --answer-tokens từ (có khối <think> như qwen3 nếu --think)
+
+Chạy riêng rồi trỏ server thật sang:
+    python evaluation/fake_groq_server.py --port 8001 --latency 0.3 --token-rate 150
+    LLM_BASE_URL=http://127.0.0.1:8001 MY_API_KEY=fake uvicorn main:app
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+ANSWER_WORDS = (
+    "Món này cung cấp năng lượng vừa phải, giàu đạm từ thịt và cá, chất béo chủ yếu đến từ dầu ăn. "
+    "Nên ăn kèm nhiều rau xanh, hạn chế nước dùng mặn và dùng khẩu phần vừa đủ cho bữa chính."
+).split()
+
+
+def _message_text(message) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):  # content dạng [{"type": "text", "text": ...}]
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return str(content)
+
+
+def fake_reply(messages, answer_tokens: int, think: bool) -> list:
+    """Danh sách token (từ) trả về cho 1 request."""
+    system = " ".join(_message_text(m) for m in messages if m.get("role") == "system")
+    last_user = next((_message_text(m) for m in reversed(messages) if m.get("role") == "user"), "")
+    if "Phân loại câu hỏi" in last_user:
+        return ["FOLLOWUP"]
+    if "formulate a standalone question" in system:
+        return last_user.split() or ["?"]
+    words = [ANSWER_WORDS[i % len(ANSWER_WORDS)] for i in range(answer_tokens)]
+    if think:
+        words = ["<think>Người", "dùng", "hỏi", "về", "dinh", "dưỡng.</think>\n\n"] + words
+    return words
+
+
+def create_app(latency: float = 0.3, token_rate: float = 150.0, jitter: float = 0.2,
+               answer_tokens: int = 80, think: bool = True, seed: int = 0) -> FastAPI:
+    app = FastAPI(title="Fake Groq")
+    rng = random.Random(seed)
+    app.state.stats = {"requests": 0, "streams": 0, "completion_tokens": 0}
+
+    def first_token_delay() -> float:
+        return max(0.0, latency * (1 + rng.uniform(-jitter, jitter)))
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "fake")
+        tokens = fake_reply(body.get("messages", []), answer_tokens, think)
+        prompt_tokens = sum(len(_message_text(m).split()) for m in body.get("messages", []))
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                 "total_tokens": prompt_tokens + len(tokens)}
+        completion_id, created = f"chatcmpl-{uuid.uuid4().hex[:12]}", int(time.time())
+        app.state.stats["requests"] += 1
+        app.state.stats["completion_tokens"] += len(tokens)
+        delay, per_token = first_token_delay(), 1.0 / token_rate if token_rate > 0 else 0.0
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay + per_token * len(tokens))
+            return JSONResponse({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(tokens)},
+                             "finish_reason": "stop", "logprobs": None}],
+                "usage": usage,
+            })
+
+        app.state.stats["streams"] += 1
+
+        def chunk(delta, finish_reason=None, **extra):
+            data = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason, "logprobs": None}],
+                    **extra}
+            return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+        async def events():
+            await asyncio.sleep(delay)
+            yield chunk({"role": "assistant", "content": ""})
+            for i, token in enumerate(tokens):
+                yield chunk({"content": token if i == 0 else " " + token})
+                await asyncio.sleep(per_token)
+            yield chunk({}, "stop", x_groq={"id": completion_id, "usage": usage})
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return app.state.stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server giả lập Groq cho load test")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.3, help="Giây tới token đầu tiên")
+    parser.add_argument("--token-rate", type=float, default=150.0, help="Token/giây khi sinh (0 = tức thì)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Dao động ± tỷ lệ của --latency")
+    parser.add_argument("--answer-tokens", type=int, default=80)
+    parser.add_argument("--no-think", action="store_true", help="Không sinh khối <think>")
+    args = parser.parse_args()
+
+    import uvicorn
+    app = create_app(args.latency, args.token_rate, args.jitter, args.answer_tokens, not args.no_think)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+So sánh backend PyTorch và ONNX Runtime int8 (config/onnx_backend.py) trên FoodDB.
+
+  Độ khớp embedding : cosine(torch, onnx) từng văn bản / câu hỏi + top-k vector search giống nhau bao nhiêu
+  Độ khớp rerank    : Spearman thứ hạng ứng viên + top-1 / top-3 trùng nhau
+  Hiệu năng         : RAM tăng thêm khi nạp model (RSS), thời gian nhúng 1 câu hỏi, rerank 1 câu hỏi, nhúng cả FoodDB
+
+Câu hỏi lấy từ evaluation/testset_ground_truth.csv (nếu có), không thì tự sinh từ tên món.
+Lần chạy đầu export + lượng tử hóa model (vài phút), file .onnx được cache trong ONNX_DIR -> số RAM của onnx
+chỉ đúng từ lần chạy thứ 2 (lần đầu gồm cả bộ nhớ lúc export).
+
+Chạy:  python evaluation/onnx_parity.py --docs 300 --queries 50
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import psutil
+from scipy.stats import spearmanr
+
+# --- SETUP ĐƯỜNG DẪN ---
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from build_index import row_to_node
+from config.embed import load_embed
+from config.rerank import load_reranker
+
+CSV_PATH = os.path.join("data_raw", "foods.csv")
+TESTSET_PATH = os.path.join("evaluation", "testset_ground_truth.csv")
+BACKENDS = ("torch", "onnx")
+
+
+def load_corpus(n_docs, n_queries):
+    df = pd.read_csv(CSV_PATH).head(n_docs)
+    texts = [row_to_node(row).get_content(metadata_mode="embed") for _, row in df.iterrows()]
+    if os.path.exists(TESTSET_PATH):
+        queries = pd.read_csv(TESTSET_PATH)["question"].dropna().astype(str).tolist()
+    else:
+        queries = [f"{name} bao nhiêu calo?" for name in df["dish_name"]]
+    return texts, queries[:n_queries]
+
+
+def rss_mb():
+    return psutil.Process().memory_info().rss / 1024 ** 2
+
+
+def normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True).clip(min=1e-12)
+
+
+def timed_each(func, inputs):
+    latencies = []
+    for item in inputs:
+        t0 = time.perf_counter()
+        func(item)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return latencies
+
+
+def load_and_embed(backend, texts, queries, args):
+    """Nạp embedding + reranker của 1 backend, đo RAM tăng thêm + thời gian nhúng."""
+    print(f"\n⏳ [{backend}] đang nạp model...")
+    before = rss_mb()
+    embed = load_embed(embed_batch_size=args.batch_size, backend=backend)
+    embed_mb = rss_mb() - before
+    reranker = load_reranker(backend=backend)
+    rerank_mb = rss_mb() - before - embed_mb
+
+    t0 = time.perf_counter()
+    doc_vecs = normalize(embed.get_text_embedding_batch(texts))
+    corpus_s = time.perf_counter() - t0
+    embed.get_query_embedding(queries[0])  # warm-up
+    query_ms = timed_each(embed.get_query_embedding, queries)
+    query_vecs = normalize([embed.get_query_embedding(q) for q in queries])
+    return {"reranker": reranker, "doc_vecs": doc_vecs, "query_vecs": query_vecs,
+            "embed_mb": embed_mb, "rerank_mb": rerank_mb, "corpus_s": corpus_s, "query_ms": query_ms}
+
+
+def rerank_all(run, pairs):
+    """Chấm cùng 1 tập cặp (câu hỏi, ứng viên) cho mỗi câu hỏi, đo thời gian 1 lần predict."""
+    def predict(p):
+        return np.asarray(run["reranker"].predict(p, batch_size=len(p), show_progress_bar=False))
+
+    predict(pairs[0])  # warm-up
+    run["rerank_ms"] = timed_each(predict, pairs)
+    run["scores"] = [predict(p) for p in pairs]
+
+
+def top_k(query_vecs, doc_vecs, k):
+    return np.argsort(-(query_vecs @ doc_vecs.T), axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Độ khớp + hiệu năng PyTorch vs ONNX int8")
+    parser.add_argument("--docs", type=int, default=300, help="Số món trong foods.csv dùng làm corpus")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=10, help="Số ứng viên rerank mỗi câu hỏi")
+    parser.add_argument("--batch-size", type=int, default=16)
+    args = parser.parse_args()
+
+    texts, queries = load_corpus(args.docs, args.queries)
+    print(f"📂 {len(texts)} món, {len(queries)} câu hỏi")
+    # Import trước khi đo RAM -> RSS tăng thêm chỉ gồm trọng số model + session
+    import sentence_transformers  # noqa: F401
+
+    torch_run = load_and_embed("torch", texts, queries, args)
+    onnx_run = load_and_embed("onnx", texts, queries, args)
+    # Ứng viên rerank lấy từ vector search torch -> 2 backend chấm đúng cùng 1 tập cặp
+    candidates = top_k(torch_run["query_vecs"], torch_run["doc_vecs"], args.candidates)
+    pairs = [[(q, texts[i]) for i in cand] for q, cand in zip(queries, candidates)]
+    rerank_all(torch_run, pairs)
+    rerank_all(onnx_run, pairs)
+
+    # --- ĐỘ KHỚP EMBEDDING ---
+    doc_cos = np.sum(torch_run["doc_vecs"] * onnx_run["doc_vecs"], axis=1)
+    query_cos = np.sum(torch_run["query_vecs"] * onnx_run["query_vecs"], axis=1)
+    k = args.top_k
+    top_torch = top_k(torch_run["query_vecs"], torch_run["doc_vecs"], k)
+    top_onnx = top_k(onnx_run["query_vecs"], onnx_run["doc_vecs"], k)
+    overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(top_torch, top_onnx)])
+    top1 = np.mean(top_torch[:, 0] == top_onnx[:, 0])
+    print("\n🧭 Embedding (cosine torch vs onnx):")
+    print(f"   văn bản : TB {doc_cos.mean():.4f} | min {doc_cos.min():.4f}")
+    print(f"   câu hỏi : TB {query_cos.mean():.4f} | min {query_cos.min():.4f}")
+    print(f"   vector search: top-1 trùng {top1:.1%} | overlap@{k} {overlap:.1%}")
+
+    # --- ĐỘ KHỚP RERANK ---
+    rhos, rerank_top1, rerank_top3 = [], [], []
+    for s_torch, s_onnx in zip(torch_run["scores"], onnx_run["scores"]):
+        rhos.append(spearmanr(s_torch, s_onnx).correlation)
+        order_torch, order_onnx = np.argsort(-s_torch), np.argsort(-s_onnx)
+        rerank_top1.append(order_torch[0] == order_onnx[0])
+        rerank_top3.append(len(set(order_torch[:3]) & set(order_onnx[:3])) / 3)
+    print("\n🏅 Rerank (thứ hạng torch vs onnx):")
+    print(f"   Spearman TB {np.nanmean(rhos):.4f} | min {np.nanmin(rhos):.4f}")
+    print(f"   top-1 trùng {np.mean(rerank_top1):.1%} | overlap@3 {np.mean(rerank_top3):.1%}")
+
+    # --- HIỆU NĂNG ---
+    print(f"\n⚡ Hiệu năng ({args.candidates} ứng viên / câu rerank):")
+    print(f"   {'backend':<8} {'RAM embed':>10} {'RAM rerank':>11} {'query p50':>10} {'query p95':>10} "
+          f"{'rerank p50':>11} {'rerank p95':>11} {'corpus':>8}")
+    for name, run in zip(BACKENDS, (torch_run, onnx_run)):
+        print(f"   {name:<8} {run['embed_mb']:>8.0f}MB {run['rerank_mb']:>9.0f}MB "
+              f"{np.percentile(run['query_ms'], 50):>8.1f}ms {np.percentile(run['query_ms'], 95):>8.1f}ms "
+              f"{np.percentile(run['rerank_ms'], 50):>9.1f}ms {np.percentile(run['rerank_ms'], 95):>9.1f}ms "
+              f"{run['corpus_s']:>7.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Đo thời gian import lúc khởi động (cold start) bằng `python -X importtime`.
+
+Chạy import trong tiến trình con mới (không dính cache module của tiến trình hiện tại), rồi tổng hợp:
+  - tổng thời gian import module gốc
+  - package tốn nhiều nhất (cộng "self time" của mọi module con)
+  - module có cumulative time lớn nhất (thường là điểm nên import lazy)
+
+Chạy:  python evaluation/profile_imports.py --module main --top 15
+       python evaluation/profile_imports.py --module config.llm
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# import time:       412 |       1203 |   llama_index.core
+LINE_RE = re.compile(r"^import time:\s+(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)")
+
+
+def run_importtime(module):
+    """[(self_us, cumulative_us, depth, name)] của 1 lần import trong tiến trình mới."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        tail = proc.stderr.strip().splitlines()[-1:] or ["?"]
+        raise SystemExit(f"❌ Import {module} lỗi: {tail[0]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((int(self_us), int(cumulative_us), len(indent) // 2, name))
+    return rows
+
+
+def summarize(rows, module):
+    total_us = next((cum for _, cum, _, name in rows if name == module), sum(r[0] for r in rows))
+    by_package = defaultdict(int)
+    for self_us, _, _, name in rows:
+        by_package[name.split(".")[0]] += self_us
+    return total_us, by_package
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile thời gian import lúc khởi động")
+    parser.add_argument("--module", default="main", help="Module cần đo (vd: main, api.dependencies, config.llm)")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần đo (lấy median tổng thời gian)")
+    args = parser.parse_args()
+
+    print(f"⏱️  Đang đo import '{args.module}' ({args.repeat} lần)...")
+    runs = [run_importtime(args.module) for _ in range(args.repeat)]
+    totals = [summarize(rows, args.module)[0] / 1000 for rows in runs]
+    # Lần có tổng thời gian ở giữa dùng cho bảng chi tiết
+    rows = runs[sorted(range(len(runs)), key=lambda i: totals[i])[len(runs) // 2]]
+    total_us, by_package = summarize(rows, args.module)
+
+    print(f"\n📦 Tổng: median {statistics.median(totals):.0f} ms "
+          f"(min {min(totals):.0f} / max {max(totals):.0f}), {len(rows)} module")
+
+    print(f"\n🔝 Top {args.top} package (tổng self time):")
+    for package, self_us in sorted(by_package.items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"   {package:<32} {self_us / 1000:8.1f} ms  {100 * self_us / max(total_us, 1):5.1f}%")
+
+    print(f"\n🔝 Top {args.top} module (cumulative, gồm module con):")
+    top_level = [r for r in rows if r[3] != args.module]
+    for _, cumulative_us, depth, name in sorted(top_level, key=lambda r: -r[1])[:args.top]:
+        print(f"   {name:<48} {cumulative_us / 1000:8.1f} ms  (độ sâu {depth})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,115 @@
+import argparse
+import os
+
 import matplotlib.pyplot as plt
 import numpy as np
-import os
+import pandas as pd
 
-# --- CẤU HÌNH SỐ LIỆU GIẢ LẬP (FAKE DATA) ---
-# Bạn có thể sửa các số này cho khớp với file Excel của bạn
-metrics = ['Faithfulness', 'Answer Relevancy', 'Context Precision']
-scores = [0.9452, 0.9568, 0.9120]  # Điểm số tương ứng
+# --- SỐ LIỆU ĐO THẬT (KHÔNG CÒN FAKE DATA) ---
+#   - Điểm Ragas : trung bình các cột trong file Excel của 2_run_evaluation.py
+#   - Load test  : kết quả từng request của benchmark_load.py (CSV)
+RAGAS_REPORT = os.path.join("evaluation", "lucfin_final_report.xlsx")
+LOAD_RESULTS = os.path.join("evaluation", "load_results.csv")
+
+metrics = {'faithfulness': 'Faithfulness', 'answer_relevancy': 'Answer Relevancy',
+           'context_precision': 'Context Precision'}
+STAGES = ["plan", "contextualize", "retrieve", "generate"]
 
 # Màu sắc cho các cột (Xanh dương đậm, Xanh lá, Cam - Hoặc cùng tông xanh)
-colors = ['#2E86C1', '#28B463', '#D35400']
+colors = ['#2E86C1', '#28B463', '#D35400', '#8E44AD']
+
+
+def label_bars(ax, bars, fmt):
+    # --- VIẾT SỐ LÊN ĐẦU CỘT ---
+    for bar in bars:
+        height = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width() / 2.0, height, fmt.format(height),
+                ha='center', va='bottom', fontsize=9, fontweight='bold', color='black')
 
-def draw_chart():
+
+def draw_ragas_chart(report_path=RAGAS_REPORT):
     print("🎨 Đang vẽ biểu đồ đánh giá...")
+    df = pd.read_excel(report_path)
+    present = [m for m in metrics if m in df.columns]
+    scores = [df[m].dropna().mean() for m in present]
 
     # Tạo khung hình
-    plt.figure(figsize=(10, 6)) # Kích thước 10x6 inch
-    
+    fig, ax = plt.subplots(figsize=(10, 6))  # Kích thước 10x6 inch
+
     # Vẽ cột
-    bars = plt.bar(metrics, scores, color=colors, width=0.6, edgecolor='black', alpha=0.8)
+    bars = ax.bar([metrics[m] for m in present], scores, color=colors[:len(present)], width=0.6,
+                  edgecolor='black', alpha=0.8)
 
     # Trang trí trục
-    plt.ylabel('Score', fontsize=12, fontweight='bold')
-    plt.title('Lucfin RAG Performance', fontsize=16, fontweight='bold', pad=20)
-    plt.ylim(0, 1.15)  # Giới hạn trục Y từ 0 đến 1.15 để chừa chỗ viết số
-    plt.grid(axis='y', linestyle='--', alpha=0.5)
-
-    # --- VIẾT SỐ LÊN ĐẦU CỘT ---
-    for bar in bars:
-        height = bar.get_height()
-        plt.text(
-            bar.get_x() + bar.get_width() / 2.0, # Tọa độ X (Giữa cột)
-            height + 0.02,                       # Tọa độ Y (Cao hơn cột một chút)
-            f'{height:.4f}',                     # Nội dung (Số làm tròn 4 chữ số)
-            ha='center', va='bottom',            # Căn giữa
-            fontsize=12, fontweight='bold', color='black'
-        )
+    ax.set_ylabel('Score', fontsize=12, fontweight='bold')
+    ax.set_title(f'Lucfin RAG Performance ({len(df)} câu hỏi)', fontsize=16, fontweight='bold', pad=20)
+    ax.set_ylim(0, 1.15)  # Giới hạn trục Y từ 0 đến 1.15 để chừa chỗ viết số
+    ax.grid(axis='y', linestyle='--', alpha=0.5)
+    label_bars(ax, bars, '{:.4f}')
 
     # Lưu ảnh độ phân giải cao (300 DPI) để in ấn sắc nét
     output_path = os.path.join("evaluation", "rag_performance_chart.png")
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
-    
-    # Hiển thị lên màn hình (nếu chạy local)
-    # plt.show() 
-    
-    print(f"✅ Đã lưu biểu đồ đẹp tại: {output_path}")  
+    fig.savefig(output_path, dpi=300, bbox_inches='tight')
+    print(f"✅ Đã lưu biểu đồ đẹp tại: {output_path}")
+
+
+def draw_load_chart(results_path=LOAD_RESULTS):
+    print("🎨 Đang vẽ biểu đồ load test...")
+    df = pd.read_csv(results_path)
+    ok = df[df["status"].astype(str) == "200"]
+    wall = (df["start_s"] + df["latency_ms"] / 1000).max() - df["start_s"].min()
+    routes = sorted(ok["route"].dropna().unique())
+
+    fig, (ax_lat, ax_stage) = plt.subplots(1, 2, figsize=(16, 6))
+
+    # 1. p50 / p95 / p99 theo luồng
+    x, width = np.arange(len(routes)), 0.25
+    for i, p in enumerate((50, 95, 99)):
+        values = [np.percentile(ok.loc[ok["route"] == r, "latency_ms"], p) for r in routes]
+        bars = ax_lat.bar(x + (i - 1) * width, values, width, label=f'p{p}', color=colors[i],
+                          edgecolor='black', alpha=0.8)
+        label_bars(ax_lat, bars, '{:.0f}')
+    ax_lat.set_xticks(x, routes)
+    ax_lat.set_ylabel('Latency (ms)', fontsize=12, fontweight='bold')
+    ax_lat.set_title(f'Latency theo luồng ({len(ok)} request, {len(ok) / wall:.1f} req/s)',
+                     fontsize=14, fontweight='bold')
+    ax_lat.grid(axis='y', linestyle='--', alpha=0.5)
+    ax_lat.legend()
+
+    # 2. Thời gian trung bình từng bước (Server-Timing) của /ask
+    asks = ok[ok["endpoint"] == "/ask"]
+    ask_routes = sorted(asks["route"].dropna().unique())
+    bottom = np.zeros(len(ask_routes))
+    for i, stage in enumerate(STAGES):
+        column = f"{stage}_ms"
+        if column not in asks.columns:
+            continue
+        values = np.array([asks.loc[asks["route"] == r, column].fillna(0).mean() for r in ask_routes])
+        ax_stage.bar(ask_routes, values, bottom=bottom, label=stage, color=colors[i], edgecolor='black', alpha=0.8)
+        bottom += values
+    ax_stage.set_ylabel('Mean time (ms)', fontsize=12, fontweight='bold')
+    ax_stage.set_title('Thời gian từng bước /ask (Server-Timing)', fontsize=14, fontweight='bold')
+    ax_stage.grid(axis='y', linestyle='--', alpha=0.5)
+    ax_stage.legend()
+
+    output_path = os.path.join("evaluation", "load_latency_chart.png")
+    fig.savefig(output_path, dpi=300, bbox_inches='tight')
+    print(f"✅ Đã lưu biểu đồ load test tại: {output_path}")
+
 
 if __name__ == "__main__":
-    draw_chart()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Vẽ biểu đồ từ kết quả đo thật")
+    parser.add_argument("--ragas", nargs="?", const=RAGAS_REPORT, help="File Excel của 2_run_evaluation.py")
+    parser.add_argument("--load", nargs="?", const=LOAD_RESULTS, help="CSV của benchmark_load.py")
+    args = parser.parse_args()
+
+    # Không chỉ định -> vẽ tất cả những gì đã có kết quả
+    if not args.ragas and not args.load:
+        args.ragas = RAGAS_REPORT if os.path.exists(RAGAS_REPORT) else None
+        args.load = LOAD_RESULTS if os.path.exists(LOAD_RESULTS) else None
+        if not args.ragas and not args.load:
+            print("❌ Chưa có kết quả đo: chạy evaluation/2_run_evaluation.py hoặc evaluation/benchmark_load.py trước.")
+    if args.ragas:
+        draw_ragas_chart(args.ragas)
+    if args.load:
+        draw_load_chart(args.load)
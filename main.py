@@ -1,26 +1,47 @@
-import uvicorn
-from fastapi import FastAPI
+import asyncio
+import os
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse
 from api.end_points import router as ask_router
 
-# Import hàm load model để nạp trước vào RAM/VRAM
-from config.rerank import load_reranker
+# Container tài nguyên dùng chung (LLM, HTTP pool, index, reranker)
+from api.dependencies import AppResources
+from utils.embed_cache import query_cache_stats
+from utils.observability import RequestContextMiddleware, get_logger, metrics_payload
+from utils.session_manager import SESSION_STORE, get_session_stats
 
 app = FastAPI(
     title="RAG Lucfin QA",
     description="API truy vấn tài liệu dinh dưỡng, tích hợp Computer Vision & RAG thông minh",
     version="1.0.0"
 )
+logger = get_logger("main")
+
+# Request id (X-Request-ID) + metrics theo endpoint / luồng cho mọi request
+app.add_middleware(RequestContextMiddleware)
 
 # --- SỰ KIỆN KHỞI ĐỘNG (WARM-UP) ---
-# Chạy ngay khi Server bật, giúp request đầu tiên không bị chậm
+# Không chờ nạp model: server nhận request ngay (/ping, /ready), LLM client / reranker / embedding +
+# index nạp song song trong nền. /ask trả 503 tới khi có LLM, request RAG sớm chờ đúng task nạp index.
 @app.on_event("startup")
 async def startup_event():
-    print("🚀 Server đang khởi động: Pre-loading Models...")
-    try:
-        load_reranker() # Nạp model Cross-Encoder vào GPU ngay lập tức
-        print("✅ Model Re-ranker đã sẵn sàng trong VRAM!")
-    except Exception as e:
-        print(f"⚠️ Cảnh báo: Không thể nạp trước Reranker: {e}")
+    logger.info("server starting: warming up models in background")
+    resources = AppResources()
+    app.state.resources = resources
+    app.state.warm_up = resources.start_warm_up()
+    # Task nền dọn session hết hạn (TTL) -> RAM không tăng theo số session_id cũ
+    interval = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+    app.state.session_sweeper = asyncio.create_task(SESSION_STORE.run_sweeper(interval))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task_name in ("session_sweeper", "warm_up"):
+        task = getattr(app.state, task_name, None)
+        if task is not None:
+            task.cancel()
+    resources = getattr(app.state, "resources", None)
+    if resources is not None:
+        await resources.aclose()
 
 # --- ĐĂNG KÝ ROUTER ---
 # Đưa toàn bộ logic từ api/end_points.py vào App
@@ -31,7 +52,40 @@ app.include_router(ask_router, prefix="")
 async def ping():
     return {"message": "pong", "status": "Server is running"}
 
+# --- READINESS (LOAD BALANCER / K8S) ---
+# 200 khi LLM + index đã nạp xong, 503 kèm trạng thái từng thành phần khi đang warm-up hoặc lỗi
+@app.get("/ready")
+async def ready():
+    resources = getattr(app.state, "resources", None)
+    if resources is None:
+        return JSONResponse({"ready": False, "components": {}}, status_code=503)
+    status = resources.readiness()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+# --- CACHE STATS (MONITORING) ---
+@app.get("/cache/stats")
+async def cache_stats():
+    resources = getattr(app.state, "resources", None)
+    return {
+        "query_embedding": query_cache_stats(),
+        "answer": resources.answer_cache.stats() if resources is not None else {},
+        "scan_prefetch": resources.scan_prefetcher.stats() if resources is not None else {},
+    }
+
+# --- PROMETHEUS METRICS (MONITORING) ---
+@app.get("/metrics")
+async def metrics():
+    body, content_type = metrics_payload()
+    return Response(content=body, media_type=content_type)
+
+# --- SESSION STATS (MONITORING) ---
+@app.get("/sessions/stats")
+async def session_stats():
+    return await get_session_stats()
+
 # --- ENTRY POINT ---
 if __name__ == "__main__":
+    import uvicorn
+
     # Chạy server tại 0.0.0.0 để Android Emulator hoặc thiết bị khác trong LAN gọi được
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
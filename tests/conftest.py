@@ -0,0 +1,27 @@
+import os
+import sys
+import time
+
+import pytest
+
+# --- SETUP ĐƯỜNG DẪN --- (giống evaluation/*.py: import module từ thư mục gốc repo)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+class FakeClock:
+    def __init__(self, start=1_000_000.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Thay time.time -> test TTL không cần sleep."""
+    fake = FakeClock()
+    monkeypatch.setattr(time, "time", fake)
+    return fake
@@ -0,0 +1,105 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import api.end_points as end_points
+from api.intent_classifier import IntentResult, LocalIntentClassifier
+from utils.answer_cache import SemanticAnswerCache
+
+PHO = [1.0, 0.0, 0.0]
+PAYLOAD = {"answer": "Phở bò khoảng 450 kcal.", "image": None, "sourceDocuments": ["Phở bò"]}
+
+
+def rotated(cosine):
+    """Vector có cosine = `cosine` với PHO."""
+    return [cosine, float(np.sqrt(1 - cosine ** 2)), 0.0]
+
+
+@pytest.fixture
+def cache(clock):
+    cache = SemanticAnswerCache(max_entries=3, threshold=0.95, ttl_seconds=60)
+    cache.store(PHO, "RAG", "v1", PAYLOAD)
+    return cache
+
+
+def test_hit_at_and_above_threshold(cache):
+    assert cache.lookup(PHO, "RAG", "v1") == PAYLOAD
+    assert cache.lookup([2.0, 0.0, 0.0], "RAG", "v1") == PAYLOAD   # chuẩn hóa L2
+    assert cache.lookup(rotated(0.96), "RAG", "v1") == PAYLOAD
+
+
+def test_miss_below_threshold(cache):
+    assert cache.lookup(rotated(0.94), "RAG", "v1") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_payload_is_copied(cache):
+    cache.lookup(PHO, "RAG", "v1")["answer"] = "sửa"
+    assert cache.lookup(PHO, "RAG", "v1") == PAYLOAD
+
+
+def test_scope_isolation(cache):
+    assert cache.lookup(PHO, "CHITCHAT", "v1") is None
+
+
+def test_ttl(cache, clock):
+    clock.advance(60)
+    assert cache.lookup(PHO, "RAG", "v1") == PAYLOAD
+    clock.advance(1)
+    assert cache.lookup(PHO, "RAG", "v1") is None
+
+
+def test_index_version_invalidates(cache):
+    assert cache.lookup(PHO, "RAG", "v2") is None
+    assert cache.lookup(PHO, "RAG", "v1") is None  # đã bị xóa, không quay lại
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_lru_eviction(cache):
+    others = [[0.0, 1.0, 0.0], [0.0, 0.0, 1.0], [0.0, 0.7, 0.7]]
+    cache.store(others[0], "RAG", "v1", {"answer": "b"})
+    cache.store(others[1], "RAG", "v1", {"answer": "c"})
+    assert cache.lookup(PHO, "RAG", "v1") == PAYLOAD      # PHO vừa dùng -> others[0] cũ nhất
+    cache.store(others[2], "RAG", "v1", {"answer": "d"})
+    assert cache.lookup(others[0], "RAG", "v1") is None
+    assert cache.lookup(PHO, "RAG", "v1") == PAYLOAD
+    assert cache.stats()["entries"] == 3
+
+
+# --- Scope trong luồng /ask: follow-up không bao giờ đọc / ghi cache ---
+class FixedIntent(LocalIntentClassifier):
+    def __init__(self, intent):
+        super().__init__()
+        self.intent = intent
+
+    def classify_rules(self, query):
+        return IntentResult(self.intent, 0.99, "rules")
+
+
+def plan(cache, intent, question, session_id):
+    resources = SimpleNamespace(
+        intent_classifier=FixedIntent(intent), classifier_llm=None, nutrition_table=None,
+        # Mọi câu hỏi cùng 1 embedding -> chỉ scope quyết định có dùng cache hay không
+        embed_model=SimpleNamespace(get_query_embedding=lambda q: PHO),
+        answer_cache=cache, index_version="v1",
+    )
+    request = end_points.NutritionRequest(question=question, session_id=session_id)
+    return asyncio.run(end_points.plan_request(request, resources))
+
+
+def test_followup_never_gets_cached_answer(cache):
+    new_topic = plan(cache, "NEW_TOPIC", "Phở bò bao nhiêu calo?", "cache-s1")
+    assert new_topic.cache_scope == "RAG" and new_topic.cached == PAYLOAD
+
+    # Hỏi tiếp về món khác đang nói trong session (focus RAG) -> không dùng câu trả lời của Phở bò
+    followup = plan(cache, "FOLLOWUP", "Nó bao nhiêu calo?", "cache-s1")
+    assert followup.route == "RAG"
+    assert followup.cache_scope is None and followup.cached is None and followup.cache_key is None
+
+
+def test_chitchat_scope_separate_from_rag(cache):
+    chitchat = plan(cache, "CHITCHAT", "Xin chào", "cache-s2")
+    assert chitchat.route == "CHITCHAT" and chitchat.cache_scope == "CHITCHAT"
+    assert chitchat.cached is None
@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.batching import MicroBatcher
+
+
+class Recorder:
+    """batch_fn ghi lại từng batch; batch đầu tiên chờ `gate` để các lời gọi sau kịp xếp hàng."""
+
+    def __init__(self, fail_on=None):
+        self.batches = []
+        self.gate = threading.Event()
+        self.started = threading.Event()
+        self.fail_on = fail_on
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        if len(self.batches) == 1:
+            self.started.set()
+            assert self.gate.wait(5)
+        if self.fail_on is not None and self.fail_on in items:
+            raise ValueError(f"lỗi ở {self.fail_on}")
+        return [item * 10 for item in items]
+
+
+def hold_first_batch(batcher, recorder):
+    first = batcher.submit([0])
+    assert recorder.started.wait(5)
+    return first
+
+
+def test_coalesces_queued_calls_up_to_max_size():
+    recorder = Recorder()
+    batcher = MicroBatcher(recorder, max_batch_size=4, max_wait_ms=0)
+    first = hold_first_batch(batcher, recorder)
+    futures = [batcher.submit([i]) for i in range(1, 7)]
+    recorder.gate.set()
+
+    assert first.result(5) == [0]
+    assert [f.result(5) for f in futures] == [[i * 10] for i in range(1, 7)]
+    assert recorder.batches == [[0], [1, 2, 3, 4], [5, 6]]
+    assert batcher.stats()["batches"] == 3 and batcher.stats()["calls"] == 7
+
+
+def test_call_is_never_split_across_batches():
+    recorder = Recorder()
+    batcher = MicroBatcher(recorder, max_batch_size=4, max_wait_ms=0)
+    hold_first_batch(batcher, recorder)
+    futures = [batcher.submit([1, 2, 3]), batcher.submit([4, 5]), batcher.submit([6, 7, 8, 9, 10])]
+    recorder.gate.set()
+
+    assert [f.result(5) for f in futures] == [[10, 20, 30], [40, 50], [60, 70, 80, 90, 100]]
+    # [4, 5] không vừa phần còn lại của batch [1, 2, 3] -> sang batch sau; lời gọi > max chạy riêng
+    assert recorder.batches[1:] == [[1, 2, 3], [4, 5], [6, 7, 8, 9, 10]]
+
+
+def test_flushes_after_max_wait():
+    batcher = MicroBatcher(lambda items: items, max_batch_size=100, max_wait_ms=50)
+    started = time.perf_counter()
+    assert batcher(["a"]) == ["a"]
+    elapsed = time.perf_counter() - started
+    assert 0.04 <= elapsed < 1.0
+    assert batcher.stats()["avg_batch_items"] == 1
+
+
+def test_failure_reaches_every_caller_in_the_batch():
+    recorder = Recorder(fail_on=3)
+    batcher = MicroBatcher(recorder, max_batch_size=4, max_wait_ms=0)
+    hold_first_batch(batcher, recorder)
+    futures = [batcher.submit([i]) for i in range(1, 5)]
+    recorder.gate.set()
+
+    for future in futures:
+        with pytest.raises(ValueError, match="lỗi ở 3"):
+            future.result(5)
+    # Worker vẫn sống sau lỗi
+    assert batcher([7]) == [70]
+
+
+def test_wrong_result_length_is_an_error():
+    batcher = MicroBatcher(lambda items: items[:-1], max_batch_size=4, max_wait_ms=0)
+    with pytest.raises(RuntimeError):
+        batcher([1, 2])
+
+
+def test_acall_and_empty_input():
+    batcher = MicroBatcher(lambda items: [item + 1 for item in items], max_batch_size=8, max_wait_ms=5)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.acall([i]) for i in range(5)))
+
+    assert asyncio.run(scenario()) == [[1], [2], [3], [4], [5]]
+    assert batcher([]) == []
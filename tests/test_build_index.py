@@ -0,0 +1,71 @@
+import pandas as pd
+import pytest
+from llama_index.core import MockEmbedding, Settings
+
+import build_index
+from build_index import build_index as run_build, diff_nodes, row_to_node
+from config.vector_store import load_stored_embeddings
+
+ROWS = [
+    {"dish_name": "Phở bò", "dish_type": "Món nước", "description": "Phở Hà Nội", "ingredients": "bánh phở, bò",
+     "cooking_method": "Hầm xương", "calories": 450, "protein": 25, "fat": 12, "image_link": ""},
+    {"dish_name": "Cơm hến", "dish_type": "Món khô", "description": "Đặc sản Huế", "ingredients": "hến, cơm",
+     "cooking_method": "Trộn", "calories": 350, "protein": 15, "fat": 8, "image_link": ""},
+    {"dish_name": "Bánh mì", "dish_type": "Món khô", "description": "Bánh mì thịt", "ingredients": "bánh mì, pate",
+     "cooking_method": "Nướng", "calories": 400, "protein": 14, "fat": 15, "image_link": ""},
+]
+
+
+def stored_of(nodes):
+    return {node.node_id: (node.metadata["content_hash"], [0.0]) for node in nodes}
+
+
+def test_diff_nodes():
+    old = [row_to_node(row) for row in ROWS]
+    new_rows = [dict(ROWS[0], calories=500, description="Phở Nam Định"), ROWS[1],
+                {**ROWS[2], "dish_name": "Bún chả"}]
+    added, changed, unchanged, removed = diff_nodes([row_to_node(row) for row in new_rows], stored_of(old))
+    assert [n.metadata["dish_name"] for n in added] == ["Bún chả"]
+    assert [n.metadata["dish_name"] for n in changed] == ["Phở bò"]
+    assert [n.metadata["dish_name"] for n in unchanged] == ["Cơm hến"]
+    assert removed == [old[2].node_id]
+
+
+@pytest.fixture
+def built(tmp_path, monkeypatch, request):
+    """Build đầy đủ 1 lần bằng embedding giả rồi xóa model khỏi Settings như 1 process mới."""
+    backend = request.param
+    csv_path = tmp_path / "foods.csv"
+    pd.DataFrame(ROWS).to_csv(csv_path, index=False)
+    paths = {"persist_dir": str(tmp_path / "FoodDB"), "sparse_dir": str(tmp_path / "sparse")}
+    monkeypatch.setattr(build_index, "load_embed", lambda: MockEmbedding(embed_dim=4))
+    run_build(str(csv_path), backend=backend, **paths)
+
+    def no_model():
+        raise AssertionError("không được nạp embedding model khi không có dòng mới / sửa")
+
+    monkeypatch.setattr(build_index, "load_embed", no_model)
+    monkeypatch.setattr(Settings, "_embed_model", None)
+    return backend, csv_path, paths
+
+
+@pytest.mark.parametrize("built", ["simple", "compact"], indirect=True)
+def test_incremental_noop(built, capsys):
+    backend, csv_path, paths = built
+    before = load_stored_embeddings(backend, paths["persist_dir"])
+    run_build(str(csv_path), backend=backend, incremental=True, **paths)
+    assert "không có gì để làm" in capsys.readouterr().out
+    assert load_stored_embeddings(backend, paths["persist_dir"]).keys() == before.keys()
+
+
+@pytest.mark.parametrize("built", ["simple", "compact"], indirect=True)
+def test_incremental_removal_only(built):
+    backend, csv_path, paths = built
+    before = load_stored_embeddings(backend, paths["persist_dir"])
+    pd.DataFrame(ROWS[:2]).to_csv(csv_path, index=False)
+    nodes = run_build(str(csv_path), backend=backend, incremental=True, **paths)
+    after = load_stored_embeddings(backend, paths["persist_dir"])
+    assert set(after) == {node.node_id for node in nodes} and len(after) == 2
+    for node_id, (content_hash, embedding) in after.items():
+        assert content_hash == before[node_id][0]
+        assert embedding == pytest.approx(before[node_id][1])
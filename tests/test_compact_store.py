@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores import FilterCondition, FilterOperator, MetadataFilter, MetadataFilters
+
+from config.compact_store import CompactVectorIndex, is_compact_dir, save_compact_index
+
+N, DIM = 50, 16
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(N, DIM)).astype(np.float32)
+    nodes = [TextNode(id_=f"dish-{i}", text=f"Món {i}", embedding=vectors[i].tolist(),
+                      metadata={"dish_name": f"Món {i}", "calories": 100 + 10 * i, "dish_type": "nước" if i % 2 else "khô"})
+             for i in range(N)]
+    return vectors, nodes
+
+
+@pytest.fixture(scope="module", params=["float32", "float16"])
+def index(data, tmp_path_factory, request):
+    _, nodes = data
+    path = str(tmp_path_factory.mktemp(request.param))
+    save_compact_index(path, nodes, dtype=request.param)
+    return CompactVectorIndex.load(path)
+
+
+def brute_force(vectors, query, mask=None):
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = unit @ (query / np.linalg.norm(query))
+    if mask is not None:
+        scores = np.where(mask, scores, -np.inf)
+    return np.argsort(-scores, kind="stable"), scores
+
+
+def test_top_k_matches_brute_force_cosine(data, index):
+    vectors, _ = data
+    rng = np.random.default_rng(1)
+    for _ in range(5):
+        query = rng.normal(size=DIM)
+        order, scores = brute_force(vectors, query)
+        ids, got = index.search(query, top_k=5)
+        assert ids.tolist() == order[:5].tolist()
+        np.testing.assert_allclose(got, scores[order[:5]], atol=2e-3)
+        assert np.all(np.diff(got) <= 0)
+
+
+def test_filters_mask_before_top_k(data, index):
+    vectors, _ = data
+    calories = 100 + 10 * np.arange(N)
+    query = np.random.default_rng(2).normal(size=DIM)
+    filters = MetadataFilters(filters=[
+        MetadataFilter(key="calories", operator=FilterOperator.LT, value=300),
+        MetadataFilter(key="dish_type", operator=FilterOperator.EQ, value="nước"),
+    ])
+    mask = (calories < 300) & (np.arange(N) % 2 == 1)
+    order, _ = brute_force(vectors, query, mask)
+    ids, _ = index.search(query, top_k=5, filters=filters)
+    assert ids.tolist() == order[:5].tolist()
+    assert all(mask[ids])
+
+
+def test_filters_or_and_fewer_matches_than_k(data, index):
+    filters = MetadataFilters(filters=[
+        MetadataFilter(key="calories", operator=FilterOperator.LTE, value=110),
+        MetadataFilter(key="calories", operator=FilterOperator.GTE, value=580),
+    ], condition=FilterCondition.OR)
+    ids, scores = index.search(np.ones(DIM), top_k=10, filters=filters)
+    assert sorted(ids.tolist()) == [0, 1, 48, 49]
+    assert np.all(np.isfinite(scores))
+
+
+def test_unsupported_operator(index):
+    filters = MetadataFilters(filters=[MetadataFilter(key="dish_name", operator=FilterOperator.TEXT_MATCH, value="Món")])
+    with pytest.raises(ValueError):
+        index.search(np.ones(DIM), top_k=3, filters=filters)
+
+
+def test_empty_index(tmp_path):
+    save_compact_index(str(tmp_path), [], dim=DIM)
+    assert is_compact_dir(str(tmp_path))
+    index = CompactVectorIndex.load(str(tmp_path))
+    assert index.embeddings.shape == (0, DIM)
+    ids, scores = index.search(np.ones(DIM), top_k=3)
+    assert ids.size == 0 and scores.size == 0
+
+
+def test_node_without_embedding_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        save_compact_index(str(tmp_path), [TextNode(id_="x", text="Món x")])
@@ -0,0 +1,104 @@
+from types import SimpleNamespace
+
+import pytest
+
+from api.dish_index import DishNameIndex
+
+DISHES = ["Phở bò", "Cơm hến", "Hủ tiếu Nam Vang", "Bánh mì", "Cá kho tộ", "Canh chua cá lóc", "Chè (đậu xanh)"]
+
+
+@pytest.fixture(scope="module")
+def index():
+    nodes = [SimpleNamespace(metadata={"dish_name": name}) for name in DISHES]
+    return DishNameIndex(nodes, aliases={"hủ tíu nam vang": "Hủ tiếu Nam Vang", "bánh mỳ": "Bánh mì",
+                                         "món không có": "Không có trong FoodDB"})
+
+
+def names(matches):
+    return [m.dish_name for m in matches]
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("Phở bò bao nhiêu calo?", "Phở bò"),
+    ("com hen co beo khong", "Cơm hến"),           # không dấu
+    ("CƠM HẾN ăn tối được không", "Cơm hến"),
+])
+def test_exact(index, query, expected):
+    matches = index.lookup(query)
+    assert names(matches) == [expected]
+    assert matches[0].method == "exact" and matches[0].score == 1.0
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("hủ tíu nam vang nấu sao", "Hủ tiếu Nam Vang"),
+    ("bánh mỳ bao nhiêu calo", "Bánh mì"),
+    ("chè ăn có mập không", "Chè (đậu xanh)"),      # tên rút gọn (bỏ phần trong ngoặc)
+])
+def test_alias(index, query, expected):
+    matches = index.lookup(query)
+    assert names(matches) == [expected]
+    assert matches[0].method == "alias"
+
+
+def test_alias_to_missing_dish_is_ignored(index):
+    assert index.lookup("món không có") == []
+
+
+def test_longest_match_and_multiple_dishes(index):
+    # "Canh chua cá lóc" thắng các n-gram ngắn hơn; 2 món trong 1 câu
+    assert names(index.lookup("so sánh canh chua cá lóc với phở bò")) == ["Canh chua cá lóc", "Phở bò"]
+    assert len(index.lookup("so sánh canh chua cá lóc với phở bò", limit=1)) == 1
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("canh chua ca loc", "Canh chua cá lóc"),
+    ("canh chuaa cá lóc bao nhiêu calo", "Canh chua cá lóc"),   # gõ sai 1 ký tự
+    ("hu tieu nam vag", "Hủ tiếu Nam Vang"),                    # thiếu chữ
+])
+def test_fuzzy(index, query, expected):
+    matches = index.lookup(query)
+    assert names(matches) == [expected]
+    assert matches[0].method in ("exact", "fuzzy")
+
+
+def test_fuzzy_method_and_score(index):
+    match = index.lookup("canh chuaa cá lóc")[0]
+    assert match.method == "fuzzy"
+    assert index.fuzzy_threshold <= match.score < 1.0
+
+
+@pytest.mark.parametrize("query", [
+    "hôm nay trời đẹp quá",
+    "kho tộ",            # thiếu âm tiết của tên ngắn -> không khớp "Cá kho tộ"
+    "phớ",               # tên 1 âm tiết chỉ khớp exact
+    "",
+])
+def test_no_match(index, query):
+    assert index.lookup(query) == []
+
+
+@pytest.fixture(scope="module")
+def scan_index():
+    dishes = ["Chả cá Lã Vọng", "Bún chả cá", "Sườn non nướng", "Canh sườn non", "Sườn non chua ngọt", "Đậu hũ sốt cà"]
+    return DishNameIndex([SimpleNamespace(metadata={"dish_name": name}) for name in dishes], aliases={})
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("Chả cá", "Chả cá Lã Vọng"),       # bắt đầu bằng cụm ưu tiên hơn "Bún chả cá"
+    ("Sườn non", "Sườn non nướng"),      # cùng bắt đầu bằng cụm -> tên ngắn nhất
+    ("Đậu hũ", "Đậu hũ sốt cà"),
+    ("sot ca", "Đậu hũ sốt cà"),         # cụm nằm giữa / cuối tên
+])
+def test_partial(scan_index, name, expected):
+    assert scan_index.lookup(name) == []
+    matches = scan_index.lookup_partial(name)
+    assert names(matches) == [expected]
+    assert matches[0].method == "partial" and 0 < matches[0].score < 1.0
+
+
+def test_partial_requires_contiguous_syllables(scan_index):
+    assert scan_index.lookup_partial("cá chả") == []
+    assert scan_index.lookup_partial("Sườn nướng") == []
+    assert scan_index.lookup_partial("Tofu") == []
+    assert names(scan_index.lookup_partial("sườn non", limit=3)) == ["Sườn non nướng", "Sườn non chua ngọt",
+                                                                     "Canh sườn non"]
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from utils.embed_cache import EmbeddingCache, normalize_query
+
+
+def vec(i):
+    return [float(i), 0.5, -1.0]
+
+
+def test_normalize_query_keeps_vietnamese_marks():
+    assert normalize_query("  Phở  BÒ bao nhiêu calo?? ") == "phở bò bao nhiêu calo"
+    assert normalize_query("bò") != normalize_query("bọ")
+
+
+def test_hit_and_normalized_key(clock):
+    cache = EmbeddingCache(max_entries=10, ttl_seconds=60)
+    assert cache.get("Phở bò?") is None
+    cache.put("Phở bò?", vec(1))
+    assert cache.get("phở  bò") == pytest.approx(vec(1))
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_lru_eviction(clock):
+    cache = EmbeddingCache(max_entries=2, ttl_seconds=60)
+    cache.put("a", vec(1))
+    cache.put("b", vec(2))
+    assert cache.get("a") is not None      # "a" vừa dùng -> "b" cũ nhất
+    cache.put("c", vec(3))
+    assert cache.get("b") is None
+    assert cache.get("a") == pytest.approx(vec(1)) and cache.get("c") == pytest.approx(vec(3))
+    assert cache.stats()["evictions"] == 1 and cache.stats()["entries"] == 2
+
+
+def test_ttl_expiry(clock):
+    cache = EmbeddingCache(max_entries=10, ttl_seconds=60)
+    cache.put("a", vec(1))
+    clock.advance(59)
+    assert cache.get("a") is not None
+    clock.advance(2)
+    assert cache.get("a") is None
+    assert cache.stats()["expired"] == 1 and cache.stats()["entries"] == 0
+
+
+def test_save_load_round_trip(tmp_path, clock):
+    path = str(tmp_path / "cache" / "query_embeddings.npz")
+    cache = EmbeddingCache(max_entries=10, ttl_seconds=60, persist_path=path, model_name="m1")
+    cache.put("old", vec(1))
+    clock.advance(30)
+    cache.put("new", vec(2))
+    cache.save()
+
+    clock.advance(40)  # "old" đã 70s > TTL, "new" mới 40s
+    loaded = EmbeddingCache(max_entries=10, ttl_seconds=60, persist_path=path, model_name="m1")
+    loaded.load()
+    assert loaded.get("old") is None
+    assert np.asarray(loaded.get("new"), dtype=np.float32).tolist() == pytest.approx(vec(2))
+    # Giữ timestamp gốc -> hết hạn đúng lúc như trước khi restart
+    clock.advance(21)
+    assert loaded.get("new") is None
+
+
+def test_load_ignores_other_model_and_missing_file(tmp_path, clock):
+    path = str(tmp_path / "q.npz")
+    cache = EmbeddingCache(persist_path=path, model_name="m1")
+    cache.load()  # chưa có file
+    cache.put("a", vec(1))
+    cache.save()
+    other = EmbeddingCache(persist_path=path, model_name="m2")
+    other.load()
+    assert other.get("a") is None and other.stats()["entries"] == 0
@@ -0,0 +1,79 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+import api.end_points as end_points
+from api.intent_classifier import IntentResult, LocalIntentClassifier
+
+THRESHOLD = end_points.INTENT_CONFIDENCE_THRESHOLD
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    return LocalIntentClassifier(dish_names=["Cơm hến", "Bún bò Huế", "Chè đậu xanh"])
+
+
+@pytest.mark.parametrize("query, intent, confident", [
+    ("Cơm hến bao nhiêu calo?", "NEW_TOPIC", True),        # tên món FoodDB
+    ("com hen co beo khong", "NEW_TOPIC", True),           # không dấu
+    ("So với cơm hến thì món này thế nào?", "NEW_TOPIC", False),  # tên món + đại từ -> tầng sau
+    ("Món này có béo không?", "FOLLOWUP", True),
+    ("Nó bao nhiêu calo vậy?", "FOLLOWUP", True),
+    ("Có béo không?", "FOLLOWUP", True),                   # chỉ có vị ngữ
+    ("Thời tiết hôm nay thế nào?", "CHITCHAT", True),
+    ("Bánh xèo miền Tây có béo không?", "NEW_TOPIC", False),  # món ngoài FoodDB
+    ("Phở bao nhiêu calo?", "FOLLOWUP", False),            # 1 âm tiết lạ: có thể là tên món
+    ("ừm", "FOLLOWUP", False),
+])
+def test_classify_rules(classifier, query, intent, confident):
+    result = classifier.classify_rules(query)
+    assert (result.intent, result.source) == (intent, "rules")
+    assert (result.confidence >= THRESHOLD) is confident
+
+
+class StubClassifier(LocalIntentClassifier):
+    """classify_centroid trả kết quả cố định (không cần embedding model thật)."""
+
+    def __init__(self, centroid_result):
+        super().__init__(dish_names=["Cơm hến"], embed_model=object())
+        self.centroid_result = centroid_result
+        self.centroid_calls = 0
+
+    def classify_centroid(self, query, prior):
+        self.centroid_calls += 1
+        return self.centroid_result
+
+
+def detect(classifier, query, llm_answer="NEW_TOPIC"):
+    llm_calls = []
+
+    def fake_llm(prompt):
+        llm_calls.append(prompt)
+        return llm_answer
+
+    resources = SimpleNamespace(intent_classifier=classifier, classifier_llm=RunnableLambda(fake_llm))
+    return asyncio.run(end_points.detect_intent(resources, query)), len(llm_calls)
+
+
+def test_confident_rules_skip_later_layers():
+    classifier = StubClassifier(IntentResult("CHITCHAT", 0.99, "centroid"))
+    assert detect(classifier, "Cơm hến bao nhiêu calo?") == ("NEW_TOPIC", 0)
+    assert classifier.centroid_calls == 0
+
+
+def test_confident_centroid_skips_llm():
+    classifier = StubClassifier(IntentResult("NEW_TOPIC", 0.9, "centroid"))
+    assert detect(classifier, "Phở bao nhiêu calo?") == ("NEW_TOPIC", 0)
+    assert classifier.centroid_calls == 1
+
+
+def test_unsure_centroid_falls_back_to_llm():
+    classifier = StubClassifier(IntentResult("FOLLOWUP", 0.55, "centroid"))
+    assert detect(classifier, "Phở bao nhiêu calo?", llm_answer="NEW_TOPIC") == ("NEW_TOPIC", 1)
+    assert classifier.centroid_calls == 1
+
+
+def test_no_embed_model_goes_straight_to_llm():
+    assert detect(LocalIntentClassifier(), "Phở bao nhiêu calo?", llm_answer="CHITCHAT") == ("CHITCHAT", 1)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from llama_index.core import MockEmbedding, VectorStoreIndex
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores import FilterOperator
+
+from api.end_points import rag_filters
+from api.nutrition_table import Condition, parse_nutrition_conditions
+from config.compact_store import CompactVectorIndex
+from config.vector_store import nutrition_filters
+
+# (tên, calories, protein); 0 = thiếu số liệu (build_index ghi 0 khi ô CSV trống)
+DISHES = [("Gỏi cuốn", 150, 9), ("Canh chua", 120, 14), ("Phở bò", 450, 25), ("Cơm tấm", 600, 30),
+          ("Bánh mì", 0, 0)]
+QUESTION = "Món nào dưới 300 calo tốt cho người tiểu đường?"
+
+
+def make_nodes():
+    return [TextNode(id_=f"dish-{i}", text=f"Món ăn: {name}", embedding=[1.0, float(i), 0.5, 0.0],
+                     metadata={"dish_name": name, "calories": calories, "protein": protein})
+            for i, (name, calories, protein) in enumerate(DISHES)]
+
+
+def names(nodes_with_scores):
+    return sorted(n.node.metadata["dish_name"] for n in nodes_with_scores)
+
+
+def test_conditions_parsed_from_open_ended_question():
+    assert parse_nutrition_conditions(QUESTION) == (Condition("calories", "<", 300.0),)
+    assert parse_nutrition_conditions("Món nào từ 20 đến 30g đạm nên ăn sau tập?") == (
+        Condition("protein", ">=", 20.0), Condition("protein", "<=", 30.0))
+    assert parse_nutrition_conditions("Cách nấu phở bò") == ()
+    assert rag_filters("Cách nấu phở bò") is None
+
+
+def test_nutrition_filters_guard_missing_values_once():
+    filters = nutrition_filters([Condition("protein", ">=", 20), Condition("protein", "<=", 30)])
+    assert [(f.key, f.operator, f.value) for f in filters.filters] == [
+        ("protein", FilterOperator.GTE, 20), ("protein", FilterOperator.LTE, 30), ("protein", FilterOperator.GT, 0)]
+    assert nutrition_filters([]) is None
+
+
+@pytest.fixture(params=["simple", "compact", "chroma"])
+def index(request):
+    embed_model = MockEmbedding(embed_dim=4)
+    if request.param == "compact":
+        nodes = make_nodes()
+        yield CompactVectorIndex(np.asarray([n.embedding for n in nodes], dtype=np.float32), nodes, embed_model)
+        return
+    if request.param == "simple":
+        yield VectorStoreIndex(make_nodes(), embed_model=embed_model)
+        return
+    chromadb = pytest.importorskip("chromadb")
+    chroma = pytest.importorskip("llama_index.vector_stores.chroma")
+    collection = chromadb.EphemeralClient().get_or_create_collection("test_filters", metadata={"hnsw:space": "cosine"})
+    store = chroma.ChromaVectorStore(chroma_collection=collection)
+    store.add(make_nodes())
+    yield VectorStoreIndex.from_vector_store(store, embed_model=embed_model)
+    chromadb.EphemeralClient().delete_collection("test_filters")
+
+
+@pytest.mark.parametrize("question, expected", [
+    (QUESTION, ["Canh chua", "Gỏi cuốn"]),                              # "Bánh mì" thiếu số liệu bị loại
+    ("Món nào trên 400 calo nên ăn trước khi tập?", ["Cơm tấm", "Phở bò"]),
+    ("Món nào từ 10 đến 26g đạm tốt cho người giảm cân?", ["Canh chua", "Phở bò"]),
+])
+def test_filters_pushed_down_to_backend(index, question, expected):
+    retriever = index.as_retriever(similarity_top_k=10, filters=rag_filters(question))
+    assert names(retriever.retrieve("món ăn")) == expected
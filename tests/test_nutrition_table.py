@@ -0,0 +1,103 @@
+import pytest
+
+from api.nutrition_table import Condition, NutritionTable, parse_nutrition_query
+
+ROWS = [
+    {"dish_name": "Phở bò", "calories": 450, "protein": 25, "fat": 12, "image_link": "http://img/pho.jpg"},
+    {"dish_name": "Cơm hến", "calories": 350, "protein": 18, "fat": 8},
+    {"dish_name": "Gỏi cuốn tôm thịt", "calories": 180, "protein": 12, "fat": 4},
+    {"dish_name": "Cơm tấm sườn", "calories": 650, "protein": 32, "fat": 28},
+    {"dish_name": "Bánh xèo", "calories": 0, "protein": 0, "fat": 0},   # thiếu số liệu (ô CSV trống)
+]
+
+
+@pytest.fixture(scope="module")
+def table():
+    return NutritionTable(ROWS)
+
+
+# --- PARSE ---
+@pytest.mark.parametrize("question, nutrients", [
+    ("Phở bò bao nhiêu calo?", ("calories",)),
+    ("cơm hến có bao nhiêu đạm và chất béo", ("protein", "fat")),
+    ("pho bo bao nhieu kcal", ("calories",)),
+    ("dinh dưỡng của phở bò bao nhiêu", ("calories", "protein", "fat")),
+])
+def test_parse_lookup(question, nutrients):
+    assert parse_nutrition_query(question, has_dish=True) == ("lookup", nutrients, (), None, 5)
+
+
+def test_lookup_needs_a_dish():
+    assert parse_nutrition_query("bao nhiêu calo?", has_dish=False) is None
+
+
+@pytest.mark.parametrize("question, conditions, sort, limit", [
+    ("món nào dưới 300 calo nhiều đạm", (Condition("calories", "<", 300),), ("protein", True), 5),
+    ("top 3 món ít béo nhất", (), ("fat", False), 3),
+    ("món từ 20 đến 30g protein", (Condition("protein", ">=", 20), Condition("protein", "<=", 30)), None, 5),
+    ("món dưới 400 kcal", (Condition("calories", "<", 400),), None, 5),
+    ("những món có đạm tối thiểu 20g", (Condition("protein", ">=", 20),), None, 5),
+    ("món nào ít calo nhất", (), ("calories", False), 1),
+])
+def test_parse_list(question, conditions, sort, limit):
+    query = parse_nutrition_query(question, has_dish=False)
+    assert query.kind == "list"
+    assert query.conditions == conditions
+    assert query.sort == sort
+    assert query.limit == limit
+
+
+@pytest.mark.parametrize("question, has_dish", [
+    ("cách nấu phở bò", True),                        # câu mở -> RAG
+    ("phở bò có tốt cho người giảm cân không", True),
+    ("phở bò có béo không", True),                    # đánh giá, không hỏi số lượng
+    ("món này dưới 300 calo không", False),           # "món này" = món đang nói, không phải lọc
+    ("hôm nay ăn gì", False),
+])
+def test_parse_falls_back_to_rag(question, has_dish):
+    assert parse_nutrition_query(question, has_dish) is None
+
+
+# --- TRẢ LỜI ---
+def test_answer_lookup(table):
+    answer = table.answer("Phở bò bao nhiêu calo và đạm?")
+    assert answer["answer"] == "Theo FoodDB, 1 phần **Phở bò** có khoảng 450 kcal, 25 g đạm."
+    assert answer["image"] == "http://img/pho.jpg"
+    assert answer["sourceDocuments"] == ["Phở bò"]
+
+
+def test_answer_lookup_two_dishes(table):
+    answer = table.answer("phở bò và cơm hến bao nhiêu calo")
+    assert answer["sourceDocuments"] == ["Phở bò", "Cơm hến"]
+    assert "- **Cơm hến**: khoảng 350 kcal" in answer["answer"]
+
+
+def test_answer_missing_value_falls_back(table):
+    assert table.answer("bánh xèo bao nhiêu calo") is None
+
+
+def test_answer_range_list(table):
+    answer = table.answer("món từ 20 đến 30g protein")
+    assert answer["sourceDocuments"] == ["Phở bò"]
+
+
+def test_answer_sorted_list(table):
+    answer = table.answer("top 2 món ít calo nhất")
+    assert answer["sourceDocuments"] == ["Gỏi cuốn tôm thịt", "Cơm hến"]
+    assert answer["answer"].splitlines()[1].startswith("1. **Gỏi cuốn tôm thịt**")
+
+
+def test_answer_filter_and_sort(table):
+    answer = table.answer("món nào dưới 500 calo nhiều đạm nhất")
+    assert answer["sourceDocuments"] == ["Phở bò"]
+
+
+def test_answer_empty_list(table):
+    answer = table.answer("món nào trên 2000 calo")
+    assert answer["sourceDocuments"] == []
+    assert answer["answer"].startswith("Không có món nào")
+
+
+def test_answer_open_question_is_none(table):
+    assert table.answer("cách nấu cơm hến") is None
+    assert table.answer("hôm nay trời đẹp") is None
@@ -0,0 +1,96 @@
+import sys
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from api.prompt_builder import (HISTORY_ANSWER_TOKENS, MESSAGE_OVERHEAD_TOKENS, PromptBuilder, TokenCounter,
+                                question_type, trim_history)
+
+SYSTEM = "Bạn là Lucfin, chuyên gia dinh dưỡng. " * 5
+HUMAN = "Context:\n---\n{context}\n---\n\n{input}"
+
+
+@pytest.fixture
+def counter(monkeypatch):
+    # Không có tiktoken -> ước lượng chars/3 (xác định, không phụ thuộc mạng / file BPE)
+    monkeypatch.setitem(sys.modules, "tiktoken", None)
+    return TokenCounter()
+
+
+def history(turns):
+    messages = []
+    for i in range(turns):
+        messages += [HumanMessage(content=f"Câu hỏi số {i} về món ăn {'x' * 30}"),
+                     AIMessage(content=f"Trả lời số {i}: " + "rất dài " * 100)]
+    return messages
+
+
+def doc(i):
+    return SimpleNamespace(
+        page_content=f"Món ăn: Món {i}\nPhân loại: Món nước\nMô tả: {'mô tả ' * 40}\n"
+                     f"Thành phần: {'thịt, rau, ' * 10}\nCách nấu: {'nấu ' * 40}",
+        metadata={"dish_name": f"Món {i}", "calories": 400 + i, "protein": 20, "fat": 10})
+
+
+def test_chars_per_token_fallback(counter):
+    assert counter.name == "chars/3" and counter.encoding is None
+    assert counter.count("") == 0
+    assert counter.count("ab") == 1
+    assert counter.count("a" * 30) == 10
+    assert counter.truncate("a" * 30, 4) == "a" * 12 + "…"
+    assert counter.truncate("abc", 4) == "abc"
+
+
+def test_trim_history_keeps_newest_turns(counter):
+    chat = history(6)
+    kept, used = trim_history(chat, 150, counter)
+    assert kept and len(kept) < len(chat)
+    assert isinstance(kept[0], HumanMessage)                 # không mở đầu bằng câu trả lời mồ côi
+    assert [m.content for m in kept[::2]] == [m.content for m in chat[len(chat) - len(kept)::2]]
+    assert kept[-1].content.startswith("Trả lời số 5")
+    assert used == sum(counter.count(m.content) + MESSAGE_OVERHEAD_TOKENS for m in kept) <= 150
+    # Câu trả lời cũ bị cắt còn HISTORY_ANSWER_TOKENS
+    assert all(counter.count(m.content) <= HISTORY_ANSWER_TOKENS + 1 for m in kept if isinstance(m, AIMessage))
+
+
+def test_trim_history_budget_too_small(counter):
+    assert trim_history(history(2), 5, counter) == ([], 0)
+    assert trim_history([], 100, counter) == ([], 0)
+
+
+@pytest.mark.parametrize("budget", [400, 700, 1200, 3000])
+def test_build_respects_budget(counter, budget):
+    builder = PromptBuilder(SYSTEM, HUMAN, budget=budget, counter=counter)
+    question = "Phở bò bao nhiêu calo?"
+    plan = builder.build(question, question, history(8), [doc(i) for i in range(6)])
+
+    total = (builder.fixed_tokens + counter.count(question) + counter.count(plan.context)
+             + counter.count_messages(plan.chat_history))
+    assert total <= budget
+    assert plan.stats["prompt_tokens"] <= budget
+    assert plan.stats["docs_used"] >= 1
+    # Tài liệu theo thứ hạng: giữ phần đầu danh sách
+    assert plan.context.startswith("Món ăn: Món 0")
+    if plan.chat_history:
+        assert plan.chat_history[-1].content.startswith("Trả lời số 7")
+
+
+def builder_budget(counter):
+    # Đủ cho phần cố định + câu hỏi + một phần nhỏ của tài liệu đầu
+    return PromptBuilder(SYSTEM, HUMAN, counter=counter).fixed_tokens + 60
+
+
+def test_build_keeps_first_doc_even_if_too_long(counter):
+    builder = PromptBuilder(SYSTEM, HUMAN, budget=builder_budget(counter), counter=counter)
+    plan = builder.build("Cách nấu phở", "Cách nấu phở", [], [doc(0), doc(1)])
+    assert plan.stats["docs_used"] == 1 and plan.context.endswith("…")
+
+
+def test_context_fields_follow_question_type(counter):
+    builder = PromptBuilder(SYSTEM, HUMAN, budget=3000, counter=counter)
+    nutrition = builder.build("Phở bò bao nhiêu calo?", "Phở bò bao nhiêu calo?", [], [doc(0)])
+    assert question_type("Phở bò bao nhiêu calo?") == "nutrition"
+    assert "Cách nấu" not in nutrition.context and "Dinh dưỡng: 400 kcal" in nutrition.context
+    recipe = builder.build("Cách nấu phở bò", "Cách nấu phở bò", [], [doc(0)])
+    assert "Cách nấu" in recipe.context and "Mô tả" not in recipe.context
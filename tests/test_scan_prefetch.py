@@ -0,0 +1,54 @@
+import asyncio
+from types import SimpleNamespace
+
+from api.dish_index import DishNameIndex
+from api.scan_prefetch import ScanPrefetcher
+
+
+def make_resources():
+    nodes = [SimpleNamespace(metadata={"dish_name": name, "image_link": f"http://img/{i}.jpg"},
+                             get_content=lambda name=name: f"Món ăn: {name}")
+             for i, name in enumerate(["Chả cá Lã Vọng", "Sườn non nướng", "Phở bò"])]
+    return SimpleNamespace(dish_index=DishNameIndex(nodes, aliases={}))
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_cv_class_names_resolve_to_fooddb_dishes():
+    async def scenario():
+        prefetcher = ScanPrefetcher()
+        prefetcher.start("s1", ["Chả cá", "Sườn non", "Đậu hũ"], make_resources())
+        return await prefetcher.get("s1", "Chả cá, Sườn non, Đậu hũ", wait=5)
+
+    result = run(scenario())
+    assert result.sources == ["Chả cá Lã Vọng", "Sườn non nướng"]
+    assert [m.method for m in result.dishes] == ["partial", "partial"]
+    assert "Chả cá Lã Vọng" in result.context
+    assert result.image == "http://img/0.jpg"
+
+
+def test_exact_match_wins_over_partial():
+    async def scenario():
+        prefetcher = ScanPrefetcher()
+        prefetcher.start("s1", ["Phở bò"], make_resources())
+        return await prefetcher.get("s1", "Phở bò", wait=5)
+
+    assert [(m.dish_name, m.method) for m in run(scenario()).dishes] == [("Phở bò", "exact")]
+
+
+def test_rescan_cancels_and_foods_must_match():
+    async def scenario():
+        prefetcher = ScanPrefetcher()
+        resources = make_resources()
+        prefetcher.start("s1", ["Chả cá"], resources)
+        prefetcher.start("s1", ["Sườn non"], resources)
+        stale = await prefetcher.get("s1", "Chả cá", wait=5)
+        fresh = await prefetcher.get("s1", "Sườn non", wait=5)
+        return prefetcher, stale, fresh
+
+    prefetcher, stale, fresh = run(scenario())
+    assert stale is None
+    assert fresh.sources == ["Sườn non nướng"]
+    assert prefetcher.stats()["cancelled"] == 1
@@ -0,0 +1,99 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from utils.session_backends import InProcessRedis, RedisSessionStore, SQLiteSessionStore
+from utils.session_manager import SessionStore
+
+# Cùng 1 bộ hợp đồng cho cả 3 backend của SESSION_BACKEND
+BACKENDS = ("memory", "sqlite", "redis")
+
+
+def make_store(backend, tmp_path, **kwargs):
+    if backend == "memory":
+        return SessionStore(**kwargs)
+    if backend == "sqlite":
+        return SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"), **kwargs)
+    kwargs.pop("max_entries", None)  # Redis: giới hạn bằng maxmemory-policy, không đếm session
+    return RedisSessionStore("memory://", client=InProcessRedis(), **kwargs)
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    return request.param
+
+
+def test_history_append_and_trim(backend, tmp_path, clock):
+    store = make_store(backend, tmp_path, history_limit=4)
+    assert store.get_history("s") == []
+    for i in range(3):
+        store.append_history("s", f"q{i}", f"a{i}")
+    history = store.get_history("s")
+    # Chỉ giữ 4 message cuối = 2 lượt mới nhất, đúng thứ tự hỏi / đáp
+    assert [type(m) for m in history] == [HumanMessage, AIMessage, HumanMessage, AIMessage]
+    assert [m.content for m in history] == ["q1", "a1", "q2", "a2"]
+    assert store.get_history("other") == []
+
+
+def test_scan_and_focus_round_trip(backend, tmp_path, clock):
+    store = make_store(backend, tmp_path, scan_ttl=60)
+    assert store.get_focus("s") == "RAG"
+    assert store.get_scanned_context("s") is None
+
+    store.update_scan_result("s", ["Chả cá", "Đậu hũ"])
+    assert store.get_scanned_context("s") == "Chả cá, Đậu hũ"
+    assert store.get_focus("s") == "SCAN"  # Scan luôn chuyển tiêu điểm về SCAN
+
+    store.set_focus("s", "RAG")
+    assert store.get_focus("s") == "RAG"
+    assert store.get_scanned_context("s") == "Chả cá, Đậu hũ"
+
+    clock.advance(61)
+    assert store.get_scanned_context("s") is None
+
+
+def test_session_ttl_expiry(backend, tmp_path, clock):
+    store = make_store(backend, tmp_path, ttl_seconds=100)
+    store.append_history("s", "q", "a")
+    store.set_focus("s", "SCAN")
+    clock.advance(101)
+    assert store.get_history("s") == []
+    assert store.get_focus("s") == "RAG"
+
+
+def test_read_keeps_session_alive(backend, tmp_path, clock):
+    store = make_store(backend, tmp_path, ttl_seconds=100)
+    store.append_history("s", "q", "a")
+    for _ in range(3):
+        clock.advance(60)
+        assert len(store.get_history("s")) == 2  # Mỗi lần đọc gia hạn TTL
+    clock.advance(101)
+    assert store.get_history("s") == []
+
+
+@pytest.mark.parametrize("backend", ("memory", "sqlite"))
+def test_lru_eviction(backend, tmp_path, clock):
+    store = make_store(backend, tmp_path, max_entries=2)
+    for session_id in ("a", "b"):
+        store.append_history(session_id, "q", session_id)
+        clock.advance(1)
+    store.get_history("a")  # "a" vừa dùng -> "b" là session ít dùng nhất
+    clock.advance(1)
+    store.append_history("c", "q", "c")
+    store.sweep()  # SQLite cắt theo max_entries lúc quét; bộ nhớ trong cắt ngay khi thêm
+    assert len(store) == 2
+    assert store.get_history("b") == []
+    assert [m.content for m in store.get_history("a")] == ["q", "a"]
+    assert [m.content for m in store.get_history("c")] == ["q", "c"]
+
+
+def test_sqlite_shared_between_instances(tmp_path, clock):
+    # 2 worker = 2 kết nối tới cùng 1 file
+    path = str(tmp_path / "shared.sqlite3")
+    worker_a, worker_b = SQLiteSessionStore(path), SQLiteSessionStore(path)
+    worker_a.append_history("s", "q1", "a1")
+    worker_b.append_history("s", "q2", "a2")
+    worker_b.update_scan_result("s", ["Sườn non"])
+    assert [m.content for m in worker_a.get_history("s")] == ["q1", "a1", "q2", "a2"]
+    assert worker_a.get_scanned_context("s") == "Sườn non"
+    assert worker_a.get_focus("s") == "SCAN"
+    assert len(worker_a) == len(worker_b) == 1
@@ -0,0 +1,95 @@
+import math
+from collections import Counter
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from config.sparse_index import SparseIndex, reciprocal_rank_fusion, tokenize
+
+TEXTS = {
+    "com-hen": "Món ăn: Cơm hến\nThành phần: hến, cơm nguội, mắm ruốc",
+    "bun-bo": "Món ăn: Bún bò Huế\nThành phần: bún, bò, mắm ruốc, sả",
+    "pho-bo": "Món ăn: Phở bò\nThành phần: bánh phở, thịt bò, hành",
+    "che": "Món ăn: Chè đậu xanh\nThành phần: đậu xanh, đường",
+}
+
+
+def make_node(node_id):
+    return SimpleNamespace(node_id=node_id, get_text=lambda: TEXTS[node_id])
+
+
+@pytest.fixture(scope="module")
+def nodes():
+    return [make_node(node_id) for node_id in TEXTS]
+
+
+@pytest.fixture(scope="module")
+def index(nodes):
+    return SparseIndex.from_nodes(nodes)
+
+
+def ids(results):
+    return [node.node_id for node, _ in results]
+
+
+def test_tokenize_folds_accents_and_adds_bigrams():
+    assert tokenize("Mắm ruốc") == ["mam", "ruoc", "mam_ruoc"]
+    assert tokenize("") == []
+
+
+def test_scores_match_bm25_formula(index):
+    # Tính lại BM25 (IDF Lucene) trực tiếp từ định nghĩa
+    k1, b = index.k1, index.b
+    docs = [Counter(tokenize(text)) for text in TEXTS.values()]
+    avgdl = sum(sum(d.values()) for d in docs) / len(docs)
+    query = "mắm ruốc bò"
+    expected = []
+    for tf in docs:
+        score, length = 0.0, sum(tf.values())
+        for term in set(tokenize(query)):
+            df = sum(term in d for d in docs)
+            if tf[term]:
+                idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+                score += idf * tf[term] * (k1 + 1) / (tf[term] + k1 * (1 - b + b * length / avgdl))
+        expected.append(score)
+    np.testing.assert_allclose(index.scores(query), expected, rtol=1e-5)
+
+
+def test_search_ranking(index):
+    # Cụm "mắm ruốc" + "bò" -> Bún bò Huế đứng đầu; chỉ trả văn bản có term khớp
+    results = index.search("mam ruoc bo", top_k=10)
+    assert ids(results)[0] == "bun-bo"
+    assert set(ids(results)) == {"bun-bo", "com-hen", "pho-bo"}
+    assert [s for _, s in results] == sorted((s for _, s in results), reverse=True)
+    assert ids(index.search("hến", top_k=1)) == ["com-hen"]
+
+
+def test_search_without_match(index):
+    assert index.search("pizza", top_k=5) == []
+    assert index.search("bò", top_k=0) == []
+
+
+def test_save_load_bind(index, nodes, tmp_path):
+    index.save(str(tmp_path))
+    loaded = SparseIndex.load(str(tmp_path)).bind(nodes)
+    np.testing.assert_allclose(loaded.scores("bún bò"), index.scores("bún bò"))
+    # Node không còn trong dense index -> bị bỏ khi tìm
+    partial = SparseIndex.load(str(tmp_path)).bind([n for n in nodes if n.node_id != "bun-bo"])
+    assert "bun-bo" not in ids(partial.search("mắm ruốc", top_k=10))
+    assert ids(partial.search("mắm ruốc", top_k=10)) == ["com-hen"]
+
+
+def test_rrf_order():
+    a, b, c, d = (SimpleNamespace(node_id=x) for x in "abcd")
+    fused = reciprocal_rank_fusion([[a, b, c], [c, a, d]], k=60)
+    # a: 1/61 + 1/62, c: 1/63 + 1/61, b: 1/62, d: 1/63
+    assert [node.node_id for node, _ in fused] == ["a", "c", "b", "d"]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+
+
+def test_rrf_agreement_beats_single_top_rank():
+    a, b, c = (SimpleNamespace(node_id=x) for x in "abc")
+    # b đứng thứ 2 ở cả 2 danh sách > a / c chỉ đứng đầu 1 danh sách
+    fused = reciprocal_rank_fusion([[a, b], [c, b]], k=60)
+    assert fused[0][0] is b
@@ -0,0 +1,52 @@
+import pytest
+
+from utils.utils import ThinkTagFilter, remove_think_tags
+
+
+def stream(chunks):
+    think_filter = ThinkTagFilter()
+    parts = [think_filter.feed(chunk) for chunk in chunks]
+    parts.append(think_filter.flush())
+    return "".join(parts)
+
+
+def split_every(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+CASES = [
+    "Phở bò khoảng 450 kcal.",
+    "<think>người dùng hỏi calo</think>\n\nPhở bò khoảng 450 kcal.",
+    "Trả lời: <think>nháp</think>Cơm hến <think>nháp 2</think>ít béo.",
+    "<think>suy luận bị cắt giữa chừng, không có thẻ đóng",
+    "Cơm tấm 600 kcal. <think>model bị cắt",
+    "So sánh: 3 < 5 và 5 > 3 </think> không có thẻ mở",
+    "Kết thúc bằng nửa thẻ <thi",
+]
+
+
+@pytest.mark.parametrize("text", CASES)
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_stream_matches_done_answer(text, size):
+    # Thẻ bị cắt ở mọi vị trí giữa 2 chunk -> text hiển thị khi stream == câu trả lời cuối (sự kiện done)
+    assert stream(split_every(text, size)) == remove_think_tags(text)
+
+
+def test_tags_split_across_chunks():
+    chunks = ["<thi", "nk>bí mật</th", "ink>", "Phở ", "bò"]
+    assert stream(chunks) == "Phở bò"
+
+
+def test_unterminated_think_is_dropped():
+    think_filter = ThinkTagFilter()
+    assert think_filter.feed("<think>đang nghĩ") == ""
+    assert think_filter.feed(" tiếp...") == ""
+    assert think_filter.flush() == ""
+    assert remove_think_tags("<think>đang nghĩ tiếp...") == ""
+
+
+def test_visible_text_is_not_held_back():
+    think_filter = ThinkTagFilter()
+    # Chỉ giữ lại phần đuôi có thể là đầu của "<think>"
+    assert think_filter.feed("Phở bò <") == "Phở bò "
+    assert think_filter.feed("300 kcal") == "<300 kcal"
@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+# ==============================================================================
+# CACHE CÂU TRẢ LỜI THEO NGỮ NGHĨA (SEMANTIC ANSWER CACHE)
+# ==============================================================================
+# Khóa = embedding câu hỏi độc lập (standalone). Câu hỏi diễn đạt khác nhưng cosine >= ngưỡng
+# -> trả lại ChatMessageResponse đã lưu, 0 token LLM. Đổi phiên bản FoodDB -> xóa toàn bộ.
+
+
+class SemanticAnswerCache:
+    def __init__(self, max_entries: int = 2000, threshold: float = 0.95, ttl_seconds: float = 24 * 3600):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.index_version = None
+        self._matrix = None                      # [max_entries, dim] float32, hàng đã chuẩn hóa L2
+        self._valid = np.zeros(max_entries, dtype=bool)
+        self._scope = np.empty(max_entries, dtype=object)
+        self._created = np.zeros(max_entries, dtype=np.float64)
+        self._payload = [None] * max_entries
+        self._lru = OrderedDict()                # slot -> None, cũ nhất ở đầu
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.invalidations = 0
+
+    def _check_version(self, index_version):
+        if index_version != self.index_version:
+            if self._lru:
+                self.invalidations += 1
+            self._valid[:] = False
+            self._payload = [None] * self.max_entries
+            self._lru.clear()
+            self.index_version = index_version
+
+    @staticmethod
+    def _normalize(embedding):
+        vec = np.asarray(embedding, dtype=np.float32)
+        return vec / (np.linalg.norm(vec) or 1.0)
+
+    def lookup(self, embedding, scope: str, index_version) -> Optional[dict]:
+        """Trả payload (dict) nếu có câu hỏi cùng scope đủ giống, ngược lại None."""
+        with self._lock:
+            self._check_version(index_version)
+            if self._matrix is None or not self._lru:
+                self.misses += 1
+                return None
+            query = self._normalize(embedding)
+            mask = self._valid & (self._scope == scope) & (time.time() - self._created <= self.ttl_seconds)
+            slots = np.flatnonzero(mask)
+            if slots.size == 0:
+                self.misses += 1
+                return None
+            scores = self._matrix[slots] @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            slot = int(slots[best])
+            self._lru.move_to_end(slot)
+            self.hits += 1
+            return dict(self._payload[slot])
+
+    def store(self, embedding, scope: str, index_version, payload: dict):
+        with self._lock:
+            self._check_version(index_version)
+            query = self._normalize(embedding)
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, query.shape[0]), dtype=np.float32)
+            if len(self._lru) < self.max_entries:
+                slot = int(np.flatnonzero(~self._valid)[0])
+            else:
+                slot, _ = self._lru.popitem(last=False)  # Đuổi mục ít dùng nhất
+            self._matrix[slot] = query
+            self._valid[slot] = True
+            self._scope[slot] = scope
+            self._created[slot] = time.time()
+            self._payload[slot] = dict(payload)
+            self._lru[slot] = None
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._lru), "max_entries": self.max_entries, "threshold": self.threshold,
+            "hits": self.hits, "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "invalidations": self.invalidations, "index_version": self.index_version,
+        }
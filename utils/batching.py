@@ -0,0 +1,133 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional
+
+from utils.observability import BATCH_SIZE, get_logger
+
+logger = get_logger("batching")
+
+# ==============================================================================
+# MICRO-BATCHING ĐỘNG (GOM REQUEST ĐỒNG THỜI -> 1 FORWARD PASS)
+# ==============================================================================
+# Mỗi /ask chỉ nhúng 1 câu hỏi / rerank ~10 cặp -> forward pass riêng lẻ dùng rất ít sức tính ma trận.
+# MicroBatcher gom các lời gọi tới trong tối đa `max_wait_ms` hoặc đủ `max_batch_size` phần tử, chạy
+# batch_fn 1 lần trên 1 thread worker riêng rồi trả kết quả về đúng người gọi:
+#   - thread (retriever trong run_blocking): batcher(items)        -> chờ Future
+#   - coroutine                            : await batcher.acall() -> không chặn event loop
+# Khi model đang bận, request mới tự xếp hàng và đi chung batch kế tiếp (kể cả max_wait_ms=0).
+# Retriever chạy trong run_blocking -> số câu hỏi gom được tối đa = BLOCKING_POOL_SIZE (thread chủ yếu chờ
+# Future nên có thể nâng pool khi tải cao).
+# Số liệu throughput / p95: evaluation/benchmark_batching.py
+
+
+class _Pending:
+    __slots__ = ("items", "future")
+
+    def __init__(self, items: list):
+        self.items = items
+        self.future = Future()
+
+
+class MicroBatcher:
+    """
+    batch_fn(list_phần_tử) -> list kết quả cùng độ dài. Phần tử của 1 lời gọi luôn nằm chung 1 batch
+    (lời gọi lớn hơn max_batch_size chạy riêng), nên 1 request rerank không bị cắt đôi.
+    """
+
+    def __init__(self, batch_fn: Callable[[list], list], max_batch_size: int = 16,
+                 max_wait_ms: float = 2.0, name: str = "batch"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.name = name
+        self._queue: "queue.SimpleQueue[_Pending]" = queue.SimpleQueue()
+        self._worker: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._batch_size = BATCH_SIZE.labels(name)
+        self.batches = self.items = self.calls = 0
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._start_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name=f"lucfin-{self.name}", daemon=True)
+                    self._worker.start()
+
+    def submit(self, items: list) -> Future:
+        pending = _Pending(list(items))
+        if not pending.items:
+            pending.future.set_result([])
+            return pending.future
+        self._ensure_worker()
+        self._queue.put(pending)
+        return pending.future
+
+    def __call__(self, items: list) -> list:
+        return self.submit(items).result()
+
+    async def acall(self, items: list) -> list:
+        return await asyncio.wrap_future(self.submit(items))
+
+    # --- WORKER ---
+    def _collect(self, first: _Pending):
+        """Gom batch bắt đầu từ `first`; trả (batch, lời gọi dư chuyển sang batch sau)."""
+        batch, size = [first], len(first.items)
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch_size:
+            try:
+                # Lấy ngay những gì đã xếp hàng, chỉ chờ thêm trong phần còn lại của max_wait
+                pending = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    pending = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if size + len(pending.items) > self.max_batch_size:
+                return batch, pending
+            batch.append(pending)
+            size += len(pending.items)
+        return batch, None
+
+    def _run(self):
+        carry = None
+        while True:
+            first = carry if carry is not None else self._queue.get()
+            batch, carry = self._collect(first)
+            # Bỏ lời gọi đã bị hủy (vd. request bị ngắt) trước khi tốn forward pass
+            batch = [p for p in batch if p.future.set_running_or_notify_cancel()]
+            if batch:
+                self._execute(batch)
+
+    def _execute(self, batch: List[_Pending]):
+        flat: List[Any] = [item for pending in batch for item in pending.items]
+        try:
+            results = self.batch_fn(flat)
+            if len(results) != len(flat):
+                raise RuntimeError(f"{self.name}: batch_fn trả {len(results)} kết quả cho {len(flat)} phần tử")
+        except Exception as e:
+            logger.warning("micro-batch lỗi", extra={"batcher": self.name, "items": len(flat), "error": str(e)})
+            for pending in batch:
+                pending.future.set_exception(e)
+            return
+        self.batches += 1
+        self.items += len(flat)
+        self.calls += len(batch)
+        self._batch_size.observe(len(flat))
+        start = 0
+        for pending in batch:
+            end = start + len(pending.items)
+            pending.future.set_result(list(results[start:end]))
+            start = end
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches, "calls": self.calls, "items": self.items,
+            "avg_batch_items": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size, "max_wait_ms": self.max_wait * 1000,
+        }
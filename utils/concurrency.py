@@ -0,0 +1,28 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# Thread pool giới hạn cho các tác vụ BLOCKING (LlamaIndex retriever, embedding CPU...)
+# Không dùng pool mặc định của asyncio để tránh tranh chấp CPU không kiểm soát.
+_blocking_executor = None
+
+def get_blocking_executor():
+    """Trả về ThreadPoolExecutor dùng chung (singleton), số worker lấy từ BLOCKING_POOL_SIZE."""
+    global _blocking_executor
+    if _blocking_executor is None:
+        max_workers = int(os.getenv("BLOCKING_POOL_SIZE", "4"))
+        _blocking_executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="lucfin-blocking"
+        )
+    return _blocking_executor
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Chạy hàm đồng bộ trong thread pool để không chặn event loop của uvicorn.
+    Copy contextvars sang thread (run_in_executor không tự làm) -> request_id / span vẫn gắn đúng request.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_blocking_executor(), partial(context.run, func, *args, **kwargs))
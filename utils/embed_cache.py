@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+from utils.observability import get_logger
+
+logger = get_logger("embed_cache")
+
+# ==============================================================================
+# CACHE EMBEDDING CÂU HỎI (LRU + TTL, lưu ra file để sống qua restart)
+# ==============================================================================
+# Traffic lặp lại rất nhiều ("Phở bao nhiêu calo?") -> không cần nhúng lại trên CPU mỗi lần.
+# Không import llama_index ở đây (bọc model: config.embed.CachedQueryEmbedding) -> import app nhẹ.
+
+
+def normalize_query(text: str) -> str:
+    """Khóa cache: NFC, chữ thường, gộp khoảng trắng, bỏ dấu câu cuối. GIỮ dấu tiếng Việt (bò ≠ bọ)."""
+    text = unicodedata.normalize("NFC", str(text)).lower()
+    return " ".join(text.split()).rstrip(" ?!.,;:")
+
+
+class EmbeddingCache:
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 7 * 24 * 3600,
+                 persist_path: Optional[str] = None, model_name: str = ""):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self.model_name = model_name
+        self._data = OrderedDict()  # key -> (timestamp, np.ndarray float32)
+        self._lock = threading.Lock()  # retriever chạy trong thread pool
+        self.hits = self.misses = self.evictions = self.expired = 0
+
+    def get(self, text: str) -> Optional[List[float]]:
+        key = normalize_query(text)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if time.time() - entry[0] > self.ttl_seconds:
+                del self._data[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1].tolist()
+
+    def put(self, text: str, embedding: List[float], timestamp: Optional[float] = None):
+        key = normalize_query(text)
+        with self._lock:
+            self._data[key] = (timestamp or time.time(), np.asarray(embedding, dtype=np.float32))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data), "max_entries": self.max_entries,
+            "hits": self.hits, "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions, "expired": self.expired,
+        }
+
+    # --- Lưu / nạp file .npz (keys + timestamps + ma trận float32) ---
+    def save(self):
+        if not self.persist_path:
+            return
+        with self._lock:
+            items = list(self._data.items())
+        if not items:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.persist_path)), exist_ok=True)
+        tmp_path = self.persist_path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            model_name=np.array(self.model_name),
+            keys=np.array([k for k, _ in items]),
+            timestamps=np.array([v[0] for _, v in items], dtype=np.float64),
+            embeddings=np.stack([v[1] for _, v in items]),
+        )
+        os.replace(tmp_path, self.persist_path)
+        logger.info("query embedding cache saved", extra={"entries": len(items), "path": self.persist_path})
+
+    def load(self):
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            data = np.load(self.persist_path)
+            if str(data["model_name"]) != self.model_name:
+                logger.warning("cache embedding thuộc model khác -> bỏ qua", extra={"path": self.persist_path})
+                return
+            now = time.time()
+            for key, ts, emb in zip(data["keys"], data["timestamps"], data["embeddings"]):
+                if now - ts <= self.ttl_seconds:
+                    self.put(str(key), emb, timestamp=float(ts))
+            logger.info("query embedding cache loaded", extra={"entries": len(self._data), "path": self.persist_path})
+        except Exception as e:
+            logger.warning("không đọc được cache embedding", extra={"error": str(e)})
+
+
+_query_cache = None
+
+def get_query_cache(model_name: str = "") -> EmbeddingCache:
+    """Singleton cache (cấu hình qua EMBED_CACHE_SIZE / EMBED_CACHE_TTL / EMBED_CACHE_PATH)."""
+    global _query_cache
+    if _query_cache is None:
+        _query_cache = EmbeddingCache(
+            max_entries=int(os.getenv("EMBED_CACHE_SIZE", "10000")),
+            ttl_seconds=float(os.getenv("EMBED_CACHE_TTL", str(7 * 24 * 3600))),
+            persist_path=os.getenv("EMBED_CACHE_PATH", "./cache/query_embeddings.npz") or None,
+            model_name=model_name,
+        )
+        _query_cache.load()
+    return _query_cache
+
+def save_query_cache():
+    if _query_cache is not None:
+        _query_cache.save()
+
+def query_cache_stats() -> dict:
+    return _query_cache.stats() if _query_cache is not None else {}
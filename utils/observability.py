@@ -0,0 +1,245 @@
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+# =========================================================
+# 👇 OBSERVABILITY: REQUEST ID + SPAN TỪNG BƯỚC + METRICS + LOG CÓ CẤU TRÚC
+# =========================================================
+# - RequestContextMiddleware gán request_id (header X-Request-ID hoặc tự sinh) vào ContextVar
+#   -> log / span / callback LangChain / thread pool (run_blocking copy context) đều thấy cùng id
+# - span("retrieve"): đo 1 bước, ghi vào Histogram + thời gian của request hiện tại
+# - /metrics (main.py) xuất Prometheus text format
+# Chi phí mỗi span ~3µs, mỗi dòng log JSON ~25µs (evaluation/benchmark_observability.py), rất nhỏ so với
+# 1 lần gọi LLM (100ms+) -> bật cả ở production.
+
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")    # json / text
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+# 1ms -> 30s: bao cả tra bảng (µs-ms) lẫn sinh câu trả lời của LLM (giây)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUEST_COUNT = Counter("lucfin_http_requests_total", "Số request HTTP", ["endpoint", "route", "status"])
+REQUEST_LATENCY = Histogram("lucfin_http_request_duration_seconds", "Thời gian xử lý request HTTP",
+                            ["endpoint", "route"], buckets=LATENCY_BUCKETS)
+STAGE_LATENCY = Histogram("lucfin_stage_duration_seconds", "Thời gian từng bước của pipeline /ask",
+                          ["stage"], buckets=LATENCY_BUCKETS)
+LLM_LATENCY = Histogram("lucfin_llm_call_duration_seconds", "Thời gian 1 lần gọi LLM",
+                        ["model"], buckets=LATENCY_BUCKETS)
+LLM_TOKENS = Counter("lucfin_llm_tokens_total", "Token LLM đã dùng", ["model", "kind"])
+LLM_ERRORS = Counter("lucfin_llm_errors_total", "Số lần gọi LLM lỗi", ["model"])
+# Lỗi được nuốt để trả giá trị mặc định (vd. phân loại ý định bằng LLM lỗi -> FOLLOWUP)
+FALLBACKS = Counter("lucfin_fallbacks_total", "Số lần lỗi -> dùng giá trị mặc định", ["stage"])
+# Số phần tử mỗi forward pass của micro-batcher (utils/batching.py): embedding câu hỏi / cặp rerank
+BATCH_SIZE = Histogram("lucfin_batch_items", "Số phần tử mỗi micro-batch", ["batcher"],
+                       buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+
+
+class RequestTrace:
+    """Trạng thái quan sát của 1 request (nằm trong ContextVar)."""
+    __slots__ = ("request_id", "route", "timings")
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.route = ""
+        self.timings: Dict[str, float] = {}
+
+
+_TRACE: ContextVar[Optional[RequestTrace]] = ContextVar("lucfin_trace", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _TRACE.get()
+
+
+def get_request_id() -> str:
+    trace = _TRACE.get()
+    return trace.request_id if trace is not None else "-"
+
+
+def set_route(route: str):
+    """Luồng xử lý (SCAN / RAG / CHITCHAT / TABLE / CACHE) -> nhãn của metrics request."""
+    trace = _TRACE.get()
+    if trace is not None:
+        trace.route = route
+
+
+# Histogram con theo stage được tạo 1 lần (labels() tốn vài µs mỗi lần gọi)
+_stage_children: Dict[str, Any] = {}
+
+
+def record_stage(stage: str, ms: float):
+    child = _stage_children.get(stage)
+    if child is None:
+        child = _stage_children[stage] = STAGE_LATENCY.labels(stage)
+    child.observe(ms / 1000)
+    trace = _TRACE.get()
+    if trace is not None:
+        trace.timings[stage] = trace.timings.get(stage, 0.0) + ms
+
+
+class span:
+    """with span("retrieve") as s: ...  -> s.ms = thời gian (ms), đã ghi vào metrics + trace."""
+    __slots__ = ("stage", "started", "ms")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.ms = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.ms = (time.perf_counter() - self.started) * 1000
+        record_stage(self.stage, self.ms)
+        return False
+
+
+# =========================================================
+# 👇 LOG CÓ CẤU TRÚC
+# =========================================================
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def _fields(record) -> dict:
+    return {k: v for k, v in record.__dict__.items() if k not in _RESERVED}
+
+
+class JsonFormatter(logging.Formatter):
+    """1 dòng JSON / log: ts, level, logger, request_id, msg + các field truyền qua extra={...}."""
+
+    def format(self, record):
+        data = {
+            "ts": round(record.created, 3), "level": record.levelname, "logger": record.name,
+            "request_id": get_request_id(), "msg": record.getMessage(), **_fields(record),
+        }
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Dạng dễ đọc khi chạy local (LOG_FORMAT=text)."""
+
+    def format(self, record):
+        fields = " ".join(f"{k}={v}" for k, v in _fields(record).items())
+        line = (f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} [{get_request_id()}] "
+                f"{record.getMessage()} {fields}").rstrip()
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+_logging_ready = False
+
+
+def setup_logging():
+    """Gắn handler cho logger gốc "lucfin" (gọi nhiều lần vẫn chỉ gắn 1 handler)."""
+    global _logging_ready
+    if _logging_ready:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+    root = logging.getLogger("lucfin")
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL.upper())
+    root.propagate = False
+    _logging_ready = True
+
+
+def get_logger(name: str) -> logging.Logger:
+    setup_logging()
+    return logging.getLogger(f"lucfin.{name}")
+
+
+# =========================================================
+# 👇 ASGI MIDDLEWARE + CALLBACK LANGCHAIN
+# =========================================================
+class RequestContextMiddleware:
+    """ASGI thuần (không qua BaseHTTPMiddleware): gán request_id, đo tổng thời gian, đếm theo endpoint/route/status."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request_id = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"x-request-id"), None)
+        trace = RequestTrace(request_id[:64] if request_id else uuid.uuid4().hex[:16])
+        token = _TRACE.set(trace)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", trace.request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            elapsed = time.perf_counter() - started
+            # Path mẫu của route (không dùng path thô -> tránh bùng nổ số nhãn)
+            route_obj = scope.get("route")
+            endpoint = getattr(route_obj, "path", None) or ("unmatched" if status == 404 else scope["path"])
+            REQUEST_LATENCY.labels(endpoint, trace.route).observe(elapsed)
+            REQUEST_COUNT.labels(endpoint, trace.route, str(status)).inc()
+            _TRACE.reset(token)
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """Callback LangChain: thời gian + token mỗi lần gọi LLM, gắn request_id lấy từ metadata của run."""
+
+    def __init__(self):
+        self._started: Dict[Any, tuple] = {}
+        self.logger = get_logger("llm")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        model = (metadata or {}).get("ls_model_name") or (serialized or {}).get("name") or "llm"
+        self._started[run_id] = (time.perf_counter(), model, (metadata or {}).get("request_id"))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self.on_chat_model_start(serialized, prompts, run_id=run_id, metadata=metadata)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        t0, model, request_id = started
+        elapsed = time.perf_counter() - t0
+        LLM_LATENCY.labels(model).observe(elapsed)
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if usage.get(kind):
+                LLM_TOKENS.labels(model, kind.split("_")[0]).inc(usage[kind])
+        self.logger.debug("llm call", extra={"model": model, "llm_ms": round(elapsed * 1000, 1),
+                                             "llm_request_id": request_id, **usage})
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        LLM_ERRORS.labels(started[1] if started else "llm").inc()
+
+
+LLM_METRICS_HANDLER = LLMMetricsHandler()
+
+
+def langchain_config(run_name: str) -> dict:
+    """config cho ainvoke / astream: request_id đi theo metadata tới mọi run con + callback đo LLM."""
+    return {"run_name": run_name, "metadata": {"request_id": get_request_id()},
+            "callbacks": [LLM_METRICS_HANDLER]}
+
+
+def metrics_payload():
+    """(body, content_type) cho endpoint /metrics."""
+    return generate_latest(), CONTENT_TYPE_LATEST
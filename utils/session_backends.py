@@ -0,0 +1,352 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from utils.concurrency import run_blocking
+from utils.observability import get_logger
+
+logger = get_logger("sessions")
+
+# ==============================================================================
+# BACKEND SESSION DÙNG CHUNG GIỮA NHIỀU WORKER (SQLite / Redis)
+# ==============================================================================
+# Cùng bộ hàm với SessionStore (bộ nhớ trong) ở utils/session_manager.py:
+#   get_history / append_history / update_scan_result / get_scanned_context /
+#   set_focus / get_focus / sweep / stats
+# -> uvicorn --workers N hoặc nhiều máy sau load balancer thấy chung 1 trạng thái.
+
+
+def to_messages(history):
+    """[(is_user, text), ...] -> [HumanMessage / AIMessage, ...]"""
+    return [HumanMessage(content=text) if is_user else AIMessage(content=text) for is_user, text in history]
+
+
+# ------------------------------------------------------------------------------
+# SQLite: 1 file dùng chung cho mọi worker trên cùng máy (WAL + BEGIN IMMEDIATE)
+# ------------------------------------------------------------------------------
+class SQLiteSessionStore:
+    def __init__(self, path="./cache/sessions.sqlite3", max_entries=10000, ttl_seconds=3600,
+                 scan_ttl=600, history_limit=6):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.scan_ttl = scan_ttl
+        self.history_limit = history_limit
+        self.sweeps = 0
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # isolation_level=None: tự quản lý transaction; timeout chờ khóa của worker khác
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " session_id TEXT PRIMARY KEY, history TEXT NOT NULL DEFAULT '[]',"
+                " scan_foods TEXT, scan_time REAL NOT NULL DEFAULT 0,"
+                " focus TEXT NOT NULL DEFAULT 'RAG', last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_access ON sessions(last_access)")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def _read(self, session_id, columns):
+        """Đọc 1 session còn hạn (đồng thời cập nhật last_access). Hết hạn / chưa có -> None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {columns} FROM sessions WHERE session_id = ? AND last_access >= ?",
+                (session_id, now - self.ttl_seconds),
+            ).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?", (now, session_id))
+        return row
+
+    def _write(self, session_id, update):
+        """
+        Đọc-sửa-ghi trong BEGIN IMMEDIATE: khóa ghi của SQLite chặn worker khác
+        -> append + trim lịch sử là nguyên tử, không mất lượt chat khi 2 request chạy song song.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT history, scan_foods, scan_time, focus, last_access FROM sessions WHERE session_id = ?",
+                    (session_id,),
+                ).fetchone()
+                if row is None or row[4] < now - self.ttl_seconds:
+                    row = ("[]", None, 0.0, "RAG", now)
+                values = update(list(row[:4]))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sessions (session_id, history, scan_foods, scan_time, focus, last_access)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (session_id, *values, now),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # --- Lịch sử chat ---
+    def get_history(self, session_id):
+        row = self._read(session_id, "history")
+        return to_messages(json.loads(row[0])) if row else []
+
+    def append_history(self, session_id, question, answer):
+        def update(values):
+            history = json.loads(values[0]) + [[True, question], [False, answer]]
+            values[0] = json.dumps(history[-self.history_limit:], ensure_ascii=False)
+            return values
+        self._write(session_id, update)
+
+    # --- Dữ liệu Scan ---
+    def update_scan_result(self, session_id, food_names):
+        def update(values):
+            return [values[0], json.dumps(list(food_names), ensure_ascii=False), time.time(), "SCAN"]
+        self._write(session_id, update)
+
+    def get_scanned_context(self, session_id):
+        row = self._read(session_id, "scan_foods, scan_time")
+        if not row or not row[0] or time.time() - row[1] >= self.scan_ttl:
+            return None
+        return ", ".join(json.loads(row[0]))
+
+    # --- Tiêu điểm ---
+    def set_focus(self, session_id, mode):
+        def update(values):
+            values[3] = mode
+            return values
+        self._write(session_id, update)
+
+    def get_focus(self, session_id):
+        row = self._read(session_id, "focus")
+        return row[0] if row else "RAG"
+
+    # --- Dọn dẹp + số liệu ---
+    def sweep(self):
+        """Xóa session hết TTL, rồi cắt bớt session cũ nhất nếu vượt max_entries."""
+        now = time.time()
+        with self._lock:
+            removed = self._conn.execute(
+                "DELETE FROM sessions WHERE last_access < ?", (now - self.ttl_seconds,)
+            ).rowcount
+            removed += self._conn.execute(
+                "DELETE FROM sessions WHERE session_id IN (SELECT session_id FROM sessions"
+                " ORDER BY last_access DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+            ).rowcount
+            self._conn.execute("UPDATE sessions SET scan_foods = NULL WHERE scan_foods IS NOT NULL AND scan_time < ?",
+                               (now - self.scan_ttl,))
+        self.sweeps += 1
+        return removed
+
+    async def run_sweeper(self, interval=60):
+        while True:
+            await asyncio.sleep(interval)
+            removed = await run_blocking(self.sweep)
+            if removed:
+                logger.info("session sweeper", extra={"backend": "sqlite", "removed": removed})
+
+    def stats(self):
+        size = os.path.getsize(self.path) if self.path != ":memory:" and os.path.exists(self.path) else 0
+        return {
+            "backend": "sqlite", "sessions": len(self), "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds, "sweeps": self.sweeps, "file_bytes": size,
+        }
+
+
+# ------------------------------------------------------------------------------
+# Redis: dùng chung giữa nhiều máy; TTL do Redis tự lo (EXPIRE), không cần sweeper
+# ------------------------------------------------------------------------------
+class InProcessRedis:
+    """
+    Bản thay thế Redis chạy trong tiến trình (REDIS_URL=memory://) để thử nghiệm không cần server.
+    Chỉ hỗ trợ đúng các lệnh RedisSessionStore dùng; pipeline chạy nguyên tử dưới 1 khóa.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        self._lock = threading.RLock()
+
+    def _alive(self, key):
+        deadline = self._expires.get(key)
+        if deadline is not None and time.time() >= deadline:
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._data
+
+    def rpush(self, key, *values):
+        with self._lock:
+            if not self._alive(key):
+                self._data[key] = []
+            items = self._data[key]
+            items.extend(values)
+            return len(items)
+
+    def ltrim(self, key, start, end):
+        with self._lock:
+            if self._alive(key):
+                self._data[key] = self._data[key][start:None if end == -1 else end + 1]
+            return True
+
+    def lrange(self, key, start, end):
+        with self._lock:
+            if not self._alive(key):
+                return []
+            return list(self._data[key][start:None if end == -1 else end + 1])
+
+    def hset(self, key, mapping):
+        with self._lock:
+            if not self._alive(key):
+                self._data[key] = {}
+            self._data[key].update({k: str(v) for k, v in mapping.items()})
+            return len(mapping)
+
+    def hgetall(self, key):
+        with self._lock:
+            return dict(self._data[key]) if self._alive(key) else {}
+
+    def hdel(self, key, *fields):
+        with self._lock:
+            if self._alive(key):
+                for field in fields:
+                    self._data[key].pop(field, None)
+            return True
+
+    def expire(self, key, seconds):
+        with self._lock:
+            if self._alive(key):
+                self._expires[key] = time.time() + seconds
+            return True
+
+    def dbsize(self):
+        with self._lock:
+            return sum(1 for key in list(self._data) if self._alive(key))
+
+    def pipeline(self, transaction=True):
+        return _InProcessPipeline(self)
+
+
+class _InProcessPipeline:
+    def __init__(self, client):
+        self._client = client
+        self._calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._calls.append((name, args, kwargs))
+            return self
+        return queue
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._calls = []
+
+    def execute(self):
+        with self._client._lock:
+            results = [getattr(self._client, name)(*args, **kwargs) for name, args, kwargs in self._calls]
+        self._calls = []
+        return results
+
+
+class RedisSessionStore:
+    def __init__(self, url="redis://localhost:6379/0", client=None, ttl_seconds=3600, scan_ttl=600,
+                 history_limit=6, prefix="lucfin:session:"):
+        if client is None:
+            if url.startswith("memory://"):
+                client = InProcessRedis()
+            else:
+                try:
+                    import redis
+                except ImportError as e:
+                    raise ImportError("SESSION_BACKEND=redis cần cài 'redis' (pip install redis)") from e
+                client = redis.Redis.from_url(url, decode_responses=True)
+        self.client = client
+        self.url = url
+        self.ttl_seconds = ttl_seconds
+        self.scan_ttl = scan_ttl
+        self.history_limit = history_limit
+        self.prefix = prefix
+
+    def _keys(self, session_id):
+        base = self.prefix + session_id
+        return base + ":history", base + ":state"
+
+    def _touch(self, pipe, session_id):
+        for key in self._keys(session_id):
+            pipe.expire(key, int(self.ttl_seconds))
+
+    def _read(self, session_id, queue_read):
+        """Đọc + gia hạn TTL cả 2 key trong 1 round-trip (như LRU / last_access của backend khác)."""
+        pipe = self.client.pipeline(transaction=False)
+        queue_read(pipe)
+        self._touch(pipe, session_id)
+        return pipe.execute()[0]
+
+    # --- Lịch sử chat ---
+    def get_history(self, session_id):
+        history_key, _ = self._keys(session_id)
+        items = self._read(session_id, lambda pipe: pipe.lrange(history_key, 0, -1))
+        return to_messages(json.loads(item) for item in items)
+
+    def append_history(self, session_id, question, answer):
+        history_key, _ = self._keys(session_id)
+        # MULTI/EXEC: RPUSH + LTRIM + EXPIRE nguyên tử -> không worker nào thấy lịch sử chưa cắt
+        pipe = self.client.pipeline(transaction=True)
+        pipe.rpush(history_key, json.dumps([True, question], ensure_ascii=False),
+                   json.dumps([False, answer], ensure_ascii=False))
+        pipe.ltrim(history_key, -self.history_limit, -1)
+        self._touch(pipe, session_id)
+        pipe.execute()
+
+    # --- Dữ liệu Scan ---
+    def update_scan_result(self, session_id, food_names):
+        _, state_key = self._keys(session_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(state_key, mapping={
+            "scan_foods": json.dumps(list(food_names), ensure_ascii=False),
+            "scan_time": time.time(), "focus": "SCAN",
+        })
+        self._touch(pipe, session_id)
+        pipe.execute()
+
+    def get_scanned_context(self, session_id):
+        _, state_key = self._keys(session_id)
+        state = self._read(session_id, lambda pipe: pipe.hgetall(state_key))
+        if not state.get("scan_foods") or time.time() - float(state.get("scan_time", 0)) >= self.scan_ttl:
+            return None
+        return ", ".join(json.loads(state["scan_foods"]))
+
+    # --- Tiêu điểm ---
+    def set_focus(self, session_id, mode):
+        _, state_key = self._keys(session_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(state_key, mapping={"focus": mode})
+        self._touch(pipe, session_id)
+        pipe.execute()
+
+    def get_focus(self, session_id):
+        _, state_key = self._keys(session_id)
+        return self._read(session_id, lambda pipe: pipe.hgetall(state_key)).get("focus", "RAG")
+
+    # --- Dọn dẹp + số liệu ---
+    def sweep(self):
+        return 0  # Redis tự xóa key hết hạn (EXPIRE); giới hạn bộ nhớ dùng maxmemory-policy
+
+    async def run_sweeper(self, interval=60):
+        return None
+
+    def stats(self):
+        return {"backend": "redis", "url": self.url.split("@")[-1], "keys": self.client.dbsize(),
+                "ttl_seconds": self.ttl_seconds}
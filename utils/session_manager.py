@@ -1,34 +1,203 @@
+import asyncio
+import os
+import sys
 import time
+from collections import OrderedDict
 
-# Lưu trữ dữ liệu Scan: { "session_id": { "foods": [...], "timestamp": ... } }
-SCAN_SESSIONS = {}
-
-# 👇👇👇 THÊM BIẾN NÀY ĐỂ QUẢN LÝ TIÊU ĐIỂM 👇👇👇
-# "SCAN": Đang nói về món vừa chụp
-# "RAG": Đang nói về chủ đề khác (FoodDB)
-SESSION_FOCUS = {} 
-
-def update_scan_result(session_id, food_names):
-    SCAN_SESSIONS[session_id] = {
-        "foods": food_names,
-        "timestamp": time.time()
-    }
-    # Khi vừa Scan xong -> Bắt buộc Focus vào SCAN
-    SESSION_FOCUS[session_id] = "SCAN"
-
-def get_scanned_context(session_id):
-    if session_id in SCAN_SESSIONS:
-        data = SCAN_SESSIONS[session_id]
-        # Hết hạn sau 10 phút (600s)
-        if time.time() - data["timestamp"] < 600: 
-            return ", ".join(data["foods"])
-    return None
-
-# 👇👇👇 2 HÀM MỚI 👇👇👇
-def set_chat_focus(session_id, mode):
+from utils.observability import get_logger
+from utils.session_backends import RedisSessionStore, SQLiteSessionStore, to_messages
+
+logger = get_logger("sessions")
+
+# ==============================================================================
+# SESSION STORE: lịch sử chat + dữ liệu Scan + tiêu điểm (SCAN / RAG) của từng session
+# ==============================================================================
+# Giới hạn số session (LRU), hết hạn theo TTL, có task quét nền -> RAM không tăng mãi
+# theo số session_id. Thay cho CHAT_HISTORIES / SCAN_SESSIONS / 2 biến SESSION_FOCUS cũ.
+
+
+class SessionRecord:
+    # __slots__: không có __dict__ cho mỗi session -> nhỏ gọn khi có hàng chục nghìn session
+    __slots__ = ("history", "scan_foods", "scan_time", "focus", "last_access")
+
+    def __init__(self):
+        self.history = []          # [(is_user, text), ...] - tuple gọn hơn object Message
+        self.scan_foods = None     # tuple tên món vừa scan
+        self.scan_time = 0.0
+        self.focus = "RAG"         # "SCAN": đang nói về món vừa chụp / "RAG": chủ đề khác (FoodDB)
+        self.last_access = time.time()
+
+
+class SessionStore:
+    def __init__(self, max_entries=10000, ttl_seconds=3600, scan_ttl=600, history_limit=6):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.scan_ttl = scan_ttl
+        self.history_limit = history_limit
+        self._sessions = OrderedDict()  # session_id -> SessionRecord, ít dùng nhất ở đầu
+        self.evictions = self.expirations = self.scan_expirations = self.sweeps = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _get(self, session_id, create=True):
+        record = self._sessions.get(session_id)
+        now = time.time()
+        if record is not None and now - record.last_access > self.ttl_seconds:
+            del self._sessions[session_id]
+            self.expirations += 1
+            record = None
+        if record is None:
+            if not create:
+                return None
+            record = SessionRecord()
+            self._sessions[session_id] = record
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+        record.last_access = now
+        self._sessions.move_to_end(session_id)
+        return record
+
+    # --- Lịch sử chat ---
+    def get_history(self, session_id):
+        record = self._get(session_id, create=False)
+        if record is None:
+            return []
+        return to_messages(record.history)
+
+    def append_history(self, session_id, question, answer):
+        record = self._get(session_id)
+        record.history.append((True, question))
+        record.history.append((False, answer))
+        if len(record.history) > self.history_limit:
+            del record.history[:-self.history_limit]
+
+    # --- Dữ liệu Scan ---
+    def update_scan_result(self, session_id, food_names):
+        record = self._get(session_id)
+        record.scan_foods = tuple(food_names)
+        record.scan_time = time.time()
+        # Khi vừa Scan xong -> Bắt buộc Focus vào SCAN
+        record.focus = "SCAN"
+
+    def get_scanned_context(self, session_id):
+        record = self._get(session_id, create=False)
+        if record is None or not record.scan_foods:
+            return None
+        # Hết hạn sau scan_ttl (mặc định 10 phút) -> xóa luôn, không chỉ bỏ qua
+        if time.time() - record.scan_time >= self.scan_ttl:
+            record.scan_foods = None
+            self.scan_expirations += 1
+            return None
+        return ", ".join(record.scan_foods)
+
+    # --- Tiêu điểm ---
+    def set_focus(self, session_id, mode):
+        self._get(session_id).focus = mode
+
+    def get_focus(self, session_id):
+        record = self._get(session_id, create=False)
+        return record.focus if record is not None else "RAG"  # Mặc định là RAG
+
+    # --- Dọn dẹp + số liệu ---
+    def sweep(self):
+        """Xóa session hết TTL và dữ liệu Scan đã hết hạn."""
+        now = time.time()
+        expired = [sid for sid, r in self._sessions.items() if now - r.last_access > self.ttl_seconds]
+        for sid in expired:
+            del self._sessions[sid]
+        self.expirations += len(expired)
+        for record in self._sessions.values():
+            if record.scan_foods and now - record.scan_time >= self.scan_ttl:
+                record.scan_foods = None
+                self.scan_expirations += 1
+        self.sweeps += 1
+        return len(expired)
+
+    async def run_sweeper(self, interval=60):
+        while True:
+            await asyncio.sleep(interval)
+            removed = self.sweep()
+            if removed:
+                logger.info("session sweeper", extra={"removed": removed, "sessions": len(self)})
+
+    def approx_memory_bytes(self):
+        total = sys.getsizeof(self._sessions)
+        for sid, record in self._sessions.items():
+            total += sys.getsizeof(sid) + sys.getsizeof(record) + sys.getsizeof(record.history)
+            total += sum(sys.getsizeof(item) + sys.getsizeof(item[1]) for item in record.history)
+            if record.scan_foods:
+                total += sys.getsizeof(record.scan_foods) + sum(sys.getsizeof(f) for f in record.scan_foods)
+        return total
+
+    def stats(self):
+        return {
+            "backend": "memory", "sessions": len(self._sessions), "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds, "evictions": self.evictions,
+            "expirations": self.expirations, "scan_expirations": self.scan_expirations,
+            "sweeps": self.sweeps, "approx_memory_bytes": self.approx_memory_bytes(),
+        }
+
+
+def create_session_store():
+    """
+    Chọn backend theo SESSION_BACKEND:
+      memory : trong tiến trình (mặc định, chỉ đúng khi chạy 1 worker)
+      sqlite : file SESSION_SQLITE_PATH dùng chung cho mọi worker trên cùng máy
+      redis  : REDIS_URL dùng chung giữa nhiều máy (REDIS_URL=memory:// -> bản giả lập trong tiến trình)
+    """
+    backend = os.getenv("SESSION_BACKEND", "memory").lower()
+    ttl_seconds = float(os.getenv("SESSION_TTL", "3600"))
+    scan_ttl = float(os.getenv("SCAN_TTL", "600"))
+    history_limit = int(os.getenv("SESSION_HISTORY_LIMIT", "6"))
+    max_entries = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+    if backend == "memory":
+        return SessionStore(max_entries=max_entries, ttl_seconds=ttl_seconds, scan_ttl=scan_ttl,
+                            history_limit=history_limit)
+    if backend == "sqlite":
+        return SQLiteSessionStore(os.getenv("SESSION_SQLITE_PATH", "./cache/sessions.sqlite3"),
+                                  max_entries=max_entries, ttl_seconds=ttl_seconds, scan_ttl=scan_ttl,
+                                  history_limit=history_limit)
+    if backend == "redis":
+        return RedisSessionStore(os.getenv("REDIS_URL", "redis://localhost:6379/0"), ttl_seconds=ttl_seconds,
+                                 scan_ttl=scan_ttl, history_limit=history_limit)
+    raise ValueError(f"❌ SESSION_BACKEND không hợp lệ: '{backend}' (memory / sqlite / redis)")
+
+
+SESSION_STORE = create_session_store()
+
+# ==============================================================================
+# API BẤT ĐỒNG BỘ CHO HANDLER
+# ==============================================================================
+# SQLite (chờ khóa ghi tới 10s khi nhiều worker tranh nhau) / Redis (client đồng bộ, round-trip mạng)
+# chạy trong thread -> 1 lần chờ khóa không làm đứng mọi request của worker. Bộ nhớ trong chỉ là
+# thao tác dict (µs) -> gọi thẳng, không tốn chi phí chuyển thread.
+
+async def _call(method, *args):
+    if isinstance(SESSION_STORE, SessionStore):
+        return method(*args)
+    return await asyncio.to_thread(method, *args)
+
+async def update_scan_result(session_id, food_names):
+    await _call(SESSION_STORE.update_scan_result, session_id, food_names)
+
+async def get_scanned_context(session_id):
+    return await _call(SESSION_STORE.get_scanned_context, session_id)
+
+async def set_chat_focus(session_id, mode):
     """Set chế độ: 'SCAN' hoặc 'RAG'"""
-    SESSION_FOCUS[session_id] = mode
+    await _call(SESSION_STORE.set_focus, session_id, mode)
 
-def get_chat_focus(session_id):
+async def get_chat_focus(session_id):
     """Lấy chế độ hiện tại"""
-    return SESSION_FOCUS.get(session_id, "RAG") # Mặc định là RAG
\ No newline at end of file
+    return await _call(SESSION_STORE.get_focus, session_id)
+
+async def get_chat_history(session_id):
+    return await _call(SESSION_STORE.get_history, session_id)
+
+async def append_chat_history(session_id, question, answer):
+    await _call(SESSION_STORE.append_history, session_id, question, answer)
+
+async def get_session_stats():
+    return await _call(SESSION_STORE.stats)
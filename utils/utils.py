@@ -1,7 +1,69 @@
 import re
+import unicodedata
 
 def remove_think_tags(text):
-    """Remove <think>...</think> tags from LLM responses."""
-    if "<think>" in text and "</think>" in text:
-        text = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL)
-    return text
+    """
+    Remove <think>...</think> tags from LLM responses.
+    <think> không đóng (model bị cắt giữa lúc suy luận) -> bỏ tới hết, giống ThinkTagFilter khi stream.
+    """
+    if "<think>" not in text:
+        return text
+    text = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL)
+    return text.split("<think>", 1)[0].lstrip()
+
+class ThinkTagFilter:
+    """
+    Lọc <think>...</think> theo từng chunk khi stream (thẻ có thể bị cắt giữa 2 chunk).
+    feed(chunk) trả phần text hiển thị được ngay; flush() trả phần còn giữ lại ở cuối stream.
+    """
+    OPEN, CLOSE = "<think>", "</think>"
+
+    def __init__(self):
+        self._buffer = ""
+        self._inside = False
+        self._started = False  # Bỏ khoảng trắng/xuống dòng đầu câu trả lời (sau </think>)
+
+    def _emit(self, text):
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        out = []
+        while True:
+            if self._inside:
+                idx = self._buffer.find(self.CLOSE)
+                if idx < 0:
+                    # Chỉ giữ phần đuôi có thể là đầu của "</think>"
+                    self._buffer = self._buffer[-(len(self.CLOSE) - 1):]
+                    break
+                self._buffer = self._buffer[idx + len(self.CLOSE):]
+                self._inside = False
+            else:
+                idx = self._buffer.find(self.OPEN)
+                if idx >= 0:
+                    out.append(self._buffer[:idx])
+                    self._buffer = self._buffer[idx + len(self.OPEN):]
+                    self._inside = True
+                    continue
+                keep = 0
+                for k in range(min(len(self.OPEN) - 1, len(self._buffer)), 0, -1):
+                    if self.OPEN.startswith(self._buffer[-k:]):
+                        keep = k
+                        break
+                out.append(self._buffer[:len(self._buffer) - keep])
+                self._buffer = self._buffer[len(self._buffer) - keep:]
+                break
+        return self._emit("".join(out))
+
+    def flush(self):
+        rest, self._buffer = ("" if self._inside else self._buffer), ""
+        return self._emit(rest)
+
+def fold_accents(text):
+    """Chuẩn hóa tiếng Việt để so khớp: chữ thường, bỏ dấu, 'đ' -> 'd', gộp khoảng trắng."""
+    text = unicodedata.normalize("NFD", str(text).lower().replace("đ", "d"))
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return " ".join(text.split())